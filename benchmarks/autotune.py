@@ -0,0 +1,84 @@
+"""
+    Runs the connection tuner against a simulated link and prints the level it settles on.
+
+    Usage:
+        python benchmarks/autotune.py [--knee 6] [--latency 0.05] [--seconds 40] [--error-above 12]
+
+    Every simulated download takes the round-trip latency plus its size divided by its share of the link. Up to the
+    knee each extra connection adds throughput; past it connections only share the same bandwidth, and past
+    --error-above the server starts failing requests. The tuner should end up at or just above the knee.
+    """
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bridge_downloader.tuning import ConcurrencyLimit, ConcurrencyTuner  # noqa: E402
+
+IMAGE_BYTES = 500 * 1024
+
+
+def simulate(limit, tuner, args, stopped):
+    per_connection = args.bandwidth / args.knee
+
+    def worker():
+        while not stopped.is_set():
+            limit.acquire()
+            try:
+                active = limit.in_use
+                rate = min(per_connection, args.bandwidth / active)
+                time.sleep(args.latency + IMAGE_BYTES / rate * random.uniform(0.8, 1.2))
+                failed = args.error_above and active > args.error_above and random.random() < 0.3
+                if not failed:
+                    tuner.record_bytes(IMAGE_BYTES)
+                tuner.record_result(not failed)
+            finally:
+                limit.release()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.max)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1].strip())
+    parser.add_argument('--knee', type=int, default=6, help='connections that saturate the link (default: 6)')
+    parser.add_argument('--bandwidth', type=float, default=20e6, help='link bandwidth in bytes per second')
+    parser.add_argument('--latency', type=float, default=0.05, help='round-trip time per download in seconds')
+    parser.add_argument('--error-above', type=int, default=0, help='connections above which requests fail')
+    parser.add_argument('--start', type=int, default=2, help='initial number of connections (default: 2)')
+    parser.add_argument('--max', type=int, default=16, help='most connections the tuner may use (default: 16)')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between tuning steps (default: 1)')
+    parser.add_argument('--seconds', type=float, default=40, help='length of the simulation (default: 40)')
+    args = parser.parse_args()
+
+    limit = ConcurrencyLimit(args.start)
+    tuner = ConcurrencyTuner(limit, 1, args.max, args.interval)
+    levels = []
+    original_adjust = tuner.adjust
+
+    def adjust(rate, error_rate, saturated):
+        level = original_adjust(rate, error_rate, saturated)
+        levels.append(level)
+        print(f"{len(levels) * args.interval:6.1f} s  {rate / 1e6:6.2f} MB/s  errors {error_rate:4.0%}  -> {level}")
+        return level
+
+    tuner.adjust = adjust
+    stopped = threading.Event()
+    simulate(limit, tuner, args, stopped)
+    tuner.start()
+    time.sleep(args.seconds)
+    stopped.set()
+    tuner.stop()
+    settled = levels[len(levels) // 2:]
+    print(f"knee: {args.knee}, levels in the second half: {min(settled)}-{max(settled)}, "
+          f"mean {sum(settled) / len(settled):.1f}")
+
+
+if __name__ == '__main__':
+    main()
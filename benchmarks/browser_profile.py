@@ -0,0 +1,83 @@
+"""
+    Compares the render time of structurae pages in the original Chrome setup and in the light browser profile.
+
+    Usage:
+        python benchmarks/browser_profile.py --driver chromedriver.exe [--runs 3] [--urls urls.txt]
+
+    The baseline is the setup the structurae script used before: headed Chrome, default ("normal") page-load strategy,
+    every resource loaded and set_window_size before each navigation. The light profile is headless with the eager
+    strategy, resource blocking, a disk cache and tab reuse. The first run of each profile warms its cache.
+    """
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bridge_downloader.browser import create_driver, navigate  # noqa: E402
+
+DEFAULT_URLS = [
+    'https://structurae.net/de/bauwerke/bruecken/balkenbruecken/liste',
+    'https://structurae.net/de/bauwerke/t-groentje',
+    'https://structurae.net/de/bauwerke/t-groentje/medien',
+    'https://structurae.net/de/bauwerke/erzebachtalbruecke',
+    'https://structurae.net/de/bauwerke/erzebachtalbruecke/medien',
+]
+
+
+def time_pages(driver, urls, runs, resize=None):
+    timings = []
+    for _ in range(runs):
+        for url in urls:
+            start = time.perf_counter()
+            if resize:
+                driver.set_window_size(*resize)
+            navigate(driver, url)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def describe(name, timings):
+    timings = sorted(timings)
+    p90 = timings[min(len(timings) - 1, int(len(timings) * 0.9))]
+    print(f"{name:<10} pages: {len(timings):>3}  mean: {statistics.mean(timings):6.2f} s  "
+          f"median: {statistics.median(timings):6.2f} s  p90: {p90:6.2f} s")
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1].strip())
+    parser.add_argument('--driver', default='chromedriver.exe', help='chromedriver executable')
+    parser.add_argument('--urls', help='file with one URL per line (default: a few structurae pages)')
+    parser.add_argument('--runs', type=int, default=3, help='passes over the URL list per profile (default: 3)')
+    parser.add_argument('--width', type=int, default=1200)
+    parser.add_argument('--height', type=int, default=800)
+    args = parser.parse_args()
+
+    urls = DEFAULT_URLS
+    if args.urls:
+        with open(args.urls, encoding='utf-8') as f:
+            urls = [line.strip() for line in f if line.strip()]
+    window_size = (args.width, args.height)
+
+    driver = create_driver(args.driver, window_size, light=False)
+    try:
+        baseline = describe('baseline', time_pages(driver, urls, args.runs, resize=window_size))
+    finally:
+        driver.quit()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        driver = create_driver(args.driver, window_size, light=True, cache_dir=cache_dir)
+        try:
+            light = describe('light', time_pages(driver, urls, args.runs))
+        finally:
+            driver.quit()
+
+    print(f"median speed-up: {baseline / light:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
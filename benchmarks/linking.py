@@ -0,0 +1,75 @@
+"""
+    Times the bridge linker on synthetic sources of growing size and prints the pairs it compares.
+
+    Usage:
+        python benchmarks/linking.py [--sizes 1000 4000 16000] [--overlap 0.5]
+
+    Each run draws random two-word bridge names, places and years for the first source and copies a share of them into
+    the second, with one letter changed or one word dropped. The compared pairs and the time should grow about
+    linearly with the size, far below the size squared, while the linked share stays close to --overlap.
+    """
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bridge_downloader.linking import link, to_bridge  # noqa: E402
+
+COUNTRIES = ['Germany', 'France', 'Switzerland', 'Austria', 'Italy', 'Hungary']
+KINDS = ['Bridge', 'Viaduct', 'Pont', 'Brücke']
+
+
+def word(rng):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9))).capitalize()
+
+
+def variant(rng, name):
+    """
+        Spells a two-word name the way the other source might: one letter off, or one word dropped.
+        """
+    if rng.random() < 0.5:
+        position = rng.randrange(len(name))
+        return name[:position] + rng.choice(string.ascii_lowercase) + name[position + 1:]
+    return rng.choice(name.split())
+
+
+def sources(size, overlap, rng):
+    places = [word(rng) for _ in range(size // 20 + 1)]
+    left, right = [], []
+    for number in range(size):
+        name, place, year = f"{word(rng)} {word(rng)}", rng.choice(places), rng.randint(1800, 2020)
+        country = rng.choice(COUNTRIES)
+        left.append({'Bridge Name': f"{name} {rng.choice(KINDS)}", 'Unique Name': f"b{number}",
+                     'Location': f"{place}, {country}", 'Completion': str(year)})
+        if rng.random() < overlap:
+            right.append({'Bridge Name': f"{variant(rng, name)} {rng.choice(KINDS)}",
+                          'Location': f"{place}, {country}", 'Built': str(year + rng.choice((0, 0, 1)))})
+        else:
+            right.append({'Bridge Name': f"{word(rng)} {word(rng)} {rng.choice(KINDS)}",
+                          'Location': f"{rng.choice(places)}, {rng.choice(COUNTRIES)}",
+                          'Built': str(rng.randint(1800, 2020))})
+    return ([to_bridge('structurae', row) for row in left], [to_bridge('historicbridges', row) for row in right])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1].strip())
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 4000, 16000], help='bridges per source')
+    parser.add_argument('--overlap', type=float, default=0.5, help='share of bridges in both sources (default: 0.5)')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for size in args.sizes:
+        left, right = sources(size, args.overlap, rng)
+        start = time.perf_counter()
+        links, compared = link(left, right)
+        seconds = time.perf_counter() - start
+        print(f"{size:>7} bridges per source: {compared:>9} pairs compared ({compared / size ** 2:.4%} of all), "
+              f"{len(links) / size:.0%} linked in {seconds:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+    Times name lookups in the local name index on synthetic indexes of growing size.
+
+    Usage:
+        python benchmarks/names.py [--sizes 10000 100000] [--lookups 1000]
+
+    Each index holds random slugs of one to three words plus a bridge kind, as the sitemap sync stores them. The
+    looked-up names are indexed names written differently: capitalised with umlauts, spaces instead of hyphens, or
+    with one letter changed. The time per lookup should stay far below a page load at any size, and nearly all names
+    should resolve to the slug they were drawn from.
+    """
+import argparse
+import logging
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bridge_downloader.names import NameMatcher, slug_name  # noqa: E402
+
+KINDS = ['bruecke', 'viadukt', 'pont', 'bridge', 'steg']
+
+
+def word(rng):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+
+
+def variant(rng, slug):
+    """
+        Writes a slug the way a user might: with capitals and umlauts, with spaces, or one letter off.
+        """
+    choice = rng.random()
+    if choice < 0.3:
+        return slug.replace('ue', 'ü').replace('-', ' ').title()
+    if choice < 0.6:
+        return slug.replace('-', ' ')
+    position = rng.randrange(len(slug))
+    while slug[position] == '-':
+        position = rng.randrange(len(slug))
+    return slug[:position] + rng.choice(string.ascii_lowercase) + slug[position + 1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1].strip())
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000], help='names in the index')
+    parser.add_argument('--lookups', type=int, default=1000, help='names looked up per size (default: 1000)')
+    args = parser.parse_args()
+
+    # Ambiguous names are expected here and only counted.
+    logging.disable(logging.WARNING)
+    rng = random.Random(0)
+    for size in args.sizes:
+        slugs = list({'-'.join([word(rng) for _ in range(rng.randint(1, 3))] + [rng.choice(KINDS)])
+                      for _ in range(size)})
+        start = time.perf_counter()
+        matcher = NameMatcher((slug, slug_name(slug)) for slug in slugs)
+        built = time.perf_counter() - start
+
+        wanted = rng.sample(slugs, min(args.lookups, len(slugs)))
+        names = [variant(rng, slug) for slug in wanted]
+        start = time.perf_counter()
+        matches = [matcher.lookup(name) for name in names]
+        seconds = time.perf_counter() - start
+        correct = sum(1 for slug, match in zip(wanted, matches) if match and match[0] == slug)
+        wrong = sum(1 for slug, match in zip(wanted, matches) if match and match[0] != slug)
+        print(f"{len(slugs):>8} names indexed in {built:.2f} s: {seconds / len(names) * 1000:.3f} ms per lookup, "
+              f"{correct / len(names):.1%} resolved correctly, {wrong} wrongly")
+
+
+if __name__ == '__main__':
+    main()
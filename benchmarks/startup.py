@@ -0,0 +1,76 @@
+"""
+    Measures how long the downloader scripts take to start and checks that heavy dependencies stay unloaded.
+
+    Usage:
+        python benchmarks/startup.py [--runs 10] [--budget 0.5]
+
+    Every command is started with --help, which parses the arguments after all module-level imports, so the time is
+    the import and interpreter start-up cost paid by every run. The script exits with status 1 if a median exceeds the
+    budget or if selenium, bs4, aiofiles or httpx are imported at start-up.
+    """
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    'structurae': ['downloader-structurae.py', '--help'],
+    'historicbridges': ['downloader-historicbridges.py', '--help'],
+    'bing': ['downloader-bing.py', '--help'],
+    'engine': ['-m', 'bridge_downloader', '--help'],
+}
+
+# Imported only by the code paths that need them.
+LAZY_MODULES = ['selenium', 'bs4', 'aiofiles', 'httpx']
+
+
+def time_command(command, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *command], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def eager_imports(command):
+    """
+        Returns the lazy modules a command imports at start-up, read from the output of -X importtime.
+        """
+    result = subprocess.run([sys.executable, '-X', 'importtime', *command], cwd=ROOT, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True, check=True)
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        module = line.rsplit('|', 1)[1].strip().split('.')[0]
+        if module in LAZY_MODULES:
+            imported.add(module)
+    return sorted(imported)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1].strip())
+    parser.add_argument('--runs', type=int, default=10, help='starts per command (default: 10)')
+    parser.add_argument('--budget', type=float, default=0.5,
+                        help='largest median start-up time in seconds (default: 0.5)')
+    args = parser.parse_args()
+
+    failed = False
+    for name, command in COMMANDS.items():
+        median = statistics.median(time_command(command, args.runs))
+        eager = eager_imports(command)
+        over = median > args.budget
+        failed = failed or over or bool(eager)
+        print(f"{name:<16} median: {median * 1000:6.0f} ms{'  OVER BUDGET' if over else ''}"
+              f"{'  imports ' + ', '.join(eager) if eager else ''}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+"""
+    Shared engine of the bridge image downloaders.
+
+    client      HTTP fetches and image downloads
+    scheduler   process-wide concurrency and bandwidth budget
+    storage     folder and file naming
+    metadata    summary and template CSV writers
+    units       numeric extraction of technical data
+    sites       per-site adapters (listing, detail and media extraction)
+    crawl       engine driving the adapters; run it with `python -m bridge_downloader`
+    """
@@ -0,0 +1,55 @@
+"""
+    Crawls several sites in one process under a single concurrency and bandwidth budget.
+
+    Usage:
+        python -m bridge_downloader [options] SITE=TARGET[:COUNT] [SITE=TARGET[:COUNT] ...]
+
+    Examples:
+        python -m bridge_downloader structurae=balkenbruecken:20 historicbridges=FRANCE:10
+        python -m bridge_downloader --max-connections 16 "bing=arch bridge:200"
+        python -m bridge_downloader --refresh structurae=balkenbruecken
+        python -m bridge_downloader structurae=sitemap/bogenbruecke/frankreich:200
+        python -m bridge_downloader structurae=names/bridges.txt
+    """
+import argparse
+
+from .cli import add_engine_arguments, load_adapter, parse_job, setup_engine
+from .client import close_sessions
+from .crawl import crawl
+from .fingerprints import FingerprintStore
+from .profiling import profile
+from .progress import show_progress
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m bridge_downloader', description=__doc__.splitlines()[1].strip())
+    parser.add_argument('jobs', nargs='+', type=parse_job, metavar='SITE=TARGET[:COUNT]')
+    add_engine_arguments(parser)
+    parser.add_argument('--refresh', action='store_true',
+                        help='re-check bridges that were already downloaded and update only what changed')
+    parser.add_argument('--state-db', default='crawl_state.sqlite',
+                        help='crawl-state database holding the refresh fingerprints (default: %(default)s)')
+    args = parser.parse_args()
+
+    scheduler = setup_engine(args, 'bridge_downloader_engine.log')
+    adapters = {}
+    jobs = [(load_adapter(args, site, adapters), target, limit) for site, target, limit in args.jobs]
+
+    fingerprints = FingerprintStore(args.state_db) if args.refresh else None
+
+    try:
+        with profile(args.profile, args.profile_interval / 1000), \
+                show_progress(not args.no_dashboard, args.status_file, args.status_port):
+            totals = crawl(jobs, scheduler, fingerprints)
+    finally:
+        scheduler.shutdown()
+        close_sessions()
+        if fingerprints is not None:
+            fingerprints.close()
+
+    for site, downloaded in totals.items():
+        print(f"{site}: {downloaded} files downloaded")
+
+
+if __name__ == '__main__':
+    main()
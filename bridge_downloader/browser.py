@@ -0,0 +1,113 @@
+import logging
+import os
+
+from .profiling import stage
+from .warc import record_page
+
+# Resources the parsers never look at. Chrome's URL blocking matches these wildcard patterns against the full URL.
+BLOCKED_RESOURCE_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico', '*.bmp',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.mp4', '*.webm', '*.ogg', '*.mp3', '*.m4a', '*.wav',
+]
+# Third-party analytics, advertising and embed hosts loaded by the structurae pages.
+BLOCKED_HOST_PATTERNS = [
+    '*google-analytics.com*', '*googletagmanager.com*', '*googlesyndication.com*', '*doubleclick.net*',
+    '*googleadservices.com*', '*adservice.google.*', '*facebook.net*', '*facebook.com/tr*', '*hotjar.com*',
+    '*cookiebot.com*', '*consensu.org*', '*youtube.com/embed*', '*maps.googleapis.com*', '*gstatic.com*',
+]
+
+
+def create_driver(chrome_driver_path, window_size=(1200, 800), light=True, headless=True, cache_dir=None,
+                  blocked_patterns=None):
+    """
+        Starts Chrome for the pages that still need a browser.
+        The light profile runs headless with the eager page-load strategy (driver.get returns at DOMContentLoaded
+        instead of waiting for every subresource), blocks images, fonts, media and third-party hosts through the
+        DevTools protocol and keeps a persistent disk cache, so stylesheets and scripts are fetched once per session.
+        Args:
+            chrome_driver_path: Path of the chromedriver executable.
+            window_size: Tuple (width, height); set once here instead of before every navigation.
+            light: Use the light profile; False starts the plain headed Chrome of the original script.
+            headless: Run without a window (light profile only). Needs to be False to log in manually.
+            cache_dir: Folder of the persistent profile and disk cache; None uses a throw-away profile.
+            blocked_patterns: URL patterns to block instead of the default resource and host lists.
+        Returns:
+            selenium.webdriver.Chrome instance.
+        """
+    # Selenium is only needed by the structurae browser mode, so it is imported on first use.
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    options = webdriver.ChromeOptions()
+    options.add_experimental_option('excludeSwitches', ['enable-logging'])
+    options.add_argument(f'--window-size={window_size[0]},{window_size[1]}')
+
+    if light:
+        options.page_load_strategy = 'eager'
+        if headless:
+            options.add_argument('--headless=new')
+        options.add_argument('--mute-audio')
+        options.add_argument('--no-first-run')
+        options.add_argument('--disable-extensions')
+        options.add_argument('--disable-background-networking')
+        options.add_argument('--disable-renderer-backgrounding')
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_experimental_option('prefs', {
+            'profile.managed_default_content_settings.images': 2,
+            'profile.default_content_setting_values.notifications': 2,
+        })
+        if cache_dir:
+            cache_dir = os.path.abspath(cache_dir)
+            os.makedirs(cache_dir, exist_ok=True)
+            options.add_argument(f'--user-data-dir={os.path.join(cache_dir, "profile")}')
+            options.add_argument(f'--disk-cache-dir={os.path.join(cache_dir, "cache")}')
+            options.add_argument(f'--disk-cache-size={512 * 1024 * 1024}')
+
+    driver = webdriver.Chrome(service=Service(executable_path=chrome_driver_path), options=options)
+
+    if light:
+        patterns = BLOCKED_RESOURCE_PATTERNS + BLOCKED_HOST_PATTERNS if blocked_patterns is None else blocked_patterns
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+            driver.execute_cdp_cmd('Network.setCacheDisabled', {'cacheDisabled': False})
+        except Exception as e:
+            logging.warning(f"Resource blocking is not available in this browser: {e}")
+
+    return driver
+
+
+def reuse_tab(driver):
+    """
+        Keeps the crawl in the first tab, closing tabs and pop-ups a page may have opened, so every navigation reuses
+        the same renderer instead of starting a new one.
+        Args:
+            driver: Selenium WebDriver instance.
+        """
+    handles = driver.window_handles
+    if len(handles) > 1:
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+
+
+def navigate(driver, url):
+    """
+        Loads a URL in the reused tab.
+        Args:
+            driver: Selenium WebDriver instance.
+            url: URL to navigate to.
+        Returns:
+            BeautifulSoup object of the page source after loading.
+        """
+    from bs4 import BeautifulSoup
+
+    with stage('browser'):
+        reuse_tab(driver)
+        driver.get(url)
+        page_source = driver.page_source
+    record_page(url, page_source)
+    with stage('parse'):
+        return BeautifulSoup(page_source, 'html.parser')
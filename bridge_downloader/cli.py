@@ -0,0 +1,121 @@
+import argparse
+
+from .client import configure_client
+from .config import load_config
+from .deadletter import configure_dead_letters
+from .logs import setup_logging
+from .scheduler import configure_scheduler
+from .sites import SITES, create_adapter
+
+
+def parse_job(spec):
+    """
+        Parses a job given on the command line.
+        Args:
+            spec: 'SITE=TARGET[:COUNT]'. For Bing the whole 'QUERY[:COUNT[:START_PAGE]]' is the target.
+        Returns:
+            Tuple (site, target, limit).
+        """
+    site, separator, target = spec.partition('=')
+    if not separator or site not in SITES:
+        raise argparse.ArgumentTypeError(f"Expected SITE=TARGET[:COUNT] with SITE in {', '.join(SITES)}: {spec}")
+    if site == 'bing':
+        return site, target, None
+
+    head, _, count = target.rpartition(':')
+    if head and count.isdigit():
+        return site, head, int(count)
+    return site, target, None
+
+
+def add_engine_arguments(parser):
+    """
+        Adds the options shared by every engine command: connection and bandwidth budget, client settings, image
+        pre-screening and the configuration file of each site.
+        Args:
+            parser: argparse.ArgumentParser to extend.
+        """
+    parser.add_argument('--max-connections', type=int, default=8,
+                        help='simultaneous transfers across all sites (default: 8)')
+    parser.add_argument('--max-bandwidth', type=int, default=None,
+                        help='bandwidth budget in bytes per second (default: unlimited)')
+    parser.add_argument('--max-requests-per-second', type=float, default=None,
+                        help='request rate across all sites (default: unlimited)')
+    parser.add_argument('--autotune-max', type=int, default=0,
+                        help='tune the number of connections at runtime, starting at --max-connections, up to this '
+                             'many (default: off)')
+    parser.add_argument('--autotune-min', type=int, default=1,
+                        help='fewest connections the tuner may choose (default: 1)')
+    parser.add_argument('--workers', type=int, default=4, help='bridges processed in parallel (default: 4)')
+    parser.add_argument('--timeout', type=float, default=60, help='request timeout in seconds (default: 60)')
+    parser.add_argument('--stall-timeout', type=float, default=None,
+                        help='abandon downloads that receive no data for this many seconds (default: --timeout)')
+    parser.add_argument('--min-throughput', type=int, default=16 * 1024,
+                        help='abandon downloads slower than this many bytes per second (default: 16384, 0 disables)')
+    parser.add_argument('--item-budget', type=float, default=None,
+                        help='seconds the media downloads of one bridge may take in total (default: unlimited)')
+    parser.add_argument('--pool-size', type=int, default=10, help='keep-alive connections per host (default: 10)')
+    parser.add_argument('--http2', action='store_true', help='use HTTP/2 where available (requires httpx[http2])')
+    parser.add_argument('--min-width', type=int, default=0, help='skip images narrower than this (default: no limit)')
+    parser.add_argument('--min-height', type=int, default=0, help='skip images lower than this (default: no limit)')
+    parser.add_argument('--max-image-bytes', type=int, default=0,
+                        help='skip images larger than this many bytes (default: no limit)')
+    parser.add_argument('--no-dashboard', action='store_true', help='do not draw the live progress view')
+    parser.add_argument('--status-file', help='JSON file the progress status is written to every second')
+    parser.add_argument('--status-port', type=int, default=0,
+                        help='serve the progress status on http://127.0.0.1:PORT/status (default: off)')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='profile the pipeline stages and write flame graphs and a hotspot report to DIR')
+    parser.add_argument('--profile-interval', type=float, default=5,
+                        help='milliseconds between profiler samples (default: 5)')
+    parser.add_argument('--record', metavar='DIR', default='',
+                        help='record all traffic to rolling, compressed WARC files in DIR')
+    parser.add_argument('--record-max-bytes', type=int, default=1024 ** 3,
+                        help='size at which the next WARC file is started (default: 1 GiB)')
+    parser.add_argument('--replay', metavar='DIR', default='',
+                        help='serve every request from the WARC files in DIR instead of the network')
+    parser.add_argument('--log-max-bytes', type=int, default=10000000,
+                        help='size at which the JSON log file is rotated (default: 10 MB)')
+    parser.add_argument('--dead-letters', metavar='DB', default='crawl_state.sqlite',
+                        help='crawl-state database failed bridges, media pages and images are recorded in, for '
+                             'python -m bridge_downloader.deadletter (default: %(default)s, empty disables)')
+    for site, (_, config_path) in SITES.items():
+        parser.add_argument(f'--{site}-config', default=config_path, help=f'{site} configuration file')
+
+
+def setup_engine(args, log_file):
+    """
+        Configures logging, the pooled client, the dead-letter store and the process-wide scheduler from parsed engine
+        options.
+        Args:
+            args: Namespace returned by a parser set up with add_engine_arguments().
+            log_file: Path of the log file.
+        Returns:
+            The configured Scheduler.
+        """
+    setup_logging(log_file, max_bytes=args.log_max_bytes)
+    configure_client(timeout=args.timeout, pool_size=args.pool_size, http2=args.http2, min_image_width=args.min_width,
+                     min_image_height=args.min_height, max_image_bytes=args.max_image_bytes,
+                     stall_timeout=args.stall_timeout, min_throughput=args.min_throughput, record_dir=args.record,
+                     record_max_bytes=args.record_max_bytes, replay_dir=args.replay)
+    configure_dead_letters(args.dead_letters)
+
+    return configure_scheduler(max_connections=args.max_connections, max_bytes_per_second=args.max_bandwidth,
+                               max_requests_per_second=args.max_requests_per_second, item_workers=args.workers,
+                               item_time_budget=args.item_budget, autotune_max=args.autotune_max or None,
+                               autotune_min=args.autotune_min)
+
+
+def load_adapter(args, site, adapters):
+    """
+        Returns the adapter of a site, creating it from its configuration file on first use.
+        Args:
+            args: Parsed engine options.
+            site: Site name.
+            adapters: Dictionary of the adapters created so far; updated in place.
+        Returns:
+            SiteAdapter instance.
+        """
+    if site not in adapters:
+        adapters[site] = create_adapter(site, load_config(getattr(args, f'{site}_config')))
+    return adapters[site]
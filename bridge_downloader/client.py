@@ -0,0 +1,554 @@
+import importlib.util
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+from .deadletter import DOWNLOAD, record_failure, record_success
+from .deadlines import Deadline, DeadlineExceeded, ThroughputMeter, Watchdog, transfer_seconds
+from .imageinfo import parse_image_size
+from .profiling import stage, staged
+from .progress import get_progress
+from .scheduler import get_scheduler
+from .warc import ArchiveMiss, Capture, get_archive, get_recorder, http_reason, start_recording, start_replay
+
+# httpx is only imported once HTTP/2 is switched on, so HTTP/1.1 runs do not pay for loading it.
+httpx = None
+HTTPX_AVAILABLE = importlib.util.find_spec('httpx') is not None
+
+# urllib3 decodes brotli transparently when one of the brotli packages is installed.
+if importlib.util.find_spec('brotli') or importlib.util.find_spec('brotlicffi'):
+    HTML_ACCEPT_ENCODING = 'gzip, deflate, br'
+else:
+    HTML_ACCEPT_ENCODING = 'gzip, deflate'
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0'
+CHUNK_SIZE = 64 * 1024
+CONTENT_RANGE_PATTERN = re.compile(r'bytes\s+\d+-\d+/(\d+)')
+
+# Exceptions raised by fetch() for network and HTTP status errors, whichever transport is in use; httpx errors are
+# re-raised as their requests counterparts.
+NETWORK_ERRORS = (requests.exceptions.RequestException,)
+
+_settings = {
+    'timeout': None,
+    'pool_size': 10,
+    'http2': False,
+    'verify_ssl': False,
+    'min_image_width': 0,
+    'min_image_height': 0,
+    'max_image_bytes': 0,
+    'probe_bytes': 32 * 1024,
+    'stall_timeout': None,
+    'min_throughput': 16 * 1024,
+    'deadline_slack': 10.0,
+    'assumed_image_bytes': 8 * 1024 * 1024,
+}
+_sessions = {}
+_sessions_lock = threading.Lock()
+_throughput = ThroughputMeter()
+_watchdog = Watchdog()
+
+
+def configure_client(timeout=None, pool_size=None, http2=None, verify_ssl=None, min_image_width=None,
+                     min_image_height=None, max_image_bytes=None, probe_bytes=None, stall_timeout=None,
+                     min_throughput=None, deadline_slack=None, record_dir=None, record_max_bytes=None,
+                     replay_dir=None):
+    """
+        Configures the pooled HTTP client. Already open pools are closed and re-created on next use.
+        Args:
+            timeout: Default timeout in seconds for requests that do not pass their own.
+            pool_size: Keep-alive connections kept per host.
+            http2: Use HTTP/2 where the server supports it (requires the optional httpx[http2] package).
+            verify_ssl: Verify SSL certificates. Disabled by default, like the original scripts.
+            min_image_width: Images narrower than this are skipped before download (0 disables the check).
+            min_image_height: Images lower than this are skipped before download (0 disables the check).
+            max_image_bytes: Images larger than this are skipped before download (0 disables the check).
+            probe_bytes: Number of leading bytes read to find the image dimensions.
+            stall_timeout: Seconds a download may go without receiving data; defaults to the request timeout.
+            min_throughput: Slowest transfer rate in bytes per second a download may run at before it is abandoned
+                (0 disables the download deadline).
+            deadline_slack: Seconds added to every download deadline for latency.
+            record_dir: Folder to record all traffic to as WARC files; empty to stop recording.
+            record_max_bytes: Size at which the next WARC file is started.
+            replay_dir: Folder of WARC files to serve every request from instead of the network; empty to go back
+                to the network.
+        """
+    for key, value in (('min_image_width', min_image_width), ('min_image_height', min_image_height),
+                       ('max_image_bytes', max_image_bytes), ('probe_bytes', probe_bytes),
+                       ('stall_timeout', stall_timeout), ('min_throughput', min_throughput),
+                       ('deadline_slack', deadline_slack)):
+        if value is not None:
+            _settings[key] = value
+    if timeout is not None:
+        _settings['timeout'] = timeout
+    if pool_size is not None:
+        _settings['pool_size'] = pool_size
+    if http2 is not None:
+        if http2 and not HTTPX_AVAILABLE:
+            logging.warning("HTTP/2 requested but httpx is not installed, falling back to HTTP/1.1")
+            http2 = False
+        _settings['http2'] = http2
+    if verify_ssl is not None:
+        _settings['verify_ssl'] = verify_ssl
+    if not _settings['verify_ssl']:
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    if record_dir is not None:
+        start_recording(record_dir, record_max_bytes or 1024 ** 3)
+    if replay_dir is not None:
+        start_replay(replay_dir)
+    close_sessions()
+
+
+def close_sessions():
+    """
+        Closes every pooled connection.
+        """
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+def create_session():
+    """
+        Creates a keep-alive session with the configured pool size.
+        Returns:
+            httpx.Client when HTTP/2 is enabled, requests.Session otherwise.
+        """
+    global httpx
+
+    pool_size = _settings['pool_size']
+    if _settings['http2']:
+        if httpx is None:
+            import httpx
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        return httpx.Client(http2=True, verify=_settings['verify_ssl'], limits=limits, follow_redirects=True)
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.verify = _settings['verify_ssl']
+    return session
+
+
+def get_session(url):
+    """
+        Returns the pooled session of the URL's host, creating it on first use.
+        Args:
+            url: URL about to be fetched.
+        Returns:
+            Session shared by every fetch to that scheme and host.
+        """
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    with _sessions_lock:
+        if key not in _sessions:
+            if not _settings['verify_ssl']:
+                urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+            _sessions[key] = create_session()
+        return _sessions[key]
+
+
+def abort_response(response):
+    """
+        Shuts down the connection of a streamed requests response, so a read blocked in another thread returns at
+        once instead of waiting for data or its read timeout. urllib3 before 2.3 has no shutdown(); there the response
+        is only closed and the blocked read ends with the stall timeout.
+        Args:
+            response: requests.Response opened with stream=True.
+        """
+    shutdown = getattr(response.raw, 'shutdown', None)
+    if shutdown is not None:
+        shutdown()
+    else:
+        response.close()
+
+
+def capture_response(method, url, headers, status, response_headers):
+    """
+        Starts recording an exchange if traffic is recorded. Range and HEAD requests are not recorded, so the archive
+        holds one complete body per URL; error responses are recorded at once, without their body.
+        Returns:
+            Capture to pass the body through, or None.
+        """
+    recorder = get_recorder()
+    if recorder is None or method != 'GET' or 'Range' in headers:
+        return None
+    if status >= 400:
+        recorder.write_exchange(method, url, headers, status, response_headers, b'')
+        return None
+    return Capture(recorder, method, url, headers, status, response_headers)
+
+
+@contextmanager
+def recorded_body(capture, chunks):
+    """
+        Passes body chunks through a Capture, if there is one, and records the exchange once they are read.
+        """
+    if capture is None:
+        yield chunks
+        return
+    try:
+        yield capture.tee(chunks)
+    finally:
+        capture.finish()
+
+
+@contextmanager
+def open_archived(url, method='GET'):
+    """
+        Serves a request from the replayed archive, like open_response().
+        Raises:
+            requests.exceptions.ConnectionError: If the URL is not in the archive.
+            requests.exceptions.HTTPError: If the recorded response was an error.
+        """
+    try:
+        status, response_headers, body = get_archive().response(url)
+    except ArchiveMiss as e:
+        raise requests.exceptions.ConnectionError(str(e)) from e
+    if status >= 400:
+        response = requests.Response()
+        response.status_code, response.url, response.reason = status, url, http_reason(status)
+        response.raise_for_status()
+    if method == 'HEAD':
+        body = b''
+    # Range requests get the whole body, as from a server that ignores ranges.
+    yield 200 if status == 206 else status, requests.structures.CaseInsensitiveDict(response_headers), \
+        (body[start:start + CHUNK_SIZE] for start in range(0, len(body), CHUNK_SIZE))
+
+
+@contextmanager
+def open_response(url, headers, timeout=None, method='GET', deadline=None):
+    """
+        Sends a streamed request on the pooled session of the URL's host.
+        Args:
+            url: URL to fetch.
+            headers: Request headers.
+            timeout: Optional timeout in seconds, or a tuple (connect timeout, read timeout); defaults to the
+                configured timeout.
+            method: HTTP method.
+            deadline: Optional Deadline; the connection is shut down when it expires, interrupting a blocked read.
+        Returns:
+            Context manager yielding a tuple (status code, response headers, iterator over the decoded body chunks).
+        """
+    if get_archive() is not None:
+        with open_archived(url, method) as response:
+            yield response
+        return
+
+    session = get_session(url)
+    if timeout is None:
+        timeout = _settings['timeout']
+    if deadline is None:
+        deadline = Deadline()
+    if httpx is not None and isinstance(session, httpx.Client):
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[0], read=timeout[1])
+        try:
+            with session.stream(method, url, headers=headers, timeout=timeout) as response, \
+                    _watchdog.watch(deadline, response.close):
+                capture = capture_response(method, url, headers, response.status_code, response.headers)
+                response.raise_for_status()
+                with recorded_body(capture, response.iter_bytes(CHUNK_SIZE)) as chunks:
+                    yield response.status_code, response.headers, chunks
+        except httpx.HTTPStatusError as e:
+            raise requests.exceptions.HTTPError(str(e), response=e.response) from e
+        except httpx.HTTPError as e:
+            raise requests.exceptions.RequestException(str(e)) from e
+        return
+
+    response = session.request(method, url, headers=headers, timeout=timeout, stream=True)
+    try:
+        with _watchdog.watch(deadline, lambda: abort_response(response)):
+            capture = capture_response(method, url, headers, response.status_code, response.headers)
+            response.raise_for_status()
+            with recorded_body(capture, response.iter_content(CHUNK_SIZE)) as chunks:
+                yield response.status_code, response.headers, chunks
+    finally:
+        response.close()
+
+
+@contextmanager
+def open_stream(url, headers, timeout=None):
+    """
+        Opens a streamed GET request on the pooled session of the URL's host.
+        Args:
+            url: URL to fetch.
+            headers: Request headers.
+            timeout: Optional timeout in seconds; defaults to the configured timeout.
+        Returns:
+            Context manager yielding an iterator over the (decoded) body chunks.
+        """
+    with open_response(url, headers, timeout) as (_, _, chunks):
+        yield chunks
+
+
+def read_chunks(chunks, out_file=None, deadline=None):
+    """
+        Reads a response body in chunks, charging each chunk against the shared bandwidth budget.
+        Args:
+            chunks: Iterator over body chunks.
+            out_file: Optional binary file; if given the body is streamed into it instead of returned.
+            deadline: Optional Deadline checked after every chunk; the transfer is abandoned once it expires.
+        Returns:
+            The body as bytes, or the number of bytes written if out_file is given.
+        Raises:
+            DeadlineExceeded: If the deadline expired before the body was complete.
+        """
+    scheduler = get_scheduler()
+    progress = get_progress()
+    body = []
+    total = 0
+    for chunk in chunks:
+        scheduler.throttle(len(chunk))
+        progress.add_bytes(len(chunk))
+        if deadline is not None:
+            deadline.check(f"Download ({total} bytes received)")
+        total += len(chunk)
+        if out_file is not None:
+            out_file.write(chunk)
+        else:
+            body.append(chunk)
+    return total if out_file is not None else b''.join(body)
+
+
+def fetch(url, user_agent=DEFAULT_USER_AGENT, timeout=None):
+    """
+        Fetches a page over the pooled keep-alive connection of its host, with compressed transfer.
+        Args:
+            url: URL to fetch.
+            user_agent: User-Agent header to send.
+            timeout: Optional timeout in seconds.
+        Returns:
+            The response body as bytes.
+        """
+    headers = {'User-Agent': user_agent, 'Accept-Encoding': HTML_ACCEPT_ENCODING}
+    host = urlsplit(url).netloc
+    start = time.monotonic()
+    try:
+        with stage('fetch'), get_scheduler().connection():
+            with open_stream(url, headers, timeout) as chunks:
+                body = read_chunks(chunks)
+    except Exception:
+        get_progress().record_result(host, False, 'pages')
+        raise
+    get_progress().record_result(host, True, 'pages')
+    logging.info(f"Fetched {url}", extra={'url': url, 'stage': 'fetch', 'bytes': len(body),
+                                          'latency': round(time.monotonic() - start, 3)})
+    return body
+
+
+def fetch_soup(url, user_agent=DEFAULT_USER_AGENT, timeout=None):
+    """
+        Fetches a page and parses it.
+        Args:
+            url: URL to fetch.
+            user_agent: User-Agent header to send.
+            timeout: Optional timeout in seconds.
+        Returns:
+            BeautifulSoup object of the page.
+        """
+    from bs4 import BeautifulSoup
+
+    html = fetch(url, user_agent, timeout)
+    with stage('parse'):
+        return BeautifulSoup(html, 'html.parser')
+
+
+def prescreen_enabled():
+    return bool(_settings['min_image_width'] or _settings['min_image_height'] or _settings['max_image_bytes'])
+
+
+def probe_image(url, user_agent=DEFAULT_USER_AGENT, timeout=None):
+    """
+        Looks at an image without transferring its body: a HEAD request when only the byte size matters, otherwise a
+        Range request for the first probe_bytes, which also reports the total size.
+        Args:
+            url: URL of the image.
+            user_agent: User-Agent header to send.
+            timeout: Optional timeout in seconds.
+        Returns:
+            Tuple (size in bytes or None, (format, width, height) or None).
+        """
+    headers = {'User-Agent': user_agent, 'Accept-Encoding': 'identity'}
+    scheduler = get_scheduler()
+    if not (_settings['min_image_width'] or _settings['min_image_height']):
+        with scheduler.connection():
+            with open_response(url, headers, timeout, method='HEAD') as (_, response_headers, _):
+                size = response_headers.get('Content-Length')
+        return (int(size) if size and size.isdigit() else None), None
+
+    probe_bytes = _settings['probe_bytes']
+    headers['Range'] = f'bytes=0-{probe_bytes - 1}'
+    data = b''
+    with scheduler.connection():
+        with open_response(url, headers, timeout) as (status, response_headers, chunks):
+            if status == 206:
+                match = CONTENT_RANGE_PATTERN.match(response_headers.get('Content-Range', ''))
+                size = match.group(1) if match else None
+            else:
+                # The server ignored the range; stop reading after the header bytes.
+                size = response_headers.get('Content-Length')
+            for chunk in chunks:
+                scheduler.throttle(len(chunk))
+                data += chunk
+                if len(data) >= probe_bytes:
+                    break
+    return (int(size) if size and size.isdigit() else None), parse_image_size(data)
+
+
+def prescreen_image(url, user_agent=DEFAULT_USER_AGENT, timeout=None):
+    """
+        Checks an image against the configured size and resolution policy before it is downloaded.
+        Images whose size or dimensions cannot be determined are let through.
+        Args:
+            url: URL of the image.
+            user_agent: User-Agent header to send.
+            timeout: Optional timeout in seconds.
+        Returns:
+            None if the image passes, otherwise the reason it is skipped.
+        """
+    try:
+        size, image_size = probe_image(url, user_agent, timeout)
+    except NETWORK_ERRORS as e:
+        logging.warning(f"Pre-screen failed, downloading anyway: {url}, reason: {e}")
+        return None
+
+    max_image_bytes = _settings['max_image_bytes']
+    if max_image_bytes and size is not None and size > max_image_bytes:
+        return f"{size} bytes exceeds {max_image_bytes}"
+    if image_size is not None:
+        _, width, height = image_size
+        if width < _settings['min_image_width'] or height < _settings['min_image_height']:
+            return f"{width}x{height} below {_settings['min_image_width']}x{_settings['min_image_height']}"
+    return None
+
+
+def download_timeouts(timeout=None):
+    """
+        Socket timeouts of a download: the request timeout for connecting and the stall timeout for every read, so a
+        slow transfer is not cut off as long as data keeps arriving.
+        Args:
+            timeout: Optional connect timeout in seconds; defaults to the configured timeout.
+        Returns:
+            Tuple (connect timeout, read timeout).
+        """
+    if timeout is None:
+        timeout = _settings['timeout']
+    stall_timeout = _settings['stall_timeout']
+    return timeout, (stall_timeout if stall_timeout is not None else timeout)
+
+
+def download_seconds(host, content_length):
+    """
+        Time allowed for one download, scaled by its expected size and the throughput measured for its host.
+        Args:
+            host: Host the image is downloaded from.
+            content_length: Value of the Content-Length header, or None.
+        Returns:
+            Seconds, or None if download deadlines are disabled.
+        """
+    min_throughput = _settings['min_throughput']
+    if not min_throughput:
+        return None
+    size = int(content_length) if content_length and content_length.isdigit() else _settings['assumed_image_bytes']
+    return transfer_seconds(size, _throughput.rate(host), min_throughput, _settings['deadline_slack'])
+
+
+def is_overload_error(error):
+    """
+        Tells whether a failed download points at too many connections rather than at a missing or broken image.
+        Args:
+            error: Exception raised by the download.
+        Returns:
+            False for HTTP client errors other than 429, True otherwise.
+        """
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if isinstance(error, requests.exceptions.HTTPError) and status is not None:
+        return status == 429 or status >= 500
+    return True
+
+
+@staged('download')
+def download_image(url, save_path, user_agent=DEFAULT_USER_AGENT, timeout=None, budget=None):
+    """
+        Downloads a single image from the given URL and saves it to the specified path.
+        Partially written files are removed, so a failed download can be retried later. When a size or resolution
+        policy is configured the image is pre-screened first and skipped without transferring its body if it fails.
+        A download that stops receiving data for the stall timeout, runs past the deadline derived from its size and
+        the host's measured throughput, or outlives the budget it belongs to is abandoned.
+        Args:
+            url: URL of the image to download.
+            save_path: Path where the image will be saved.
+            user_agent: User-Agent header to send.
+            timeout: Optional connect timeout in seconds.
+            budget: Optional Deadline shared by related downloads, e.g. all images of one bridge.
+        Returns:
+            True if the image was downloaded, False if it already existed, was screened out, ran out of time or the
+            download failed.
+        """
+    if os.path.exists(save_path):
+        logging.error(f"File already exists, skip download: {save_path}")
+        return False
+    if budget is not None and budget.expired():
+        logging.warning(f"Time budget spent, skip download: {url}")
+        record_failure(DOWNLOAD, url, 'BudgetSpent', save_path=save_path, user_agent=user_agent)
+        return False
+
+    if prescreen_enabled():
+        reason = prescreen_image(url, user_agent, timeout)
+        if reason:
+            logging.info(f"Skipped by pre-screen: {url}, {reason}")
+            return False
+
+    # Image bodies are already compressed, so they are requested as-is.
+    headers = {'User-Agent': user_agent, 'Accept-Encoding': 'identity'}
+    host = urlsplit(url).netloc
+    deadline = Deadline(parent=budget)
+    requested = time.monotonic()
+    fields = {'url': url, 'stage': 'download'}
+    scheduler = get_scheduler()
+    try:
+        with scheduler.connection():
+            with open_response(url, headers, download_timeouts(timeout), deadline=deadline) as \
+                    (_, response_headers, chunks), open(save_path, 'wb') as out_file:
+                deadline.reset(download_seconds(host, response_headers.get('Content-Length')))
+                start = time.monotonic()
+                size = read_chunks(chunks, out_file, deadline)
+                _throughput.record(host, size, time.monotonic() - start)
+        logging.info(f"Downloaded {url} to {save_path}",
+                     extra=dict(fields, bytes=size, latency=round(time.monotonic() - requested, 3)))
+        get_progress().record_result(host, True)
+        scheduler.record_download(True)
+        record_success(DOWNLOAD, url)
+        return True
+    except DeadlineExceeded as e:
+        logging.warning(f"Abandoned download: {url} -> {save_path}, reason: {e}", extra=fields)
+        scheduler.record_download(False)
+        record_failure(DOWNLOAD, url, e, save_path=save_path, user_agent=user_agent)
+    except Exception as e:
+        scheduler.record_download(not is_overload_error(e) and not deadline.expired())
+        record_failure(DOWNLOAD, url, e, save_path=save_path, user_agent=user_agent)
+        if deadline.expired():
+            # The watchdog shut the connection down while a read was blocked.
+            logging.warning(f"Abandoned download: {url} -> {save_path}, reason: ran past its deadline ({e})",
+                            extra=fields)
+        elif isinstance(e, NETWORK_ERRORS):
+            logging.error(f"Failed to download image: {url} -> {save_path}, reason: {e}", extra=fields)
+        else:
+            logging.error(f"Error downloading image: {url} -> {save_path}, reason: {e}", extra=fields)
+
+    get_progress().record_result(host, False)
+    if os.path.exists(save_path):
+        os.remove(save_path)
+    return False
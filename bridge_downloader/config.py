@@ -0,0 +1,74 @@
+import json
+import logging
+import os
+import sys
+
+
+def resolve_config_path(path=None, env_var=None, default=None):
+    """
+        Finds the configuration file of a script: an explicit path wins, then the environment variable, then the
+        default file name in the current directory and finally next to the script, so scheduled jobs can run from
+        any directory.
+        Args:
+            path: Path given on the command line, or None.
+            env_var: Name of the environment variable holding a path, or None.
+            default: Default file name, e.g. 'config.json'.
+        Returns:
+            Path of the configuration file.
+        """
+    if path:
+        return path
+    if env_var and os.environ.get(env_var):
+        return os.environ[env_var]
+    if default and not os.path.exists(default):
+        script_folder = os.path.dirname(os.path.abspath(sys.argv[0]))
+        if os.path.exists(os.path.join(script_folder, default)):
+            return os.path.join(script_folder, default)
+    return default
+
+
+def parse_overrides(pairs):
+    """
+        Parses KEY=VALUE settings given on the command line. Values are read as JSON where possible, so numbers,
+        booleans and lists keep their type; anything else is taken as a string.
+        Args:
+            pairs: Iterable of 'KEY=VALUE' strings.
+        Returns:
+            Dictionary of the settings.
+        Raises:
+            ValueError: If a setting has no '='.
+        """
+    overrides = {}
+    for pair in pairs or ():
+        key, separator, value = pair.partition('=')
+        if not separator or not key.strip():
+            raise ValueError(f"Expected KEY=VALUE, got {pair!r}")
+        try:
+            overrides[key.strip()] = json.loads(value)
+        except json.JSONDecodeError:
+            overrides[key.strip()] = value
+    return overrides
+
+
+def load_config(path, defaults=None, overrides=None):
+    """
+        Loads a JSON configuration file.
+        Args:
+            path: Path to the JSON file.
+            defaults: Optional dictionary of values used for keys missing from the file.
+            overrides: Optional dictionary of values replacing those from the file.
+        Returns:
+            Dictionary with the configuration.
+        """
+    config = dict(defaults or {})
+    try:
+        with open(path, 'r', encoding='utf-8') as config_file:
+            config.update(json.load(config_file))
+    except FileNotFoundError:
+        logging.error(f"Config file not found: {path}")
+        raise
+    except json.JSONDecodeError as e:
+        logging.error(f"Error decoding config file {path}: {e}")
+        raise
+    config.update(overrides or {})
+    return config
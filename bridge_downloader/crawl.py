@@ -0,0 +1,314 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import time
+
+from . import client, metadata
+from .deadletter import ITEM, record_failure, record_success
+from .deadlines import Deadline
+from .fingerprints import fingerprint
+from .logs import log_fields
+from .profiling import stage, staged_iter
+from .progress import get_progress
+from .scheduler import get_scheduler
+from .storage import create_folder, create_item_folder, get_existing_items, image_path, next_image_index
+
+
+def download_media(adapter, record, item_folder, scheduler):
+    """
+        Downloads the media of one record through the shared scheduler.
+        Records without a media limit are downloaded in parallel, one file per media URL. Records with a limit
+        (search queries) are downloaded in order until the limit of new files is reached, numbering only successful
+        files after those already in the folder.
+        All downloads of the record share the scheduler's item time budget.
+        Args:
+            adapter: SiteAdapter the record belongs to.
+            record: Record returned by adapter.fetch_detail().
+            item_folder: Folder the files are written to.
+            scheduler: Scheduler providing the download threads and the connection budget.
+        Returns:
+            Tuple (number of media URLs seen, number of files downloaded).
+        """
+    limit = adapter.media_limit(record)
+    budget = Deadline(scheduler.item_time_budget)
+
+    if limit is None:
+        futures = []
+        for idx, media_url in enumerate(staged_iter('resolve', adapter.iter_media(record))):
+            futures.append(scheduler.submit_download(
+                client.download_image, media_url, image_path(item_folder, idx), adapter.user_agent, budget=budget))
+        downloaded = sum(1 for future in concurrent.futures.as_completed(futures) if future.result())
+        return len(futures), downloaded
+
+    start_index = next_image_index(item_folder)
+    seen_urls = set()
+    downloaded = 0
+    for media_url in staged_iter('resolve', adapter.iter_media(record)):
+        if downloaded >= limit or budget.expired():
+            break
+        if media_url in seen_urls:
+            continue
+        seen_urls.add(media_url)
+        save_path = image_path(item_folder, start_index + downloaded)
+        if client.download_image(media_url, save_path, adapter.user_agent, budget=budget):
+            adapter.media_downloaded(record, media_url, os.path.basename(save_path))
+            downloaded += 1
+    return len(seen_urls), downloaded
+
+
+def fetch_item(adapter, item_url, existing_items, scheduler):
+    """
+        Runs the detail and media stages for one item, without writing its metadata.
+        Args:
+            adapter: SiteAdapter of the item.
+            item_url: URL of the item as yielded by adapter.iter_items().
+            existing_items: Folder names of items that were already downloaded.
+            scheduler: Shared Scheduler.
+        Returns:
+            Tuple (record, number of media found, number of files downloaded), or None if the item already has a
+            folder.
+        """
+    if adapter.skip_existing and adapter.item_id(item_url) in existing_items:
+        logging.info(f"Folder for {adapter.name} item {item_url} already exists. Skipping...")
+        return None
+
+    progress = get_progress()
+    with progress.stage('detail'), stage('parse'):
+        record = adapter.fetch_detail(item_url)
+    if adapter.skip_existing and record['id'] in existing_items:
+        logging.info(f"Folder for {adapter.name} item {record['id']} already exists. Skipping...")
+        return None
+
+    item_folder = create_item_folder(adapter.image_folder, record['id'])
+    with progress.stage('media'):
+        media_count, downloaded = download_media(adapter, record, item_folder, scheduler)
+    adapter.finish_record(record, media_count)
+    return record, media_count, downloaded
+
+
+def index_location(adapter, record):
+    """
+        Stores the coordinates of a record in the adapter's spatial index, if it has one.
+        Args:
+            adapter: SiteAdapter of the record.
+            record: Record returned by fetch_item().
+        """
+    if adapter.spatial_index is not None and record['info'] is not None:
+        bridge_id = record['info'].get(adapter.summary_key_column) or record['id']
+        adapter.spatial_index.add_bridge(adapter.name, bridge_id, record['info'])
+
+
+def write_item_metadata(adapter, record):
+    """
+        Writes the summary row, the site-specific metadata and the location of a finished record.
+        Args:
+            adapter: SiteAdapter of the record.
+            record: Record returned by fetch_item().
+        """
+    if record['info'] is not None and adapter.summary_csv_path:
+        with stage('write'):
+            asyncio.run(metadata.append_to_summary(record['info'], adapter.summary_csv_path,
+                                                   adapter.number_column, adapter.clean_value))
+            asyncio.run(adapter.write_extra_metadata(record))
+            index_location(adapter, record)
+
+
+def update_item_metadata(adapter, record):
+    """
+        Updates the summary row, the site-specific metadata and the location of a record in place, appending them if
+        the record has no row yet. Sites whose rows cannot be matched get them appended.
+        Args:
+            adapter: SiteAdapter of the record.
+            record: Record returned by fetch_item().
+        Returns:
+            Running number of the record's summary row, or None if it is unknown.
+        """
+    if record['info'] is None or not adapter.summary_csv_path:
+        return None
+    if not adapter.summary_key_column:
+        write_item_metadata(adapter, record)
+        return None
+    with stage('write'):
+        row_number = asyncio.run(metadata.update_summary_row(
+            record['info'], adapter.summary_csv_path, adapter.summary_key_column, adapter.number_column,
+            adapter.clean_value))
+        asyncio.run(adapter.update_extra_metadata(record, row_number))
+        index_location(adapter, record)
+    return row_number
+
+
+def crawl_item(adapter, item_url, existing_items, scheduler, in_place=False):
+    """
+        Runs the detail, media and metadata stages for one item.
+        Args:
+            adapter: SiteAdapter of the item.
+            item_url: URL of the item as yielded by adapter.iter_items().
+            existing_items: Folder names of items that were already downloaded.
+            scheduler: Shared Scheduler.
+            in_place: Update the summary and template rows the item may already have instead of appending new ones,
+                e.g. when a dead-lettered item whose metadata was written is crawled again.
+        Returns:
+            Number of files downloaded, or None if the item was skipped or failed.
+        """
+    progress = get_progress()
+    try:
+        result = fetch_item(adapter, item_url, existing_items, scheduler)
+        if result is None:
+            progress.item_done('skipped')
+            return None
+        record, media_count, downloaded = result
+        with progress.stage('metadata'):
+            if in_place:
+                update_item_metadata(adapter, record)
+            else:
+                write_item_metadata(adapter, record)
+
+        logging.info(f"{adapter.name}: {record['id']} done, {downloaded} of {media_count} media downloaded")
+        progress.item_done()
+        record_success(ITEM, item_url)
+        return downloaded
+    except Exception as e:
+        logging.error(f"An error occurred while processing {adapter.name} item {item_url}: {e}")
+        progress.item_done('failed')
+        record_failure(ITEM, item_url, e, adapter.name)
+        return None
+
+
+def download_new_media(adapter, item_id, media, item_folder, fingerprints, scheduler):
+    """
+        Downloads media of an item that are not stored yet, numbered after the existing files, and records them.
+        Args:
+            adapter: SiteAdapter of the item.
+            item_id: Folder name of the item.
+            media: List of (list_media() entry, media URL) to download.
+            item_folder: Folder the files are written to.
+            fingerprints: FingerprintStore the downloaded files are recorded in.
+            scheduler: Scheduler providing the download threads and the connection budget.
+        Returns:
+            Number of files downloaded.
+        """
+    start_index = next_image_index(item_folder)
+    budget = Deadline(scheduler.item_time_budget)
+    futures = {}
+    for offset, (entry, media_url) in enumerate(media):
+        save_path = image_path(item_folder, start_index + offset)
+        future = scheduler.submit_download(client.download_image, media_url, save_path, adapter.user_agent,
+                                           budget=budget)
+        futures[future] = (entry, save_path)
+
+    downloaded = 0
+    for future in concurrent.futures.as_completed(futures):
+        if future.result():
+            entry, save_path = futures[future]
+            fingerprints.add_media(adapter.name, item_id, entry, os.path.basename(save_path))
+            downloaded += 1
+    return downloaded
+
+
+def refresh_item(adapter, item_url, fingerprints, scheduler):
+    """
+        Refresh stage for one item: re-reads its info page and media listing and acts only on what changed since the
+        last refresh. Only media entries that are not stored yet are resolved and downloaded, after the existing
+        files, and the summary and template rows of the item are updated in place instead of appended. Until every
+        new entry was stored, the media fingerprint is left unset, so the next refresh retries the missing ones.
+        Args:
+            adapter: SiteAdapter of the item.
+            item_url: URL of the item as yielded by adapter.iter_items().
+            fingerprints: FingerprintStore holding the state of the previous refresh.
+            scheduler: Shared Scheduler.
+        Returns:
+            Number of files downloaded, or None if the item was unchanged or failed.
+        """
+    progress = get_progress()
+    try:
+        with progress.stage('detail'):
+            with stage('parse'):
+                record = adapter.fetch_detail(item_url)
+            entries = list(dict.fromkeys(adapter.list_media(record)))
+        info_hash = fingerprint(record['info'])
+        media_hash = fingerprint(entries)
+        if fingerprints.get(adapter.name, record['id']) == (info_hash, media_hash):
+            logging.info(f"{adapter.name}: {record['id']} unchanged")
+            progress.item_done('skipped')
+            record_success(ITEM, item_url)
+            return None
+
+        item_folder = create_item_folder(adapter.image_folder, record['id'])
+        known_media = fingerprints.known_media(adapter.name, record['id'])
+        if not known_media:
+            # Folders from crawls before fingerprinting: files were numbered by the position of their media entry.
+            for idx, entry in enumerate(entries):
+                save_path = image_path(item_folder, idx)
+                if os.path.exists(save_path):
+                    fingerprints.add_media(adapter.name, record['id'], entry, os.path.basename(save_path))
+                    known_media.add(entry)
+
+        new_media = []
+        with progress.stage('media'):
+            with stage('resolve'):
+                for entry in entries:
+                    if entry in known_media:
+                        continue
+                    media_url = adapter.resolve_media(record, entry)
+                    if media_url in known_media:
+                        # Stored by a refresh that recorded resolved URLs rather than entries.
+                        fingerprints.add_media(adapter.name, record['id'], entry, None)
+                    elif media_url:
+                        new_media.append((entry, media_url))
+            downloaded = download_new_media(adapter, record['id'], new_media, item_folder, fingerprints, scheduler)
+        adapter.finish_record(record, len(entries))
+        if len(fingerprints.known_media(adapter.name, record['id']) & set(entries)) < len(entries):
+            media_hash = None
+
+        row_number = update_item_metadata(adapter, record)
+
+        fingerprints.update(adapter.name, record['id'], item_url, info_hash, media_hash, row_number)
+        logging.info(f"{adapter.name}: {record['id']} refreshed, {downloaded} of {len(new_media)} new media "
+                     f"downloaded")
+        progress.item_done()
+        record_success(ITEM, item_url)
+        return downloaded
+    except Exception as e:
+        logging.error(f"An error occurred while refreshing {adapter.name} item {item_url}: {e}")
+        progress.item_done('failed')
+        record_failure(ITEM, item_url, e, adapter.name)
+        return None
+
+
+def crawl(jobs, scheduler=None, fingerprints=None):
+    """
+        Crawls several sites in one process under the shared concurrency and bandwidth budget.
+        Args:
+            jobs: List of (adapter, target, limit) tuples.
+            scheduler: Scheduler to use; defaults to the process-wide scheduler.
+            fingerprints: FingerprintStore enabling refresh mode: items that already have a folder are re-checked
+                and updated instead of skipped.
+        Returns:
+            Dictionary of site name to number of files downloaded.
+        """
+    scheduler = scheduler or get_scheduler()
+    start_time = time.time()
+
+    futures = {}
+    for adapter, target, limit in jobs:
+        create_folder(adapter.image_folder)
+        existing_items = get_existing_items(adapter.image_folder)
+        try:
+            for item_url in adapter.iter_items(target, limit):
+                with log_fields(site=adapter.name, item=item_url):
+                    if fingerprints is not None and adapter.skip_existing:
+                        future = scheduler.submit_item(refresh_item, adapter, item_url, fingerprints, scheduler)
+                    else:
+                        future = scheduler.submit_item(crawl_item, adapter, item_url, existing_items, scheduler)
+                futures[future] = adapter.name
+                get_progress().add_total()
+        except Exception as e:
+            logging.error(f"An error occurred while listing {adapter.name} target {target}: {e}")
+
+    totals = {adapter.name: 0 for adapter, _, _ in jobs}
+    for future in concurrent.futures.as_completed(futures):
+        totals[futures[future]] += future.result() or 0
+
+    logging.info(f"Crawl finished in {time.time() - start_time:.1f} s: {totals}")
+    return totals
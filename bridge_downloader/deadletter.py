@@ -0,0 +1,314 @@
+"""
+    Dead-letter store of failed bridges, media resolutions and image downloads, and their targeted re-drive.
+
+    Usage:
+        python -m bridge_downloader.deadletter list [--kind KIND] [--error CLASS] [--host HOST] [--site SITE]
+        python -m bridge_downloader.deadletter redrive [--kind KIND] [--error CLASS] [--host HOST] [--site SITE]
+
+    Every failure is stored in the dead_letters table of the crawl-state database, one row per bridge ('item'), media
+    page ('resolve') or image ('download'), with the error class (e.g. 'ConnectionError' or 'HTTPError 503'), the
+    last message, the number of attempts and what is needed to retry it: the image's file path, the bridge folder of a
+    media page, or the site of a bridge. redrive retries only the matching open entries, so recovering costs work in
+    proportion to the failures. Entries that succeed, in a re-drive or in a later crawl, are marked resolved; entries
+    that fail again count one more attempt. --error matches the start of the class, so 'HTTPError 5' selects all
+    server errors.
+    """
+import argparse
+import collections
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+from .logs import current_fields
+from .state import connect
+
+ITEM = 'item'
+RESOLVE = 'resolve'
+DOWNLOAD = 'download'
+
+
+def error_class(error):
+    """
+        Names the class of a failure, with the status code for HTTP errors, e.g. 'HTTPError 404'.
+        """
+    if isinstance(error, str):
+        return error
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return f"{type(error).__name__} {status}" if status is not None else type(error).__name__
+
+
+class DeadLetterStore:
+    """
+        Persistent record of failed work, kept until the work succeeds.
+        Args:
+            db_path: Path of the crawl-state database.
+        """
+
+    def __init__(self, db_path):
+        self.db = connect(db_path)
+        self.lock = threading.Lock()
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                kind TEXT NOT NULL,
+                url TEXT NOT NULL,
+                site TEXT,
+                host TEXT,
+                error_class TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                context TEXT,
+                first_failed REAL,
+                last_failed REAL,
+                resolved REAL,
+                PRIMARY KEY (kind, url)
+            );
+            CREATE INDEX IF NOT EXISTS dead_letters_open ON dead_letters (resolved, kind, error_class);
+        ''')
+
+    def record(self, kind, url, error, site=None, context=None):
+        """
+            Stores a failure; a failure of an entry already stored counts one more attempt and reopens it.
+            Args:
+                kind: ITEM, RESOLVE or DOWNLOAD.
+                url: URL of the bridge, media page or image.
+                error: Exception, or a short reason string used as error class.
+                site: Site the work belongs to.
+                context: JSON-serialisable dictionary needed to retry the work.
+            """
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                'INSERT INTO dead_letters (kind, url, site, host, error_class, error, context, first_failed, '
+                'last_failed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (kind, url) DO UPDATE SET error_class = excluded.error_class, error = excluded.error, '
+                'attempts = attempts + 1, last_failed = excluded.last_failed, resolved = NULL, '
+                'context = COALESCE(excluded.context, context), site = COALESCE(excluded.site, site)',
+                (kind, url, site, urlsplit(url).netloc, error_class(error), str(error)[:1000],
+                 json.dumps(context) if context else None, now, now))
+
+    def resolve(self, kind, url):
+        with self.lock:
+            self.db.execute('UPDATE dead_letters SET resolved = ? WHERE kind = ? AND url = ? AND resolved IS NULL',
+                            (time.time(), kind, url))
+
+    def select(self, kind=None, error=None, host=None, site=None, max_attempts=None, limit=None):
+        """
+            Returns the open entries matching the filters, oldest failure first.
+            Args:
+                kind: ITEM, RESOLVE or DOWNLOAD.
+                error: Start of the error class, e.g. 'Timeout' or 'HTTPError 5'.
+                host: Host of the URL.
+                site: Site name.
+                max_attempts: Skip entries that already failed this many times.
+                limit: Maximum number of entries.
+            Returns:
+                List of dictionaries with the columns of the entries, context decoded.
+            """
+        conditions, parameters = ['resolved IS NULL'], []
+        for column, value in (('kind', kind), ('host', host), ('site', site)):
+            if value:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+        if error:
+            conditions.append('substr(error_class, 1, ?) = ?')
+            parameters.extend([len(error), error])
+        if max_attempts:
+            conditions.append('attempts < ?')
+            parameters.append(max_attempts)
+        query = f"SELECT * FROM dead_letters WHERE {' AND '.join(conditions)} ORDER BY first_failed"
+        if limit is not None:
+            query += ' LIMIT ?'
+            parameters.append(limit)
+        with self.lock:
+            cursor = self.db.execute(query, parameters)
+            columns = [description[0] for description in cursor.description]
+            entries = [dict(zip(columns, row)) for row in cursor]
+        for entry in entries:
+            entry['context'] = json.loads(entry['context']) if entry['context'] else {}
+        return entries
+
+    def is_resolved(self, kind, url):
+        with self.lock:
+            row = self.db.execute('SELECT resolved FROM dead_letters WHERE kind = ? AND url = ?',
+                                  (kind, url)).fetchone()
+        return row is None or row[0] is not None
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+_store = None
+
+
+def configure_dead_letters(db_path):
+    """
+        Opens the process-wide dead-letter store; failures are only recorded once it is configured.
+        Args:
+            db_path: Path of the crawl-state database; empty to record nothing.
+        Returns:
+            The DeadLetterStore, or None.
+        """
+    global _store
+
+    _store = DeadLetterStore(db_path) if db_path else None
+    return _store
+
+
+def get_dead_letters():
+    return _store
+
+
+def record_failure(kind, url, error, site=None, **context):
+    """
+        Stores a failure in the process-wide store, if one is configured. Errors of the store itself are logged and
+        never interrupt the crawl.
+        Args:
+            kind: ITEM, RESOLVE or DOWNLOAD.
+            url: URL of the failed work.
+            error: Exception or reason string.
+            site: Site the work belongs to; defaults to the site field of the enclosing log_fields() block.
+            context: Keyword arguments needed to retry the work.
+        """
+    if _store is None:
+        return
+    try:
+        _store.record(kind, url, error, site or current_fields().get('site'), context)
+    except Exception as e:
+        logging.error(f"Could not record failed {kind} {url}: {e}")
+
+
+def record_success(kind, url):
+    """
+        Marks an entry of the process-wide store as resolved, if one is configured.
+        """
+    if _store is None:
+        return
+    try:
+        _store.resolve(kind, url)
+    except Exception as e:
+        logging.error(f"Could not resolve {kind} {url}: {e}")
+
+
+def redrive_media_pages(entries, user_agent):
+    """
+        Resolves the media pages of one bridge again and downloads their images after the existing files.
+        Args:
+            entries: RESOLVE entries sharing a bridge folder.
+            user_agent: User-Agent header to send.
+        Returns:
+            Number of images downloaded.
+        """
+    from . import client
+    from .sites.structurae import get_download_link
+    from .storage import image_path, next_image_index
+
+    downloaded = 0
+    for entry in entries:
+        context = entry['context']
+        try:
+            download_link = get_download_link(client.fetch_soup(entry['url'], user_agent))
+        except Exception as e:
+            logging.error(f"Error resolving media page {entry['url']}: {e}")
+            record_failure(RESOLVE, entry['url'], e, entry['site'])
+            continue
+        record_success(RESOLVE, entry['url'])
+        if download_link:
+            folder = context['folder']
+            downloaded += client.download_image(urljoin(context['base_url'], download_link),
+                                                image_path(folder, next_image_index(folder)), user_agent)
+    return downloaded
+
+
+def redrive(store, entries, args, scheduler):
+    """
+        Retries dead-letter entries: images are downloaded to their original path, media pages resolved and
+        downloaded, and bridges crawled again from their URL by the site's adapter, updating their metadata rows in
+        place.
+        Args:
+            store: DeadLetterStore the entries come from.
+            entries: Entries returned by store.select().
+            args: Parsed engine options, for the site configurations.
+            scheduler: Shared Scheduler.
+        Returns:
+            Number of entries that were resolved.
+        """
+    from . import client
+    from .cli import load_adapter
+    from .crawl import crawl_item
+
+    adapters = {}
+    futures = []
+    media_pages = collections.defaultdict(list)
+    for entry in entries:
+        context = entry['context']
+        if entry['kind'] == DOWNLOAD:
+            if os.path.exists(context['save_path']):
+                store.resolve(DOWNLOAD, entry['url'])
+                continue
+            futures.append(scheduler.submit_download(client.download_image, entry['url'], context['save_path'],
+                                                     context.get('user_agent', client.DEFAULT_USER_AGENT)))
+        elif entry['kind'] == RESOLVE:
+            media_pages[context['folder']].append(entry)
+        elif entry['site']:
+            adapter = load_adapter(args, entry['site'], adapters)
+            # The bridge may have a folder and summary rows from the failed attempt, so it must not be skipped as
+            # existing and its rows are updated instead of appended a second time.
+            futures.append(scheduler.submit_item(crawl_item, adapter, entry['url'], set(), scheduler, in_place=True))
+    for folder_entries in media_pages.values():
+        user_agent = folder_entries[0]['context'].get('user_agent', client.DEFAULT_USER_AGENT)
+        futures.append(scheduler.submit_item(redrive_media_pages, folder_entries, user_agent))
+    concurrent.futures.wait(futures)
+    return sum(1 for entry in entries if store.is_resolved(entry['kind'], entry['url']))
+
+
+def main():
+    from . import client
+    from .cli import add_engine_arguments, setup_engine
+    from .progress import show_progress
+    # Run with -m, this file is __main__; the store configured by setup_engine lives in the imported module.
+    from .deadletter import get_dead_letters, redrive
+
+    parser = argparse.ArgumentParser(prog='python -m bridge_downloader.deadletter',
+                                     description=__doc__.splitlines()[1].strip())
+    add_engine_arguments(parser)
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('list', 'show the open entries per kind, error class and host'),
+                            ('redrive', 'retry the open entries')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--kind', choices=[ITEM, RESOLVE, DOWNLOAD], help='only entries of this kind')
+        command.add_argument('--error', help="only error classes starting with this, e.g. 'Timeout' or 'HTTPError 5'")
+        command.add_argument('--host', help='only URLs of this host')
+        command.add_argument('--site', help='only entries of this site')
+        command.add_argument('--max-attempts', type=int, help='skip entries that failed this many times')
+        command.add_argument('--limit', type=int, help='most entries to take (default: all)')
+    args = parser.parse_args()
+
+    scheduler = setup_engine(args, 'bridge_downloader_deadletter.log')
+    store = get_dead_letters()
+    if store is None:
+        parser.error('--dead-letters must name the crawl-state database')
+    try:
+        entries = store.select(args.kind, args.error, args.host, args.site, args.max_attempts, args.limit)
+        if args.command == 'list':
+            groups = collections.Counter((entry['kind'], entry['error_class'], entry['host']) for entry in entries)
+            for (kind, error, host), count in sorted(groups.items()):
+                print(f"{kind:<9} {error:<28} {host:<30} {count:>7}")
+            print(f"{len(entries)} open entries")
+        else:
+            start = time.perf_counter()
+            with show_progress(not args.no_dashboard, args.status_file, args.status_port):
+                resolved = redrive(store, entries, args, scheduler)
+            print(f"{resolved} of {len(entries)} entries resolved in {time.perf_counter() - start:.1f} s")
+    finally:
+        scheduler.shutdown()
+        client.close_sessions()
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
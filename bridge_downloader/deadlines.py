@@ -0,0 +1,151 @@
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+class DeadlineExceeded(Exception):
+    """
+        Raised when a transfer runs past its deadline or its budget is cancelled.
+        """
+
+
+class Deadline:
+    """
+        Point in time after which work is abandoned. Deadlines can be nested: a download deadline with a bridge budget
+        as parent expires as soon as either of them does, and cancelling the budget stops every download under it.
+        Args:
+            seconds: Time allowed from now; None for no time limit.
+            parent: Optional enclosing Deadline.
+        """
+
+    def __init__(self, seconds=None, parent=None):
+        self.expires = None if seconds is None else time.monotonic() + seconds
+        self.parent = parent
+        self.cancelled = threading.Event()
+
+    def remaining(self):
+        """
+            Returns the seconds left before this deadline or one of its parents expires, or None if unlimited.
+            """
+        remaining = None if self.expires is None else max(0.0, self.expires - time.monotonic())
+        if self.parent is not None:
+            parent_remaining = self.parent.remaining()
+            if parent_remaining is not None:
+                remaining = parent_remaining if remaining is None else min(remaining, parent_remaining)
+        return remaining
+
+    def reset(self, seconds):
+        """
+            Moves the deadline to the given number of seconds from now, or removes its own limit if None.
+            """
+        self.expires = None if seconds is None else time.monotonic() + seconds
+
+    def expired(self):
+        if self.cancelled.is_set() or (self.parent is not None and self.parent.expired()):
+            return True
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def check(self, what):
+        """
+            Raises DeadlineExceeded if the deadline has passed.
+            Args:
+                what: Description of the work, used in the exception message.
+            """
+        if self.expired():
+            raise DeadlineExceeded(f"{what} ran past its deadline")
+
+
+class Watchdog:
+    """
+        Background thread that calls a callback once its deadline expires, used to abort transfers that are blocked
+        in a socket read and would otherwise only notice the deadline after the read returns.
+        Args:
+            interval: Seconds between checks.
+        """
+
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self.watched = {}
+        self.keys = itertools.count()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @contextmanager
+    def watch(self, deadline, callback):
+        """
+            Context manager during which callback is called if the deadline expires.
+            Args:
+                deadline: Deadline to watch.
+                callback: Function without arguments, called at most once from the watchdog thread.
+            """
+        key = next(self.keys)
+        with self.lock:
+            self.watched[key] = (deadline, callback)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='watchdog', daemon=True)
+                self.thread.start()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.watched.pop(key, None)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                expired = [key for key, (deadline, _) in self.watched.items() if deadline.expired()]
+                callbacks = [self.watched.pop(key)[1] for key in expired]
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    logging.debug(f"Watchdog callback failed: {e}")
+
+
+class ThroughputMeter:
+    """
+        Moving average of the transfer rate per host, measured over completed downloads.
+        Args:
+            smoothing: Weight of the newest sample in the exponential moving average.
+            min_bytes: Transfers smaller than this are not measured; their time is mostly latency.
+        """
+
+    def __init__(self, smoothing=0.3, min_bytes=64 * 1024):
+        self.smoothing = smoothing
+        self.min_bytes = min_bytes
+        self.rates = {}
+        self.lock = threading.Lock()
+
+    def record(self, host, nbytes, seconds):
+        if nbytes < self.min_bytes or seconds <= 0:
+            return
+        rate = nbytes / seconds
+        with self.lock:
+            previous = self.rates.get(host)
+            self.rates[host] = rate if previous is None else previous + self.smoothing * (rate - previous)
+
+    def rate(self, host):
+        with self.lock:
+            return self.rates.get(host)
+
+
+def transfer_seconds(size, rate, min_rate, slack, slowdown=4.0):
+    """
+        Time allowed for a transfer of the given size.
+        Args:
+            size: Expected number of bytes.
+            rate: Measured transfer rate of the host in bytes per second, or None if unknown.
+            min_rate: Slowest rate that still counts as progressing, in bytes per second.
+            slack: Seconds added for latency and server think time.
+            slowdown: How many times slower than the measured rate a transfer may run before it is abandoned.
+        Returns:
+            Seconds allowed for the transfer.
+        """
+    allowed_rate = min_rate if rate is None else max(min_rate, rate / slowdown)
+    return slack + size / allowed_rate
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import threading
+import time
+
+from .state import connect
+
+
+def fingerprint(value):
+    """
+        Content hash of extracted page data. Hashing what the parsers extract rather than the raw HTML keeps
+        fingerprints stable when only page chrome (ads, counters, session tokens) changes.
+        Args:
+            value: JSON-serialisable data, e.g. a bridge info dictionary or a list of media URLs.
+        Returns:
+            Hex digest.
+        """
+    data = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class FingerprintStore:
+    """
+        Remembers, per bridge, the fingerprints of its info and media pages and the media files already stored, so a
+        refresh crawl only re-processes bridges that changed and only downloads new media.
+        Args:
+            db_path: Path of the crawl-state database.
+        """
+
+    def __init__(self, db_path):
+        self.db = connect(db_path)
+        self.lock = threading.Lock()
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                site TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                url TEXT,
+                info_hash TEXT,
+                media_hash TEXT,
+                row_number INTEGER,
+                updated REAL,
+                PRIMARY KEY (site, item_id)
+            );
+            CREATE TABLE IF NOT EXISTS media (
+                site TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                media_url TEXT NOT NULL,
+                file TEXT,
+                PRIMARY KEY (site, item_id, media_url)
+            );
+        ''')
+
+    def get(self, site, item_id):
+        """
+            Returns the stored fingerprints of an item.
+            Returns:
+                Tuple (info hash, media hash), or None if the item was never fingerprinted.
+            """
+        with self.lock:
+            row = self.db.execute('SELECT info_hash, media_hash FROM fingerprints WHERE site = ? AND item_id = ?',
+                                  (site, item_id)).fetchone()
+        return tuple(row) if row else None
+
+    def update(self, site, item_id, url, info_hash, media_hash, row_number=None):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (site, item_id, url, info_hash, media_hash, row_number, time.time()))
+
+    def known_media(self, site, item_id):
+        """
+            Returns the media URLs of an item that are already stored.
+            """
+        with self.lock:
+            rows = self.db.execute('SELECT media_url FROM media WHERE site = ? AND item_id = ?',
+                                   (site, item_id)).fetchall()
+        return {media_url for media_url, in rows}
+
+    def add_media(self, site, item_id, media_url, file_name):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?)', (site, item_id, media_url, file_name))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
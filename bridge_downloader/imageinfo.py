@@ -0,0 +1,80 @@
+import struct
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Start-of-frame markers carrying the image size; C4 (DHT), C8 (JPG) and CC (DAC) share the range but are not frames.
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def parse_jpeg_size(data):
+    """
+        Walks the JPEG marker segments up to the first start-of-frame segment.
+        Args:
+            data: Leading bytes of the file.
+        Returns:
+            Tuple (width, height), or None if no frame header lies within the given bytes.
+        """
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF:
+            # Fill byte before the marker.
+            position += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            position += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            return None
+        length, = struct.unpack_from('>H', data, position + 2)
+        if marker in JPEG_SOF_MARKERS:
+            if position + 9 > len(data):
+                return None
+            height, width = struct.unpack_from('>HH', data, position + 5)
+            return width, height
+        position += 2 + length
+    return None
+
+
+def parse_webp_size(data):
+    """
+        Reads the canvas size from the first chunk of a WebP file (lossy, lossless or extended).
+        Args:
+            data: Leading bytes of the file.
+        Returns:
+            Tuple (width, height), or None if the chunk is not recognised.
+        """
+    chunk = data[12:16]
+    if chunk == b'VP8 ' and len(data) >= 30 and data[23:26] == b'\x9d\x01\x2a':
+        width, height = struct.unpack_from('<HH', data, 26)
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(data) >= 25 and data[20] == 0x2F:
+        bits, = struct.unpack_from('<I', data, 21)
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X' and len(data) >= 30:
+        width = int.from_bytes(data[24:27], 'little') + 1
+        height = int.from_bytes(data[27:30], 'little') + 1
+        return width, height
+    return None
+
+
+def parse_image_size(data):
+    """
+        Determines the format and pixel size of an image from the first bytes of the file.
+        Args:
+            data: Leading bytes of the file (a few kilobytes are enough unless a JPEG carries large metadata).
+        Returns:
+            Tuple (format, width, height), or None if the format is unknown or the header is incomplete.
+        """
+    if data.startswith(b'\xff\xd8'):
+        size = parse_jpeg_size(data)
+        return ('jpeg',) + size if size else None
+    if data.startswith(PNG_SIGNATURE) and len(data) >= 24 and data[12:16] == b'IHDR':
+        return ('png',) + struct.unpack_from('>II', data, 16)
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        size = parse_webp_size(data)
+        return ('webp',) + size if size else None
+    if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        return ('gif',) + struct.unpack_from('<HH', data, 6)
+    return None
@@ -0,0 +1,39 @@
+import threading
+import time
+
+from .state import connect
+
+
+class LanguageLinkCache:
+    """
+        Persistent map from the German page of a bridge to the link of its English version, so English crawls can
+        load the English page directly instead of reading the link from the German page first.
+        Args:
+            db_path: Path of the crawl-state database.
+        """
+
+    def __init__(self, db_path):
+        self.db = connect(db_path)
+        self.lock = threading.Lock()
+        self.db.execute('CREATE TABLE IF NOT EXISTS language_links '
+                        '(de_url TEXT PRIMARY KEY, en_link TEXT NOT NULL, updated REAL)')
+
+    def get(self, de_url):
+        """
+            Returns the cached English link of a German page, or None.
+            """
+        with self.lock:
+            row = self.db.execute('SELECT en_link FROM language_links WHERE de_url = ?', (de_url,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, de_url, en_link):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO language_links VALUES (?, ?, ?)', (de_url, en_link, time.time()))
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM language_links').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
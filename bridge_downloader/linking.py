@@ -0,0 +1,302 @@
+"""
+    Links the bridges of the structurae and historicbridges summaries that describe the same physical bridge.
+
+    Usage:
+        python -m bridge_downloader.linking [--structurae FILE] [--historicbridges FILE] [--output FILE]
+
+    Instead of comparing every pair, each bridge is put into blocks keyed by one of its distinctive name tokens,
+    combined with its country, its completion decade or nothing. Only bridges of the two sources that share a block
+    are scored, and blocks of very common tokens are skipped, so the work grows with the number of bridges rather than
+    with its square. Candidate pairs are scored on character trigrams and tokens of their names, year, country and
+    place, then linked one-to-one from the best score down.
+
+    The output is a linked-ID table with one row per bridge: bridges of both sources that were linked share a link_id.
+    """
+import argparse
+import collections
+import csv
+import itertools
+import os
+import re
+import time
+import unicodedata
+
+from .config import load_config
+from .sites import SITES
+from .units import fold_umlauts
+
+# Words that name the kind of structure rather than the bridge.
+NAME_STOPWORDS = {
+    'bridge', 'bridges', 'bruecke', 'brucke', 'brug', 'pont', 'ponte', 'puente', 'most', 'viaduct', 'viadukt',
+    'viaduc', 'viadotto', 'aqueduct', 'covered', 'footbridge', 'stegbruecke', 'steg', 'the', 'of', 'over', 'de',
+    'du', 'des', 'la', 'le', 'les', 'di', 'del', 'der', 'die', 'das', 'am', 'an', 'im', 'in', 'ueber', 'und', 'and',
+    'at', 'on', 'st', 'road', 'street', 'rail', 'railway', 'railroad', 'eisenbahnbruecke', 'strassenbruecke',
+}
+
+# Country names as they appear in either source, mapped to one spelling.
+COUNTRY_ALIASES = {
+    'germany': 'germany', 'deutschland': 'germany', 'france': 'france', 'frankreich': 'france',
+    'switzerland': 'switzerland', 'schweiz': 'switzerland', 'austria': 'austria', 'oesterreich': 'austria',
+    'hungary': 'hungary', 'ungarn': 'hungary', 'magyarorszag': 'hungary', 'italy': 'italy', 'italien': 'italy',
+    'spain': 'spain', 'spanien': 'spain', 'portugal': 'portugal', 'belgium': 'belgium', 'belgien': 'belgium',
+    'netherlands': 'netherlands', 'niederlande': 'netherlands', 'luxembourg': 'luxembourg',
+    'luxemburg': 'luxembourg', 'poland': 'poland', 'polen': 'poland', 'czech republic': 'czech republic',
+    'czechia': 'czech republic', 'tschechien': 'czech republic', 'slovakia': 'slovakia', 'slowakei': 'slovakia',
+    'denmark': 'denmark', 'daenemark': 'denmark', 'sweden': 'sweden', 'schweden': 'sweden', 'norway': 'norway',
+    'norwegen': 'norway', 'finland': 'finland', 'finnland': 'finland', 'ireland': 'ireland', 'irland': 'ireland',
+    'united kingdom': 'united kingdom', 'vereinigtes koenigreich': 'united kingdom', 'england': 'united kingdom',
+    'scotland': 'united kingdom', 'schottland': 'united kingdom', 'wales': 'united kingdom',
+    'united states': 'united states', 'usa': 'united states', 'vereinigte staaten': 'united states',
+    'canada': 'canada', 'kanada': 'canada', 'mexico': 'mexico', 'mexiko': 'mexico', 'brazil': 'brazil',
+    'brasilien': 'brazil', 'china': 'china', 'volksrepublik china': 'china', 'japan': 'japan', 'vietnam': 'vietnam',
+    'cambodia': 'cambodia', 'kambodscha': 'cambodia', 'india': 'india', 'indien': 'india', 'australia': 'australia',
+    'australien': 'australia', 'new zealand': 'new zealand', 'neuseeland': 'new zealand', 'russia': 'russia',
+    'russland': 'russia', 'turkey': 'turkey', 'tuerkei': 'turkey', 'greece': 'greece', 'griechenland': 'greece',
+    'croatia': 'croatia', 'kroatien': 'croatia', 'slovenia': 'slovenia', 'slowenien': 'slovenia',
+}
+
+# Column fragments (lower case, umlauts folded) holding the name, place and year of a bridge in either summary.
+NAME_COLUMNS = ('bridge name', 'bruecke name', 'brucke name', 'name')
+ID_COLUMNS = ('eindeutiger name', 'unique name', 'bridge name')
+PLACE_COLUMNS = ('land', 'stadt', 'region1', 'region2', 'region3', 'lage', 'location', 'country', 'state', 'county',
+                 'city', 'crosses')
+YEAR_COLUMNS = ('jahr_fertig', 'fertigstellung', 'completion', 'built', 'construction', 'date', 'jahr_beginn',
+                'baubeginn')
+
+YEAR_PATTERN = re.compile(r'\b(1[0-9]{3}|20[0-9]{2})\b')
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Bridges of one source in a block beyond which the block is skipped as not distinctive.
+MAX_BLOCK_SIZE = 50
+# Letters of a name token that form its prefix block.
+PREFIX_LENGTH = 4
+SCORE_THRESHOLD = 0.8
+
+Bridge = collections.namedtuple('Bridge', 'source source_id name tokens trigrams country year place')
+
+
+def normalize(text):
+    """
+        Lower-cases text, folds umlauts and strips accents, e.g. 'Pont d'Avignon' -> 'pont d avignon'.
+        """
+    text = unicodedata.normalize('NFKD', fold_umlauts(text or ''))
+    return ' '.join(WORD_PATTERN.findall(''.join(c for c in text if not unicodedata.combining(c)).lower()))
+
+
+def name_tokens(name):
+    return frozenset(token for token in normalize(name).split() if token not in NAME_STOPWORDS and len(token) > 1)
+
+
+def trigrams(tokens):
+    grams = set()
+    for token in tokens:
+        padded = f" {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+def find_country(place):
+    """
+        Returns the canonical country named in a normalized place text, or None.
+        """
+    words = place.split()
+    for size in (3, 2, 1):
+        for start in range(len(words) - size, -1, -1):
+            country = COUNTRY_ALIASES.get(' '.join(words[start:start + size]))
+            if country:
+                return country
+    return None
+
+
+def pick_columns(row, fragments):
+    """
+        Returns the non-empty values of the columns whose name contains one of the fragments, in fragment order.
+        """
+    columns = [(normalize(column), value) for column, value in row.items() if column and value]
+    return [value for fragment in fragments for column, value in columns if normalize(fragment) in column]
+
+
+def to_bridge(source, row, default_country=None):
+    """
+        Builds the comparable form of one summary row.
+        Args:
+            source: Source name, e.g. 'structurae'.
+            row: Dictionary of the row.
+            default_country: Country assumed when the row names none, e.g. the country a crawl was run for.
+        Returns:
+            Bridge, or None if the row has no name.
+        """
+    names = pick_columns(row, NAME_COLUMNS)
+    if not names:
+        return None
+    ids = pick_columns(row, ID_COLUMNS)
+    place = normalize(' '.join(dict.fromkeys(pick_columns(row, PLACE_COLUMNS))))
+    year = None
+    for value in pick_columns(row, YEAR_COLUMNS):
+        match = YEAR_PATTERN.search(value)
+        if match:
+            year = int(match.group(1))
+            break
+    tokens = name_tokens(names[0])
+    country = find_country(place) or (COUNTRY_ALIASES.get(normalize(default_country)) if default_country else None)
+    place_tokens = frozenset(token for token in place.split() if token not in COUNTRY_ALIASES and len(token) > 2)
+    return Bridge(source, ids[0] if ids else names[0], names[0], tokens, trigrams(tokens), country, year,
+                  place_tokens)
+
+
+def read_summary(file_path, source, default_country=None):
+    """
+        Reads the bridges of a summary CSV.
+        """
+    with open(file_path, encoding='utf-8', newline='') as f:
+        rows = csv.DictReader(f, delimiter=';')
+        return [bridge for bridge in (to_bridge(source, row, default_country) for row in rows) if bridge is not None]
+
+
+def block_keys(bridge):
+    """
+        Returns the blocks of a bridge: each name token and its first letters, alone, with the country and with the
+        completion decade, plus each place token with the country. The prefixes and places catch names spelled
+        differently in the two sources.
+        """
+    keys = set()
+    for token in bridge.tokens:
+        for key in {token, token[:PREFIX_LENGTH] + '*'}:
+            keys.add((key, None))
+            if bridge.country:
+                keys.add((key, bridge.country))
+            if bridge.year:
+                keys.add((key, bridge.year // 10))
+    for token in bridge.place:
+        keys.add(('@' + token, bridge.country))
+    return keys
+
+
+def candidate_pairs(left, right, max_block_size=MAX_BLOCK_SIZE):
+    """
+        Returns the index pairs (i, j) of bridges of both sources that share at least one block small enough to
+        compare.
+        """
+    blocks = collections.defaultdict(lambda: ([], []))
+    for side, bridges in enumerate((left, right)):
+        for index, bridge in enumerate(bridges):
+            for key in block_keys(bridge):
+                blocks[key][side].append(index)
+    pairs = set()
+    for left_indices, right_indices in blocks.values():
+        if left_indices and right_indices and len(left_indices) <= max_block_size and \
+                len(right_indices) <= max_block_size:
+            pairs.update(itertools.product(left_indices, right_indices))
+    return pairs
+
+
+def score(a, b):
+    """
+        Similarity of two bridges between 0 and 1. Missing years, countries or places count as half a match, so
+        the same name alone passes the default threshold but not when both year and place disagree.
+        """
+    if not a.trigrams or not b.trigrams:
+        return 0.0
+    dice = 2 * len(a.trigrams & b.trigrams) / (len(a.trigrams) + len(b.trigrams))
+    # A name contained in the other, e.g. 'Pont d'Avignon' in 'Pont Saint-Benezet (Pont d'Avignon)', counts nearly as
+    # much as the same name.
+    overlap = len(a.tokens & b.tokens) / min(len(a.tokens), len(b.tokens))
+    name = max(dice, 0.9 * overlap)
+
+    if a.year and b.year:
+        difference = abs(a.year - b.year)
+        year = 1.0 if difference == 0 else 0.7 if difference <= 2 else 0.3 if difference <= 10 else 0.0
+    else:
+        year = 0.5
+    country = 0.5 if not (a.country and b.country) else 1.0 if a.country == b.country else 0.0
+    place = 0.5 if not (a.place and b.place) else 1.0 if a.place & b.place else 0.0
+
+    total = 0.6 * name + 0.15 * year + 0.15 * country + 0.1 * place
+    return total * 0.5 if country == 0.0 else total
+
+
+def link(left, right, threshold=SCORE_THRESHOLD, max_block_size=MAX_BLOCK_SIZE):
+    """
+        Links bridges of two sources one-to-one.
+        Args:
+            left: Bridges of the first source.
+            right: Bridges of the second source.
+            threshold: Lowest score that is linked.
+            max_block_size: Blocks with more bridges of one source are skipped.
+        Returns:
+            Tuple (list of (left index, right index, score) links, number of candidate pairs scored).
+        """
+    pairs = candidate_pairs(left, right, max_block_size)
+    scored = [(score(left[i], right[j]), i, j) for i, j in pairs]
+    scored = sorted((item for item in scored if item[0] >= threshold), reverse=True)
+    linked_left, linked_right, links = set(), set(), []
+    for value, i, j in scored:
+        if i not in linked_left and j not in linked_right:
+            linked_left.add(i)
+            linked_right.add(j)
+            links.append((i, j, value))
+    return links, len(pairs)
+
+
+def write_links(file_path, left, right, links):
+    """
+        Writes the linked-ID table: one row per bridge of either source, linked bridges sharing their link_id.
+        """
+    link_ids = {}
+    partner = {}
+    for number, (i, j, value) in enumerate(links, 1):
+        link_ids[('left', i)] = link_ids[('right', j)] = (f"L{number:06d}", round(value, 3))
+        partner[('left', i)] = right[j].source_id
+        partner[('right', j)] = left[i].source_id
+    next_number = len(links) + 1
+    folder = os.path.dirname(file_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(file_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['link_id', 'source', 'source_id', 'name', 'country', 'year', 'score', 'linked_to'])
+        for side, bridges in (('left', left), ('right', right)):
+            for index, bridge in enumerate(bridges):
+                key = (side, index)
+                if key not in link_ids:
+                    link_ids[key] = (f"L{next_number:06d}", '')
+                    next_number += 1
+                link_id, value = link_ids[key]
+                writer.writerow([link_id, bridge.source, bridge.source_id, bridge.name, bridge.country or '',
+                                 bridge.year or '', value, partner.get(key, '')])
+
+
+def summary_path(site):
+    _, config_path = SITES[site]
+    return load_config(config_path)['summary_csv_path']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1].strip())
+    parser.add_argument('--structurae', help='structurae summary CSV (default: summary_csv_path of config.json)')
+    parser.add_argument('--historicbridges',
+                        help='historicbridges summary CSV (default: summary_csv_path of config_his.json)')
+    parser.add_argument('--historicbridges-country', help='country of historicbridges rows that name none')
+    parser.add_argument('--output', help='linked-ID table (default: bridge_links.csv next to the structurae summary)')
+    parser.add_argument('--threshold', type=float, default=SCORE_THRESHOLD,
+                        help=f'lowest score that is linked (default: {SCORE_THRESHOLD})')
+    parser.add_argument('--max-block-size', type=int, default=MAX_BLOCK_SIZE,
+                        help=f'skip blocks with more bridges of one source (default: {MAX_BLOCK_SIZE})')
+    args = parser.parse_args()
+
+    structurae_path = args.structurae or summary_path('structurae')
+    historic_path = args.historicbridges or summary_path('historicbridges')
+    output = args.output or os.path.join(os.path.dirname(structurae_path), 'bridge_links.csv')
+
+    start = time.perf_counter()
+    left = read_summary(structurae_path, 'structurae')
+    right = read_summary(historic_path, 'historicbridges', args.historicbridges_country)
+    links, compared = link(left, right, args.threshold, args.max_block_size)
+    write_links(output, left, right, links)
+    print(f"{len(left)} structurae and {len(right)} historicbridges bridges, {compared} pairs compared, "
+          f"{len(links)} linked in {time.perf_counter() - start:.1f} s")
+    print(f"Linked-ID table written to {output}")
+
+
+if __name__ == '__main__':
+    main()
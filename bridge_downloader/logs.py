@@ -0,0 +1,130 @@
+"""
+    Asynchronous structured logging.
+
+    Threads hand their records to a queue and return at once; a single listener thread formats them as JSON lines and
+    writes and rotates the log file, so file I/O and rotation never run on a download thread. Every line is one JSON
+    object with the time, level, thread and message plus any structured fields, e.g.
+        {"time": "2024-05-01T12:00:00.123", "level": "INFO", "thread": "ThreadPoolExecutor-1_0",
+         "message": "Downloaded ...", "bridge": "t-groentje", "url": "...", "stage": "download", "bytes": 183421,
+         "latency": 0.412}
+    Fields come from the extra argument of a logging call and from log_fields() blocks around the work, e.g.
+        jq -c 'select(.stage == "download") | [.bridge, .bytes, .latency]' bridge_downloader.log
+    """
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import queue
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Attributes every LogRecord has; anything else on a record is a structured field.
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+_fields = contextvars.ContextVar('log_fields', default={})
+_listener = None
+
+
+@contextmanager
+def log_fields(**fields):
+    """
+        Adds structured fields, e.g. bridge=..., to every record logged inside the block, including records of work
+        it submits to the scheduler or asyncio.to_thread().
+        """
+    token = _fields.set({**_fields.get(), **fields})
+    try:
+        yield
+    finally:
+        _fields.reset(token)
+
+
+def current_fields():
+    """
+        Returns the structured fields of the enclosing log_fields() blocks.
+        """
+    return _fields.get()
+
+
+class StructuredQueueHandler(QueueHandler):
+    """
+        QueueHandler that attaches the current log fields and renders the message and traceback in the calling
+        thread, leaving formatting and I/O to the listener.
+        """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        for key, value in _fields.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """
+        Formats a record as one JSON object per line.
+        """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(log_file, level=logging.INFO, max_bytes=10000000, backup_count=5):
+    """
+        Routes the root logger through a queue to a JSON log file written by a background thread.
+        Args:
+            log_file: Path of the log file.
+            level: Lowest level that is logged.
+            max_bytes: Size at which the file is rotated.
+            backup_count: Number of rotated files kept.
+        Returns:
+            The started QueueListener; it is stopped, flushing queued records, when the process exits.
+        """
+    global _listener
+
+    stop_logging()
+    file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8',
+                                       delay=True)
+    file_handler.setFormatter(JsonFormatter())
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(StructuredQueueHandler(records))
+    root.setLevel(level)
+    _listener = QueueListener(records, file_handler)
+    _listener.start()
+    return _listener
+
+
+@atexit.register
+def stop_logging():
+    """
+        Writes the records still queued and stops the listener thread.
+        """
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
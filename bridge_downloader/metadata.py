@@ -0,0 +1,294 @@
+import asyncio
+import contextlib
+import csv
+import os
+import threading
+
+from .storage import create_folder
+
+# Running-number columns written in front of every summary row.
+NUMBER_COLUMNS = ('Bridge Number', 'Brückennummer')
+# Running-number columns of the template files.
+TEMPLATE_ID_COLUMNS = ('bridge_id', 'Brücke_id')
+
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+# Seconds between attempts of a coroutine to take a file lock held elsewhere.
+LOCK_POLL_INTERVAL = 0.01
+
+
+def open_async(*args, **kwargs):
+    # aiofiles is imported on the first write, so runs that never write metadata do not load it.
+    import aiofiles
+
+    return aiofiles.open(*args, **kwargs)
+
+
+def get_file_lock(file_path):
+    """
+        Returns the lock serialising writes to one output file, so several sites or threads can share it.
+        Args:
+            file_path: Path of the output file.
+        Returns:
+            threading.Lock for that path.
+        """
+    key = os.path.abspath(file_path)
+    with _file_locks_guard:
+        if key not in _file_locks:
+            _file_locks[key] = threading.Lock()
+        return _file_locks[key]
+
+
+@contextlib.asynccontextmanager
+async def locked_file(file_path):
+    """
+        Holds the lock of one output file in a coroutine. Waiting yields to the event loop instead of blocking it, so
+        another coroutine of the same loop can finish its write and release the lock.
+        Args:
+            file_path: Path of the output file.
+        """
+    lock = get_file_lock(file_path)
+    while not lock.acquire(blocking=False):
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def clean_value(value):
+    """
+        Cleans a given value by replacing line breaks and tabs with spaces.
+        Args:
+            value: The value to be cleaned.
+        Returns:
+            Cleaned value.
+        """
+    if isinstance(value, str):
+        return value.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ').strip()
+    return value
+
+
+def get_existing_columns(file_path):
+    """
+        Retrieves existing column headers from a CSV file.
+        Args:
+            file_path: Path to the CSV file.
+        Returns:
+            A list of existing column headers, excluding the running-number columns.
+        """
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        return []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f, delimiter=';')
+        headers = next(reader, None)
+        if headers:
+            headers = [header for header in headers if header not in NUMBER_COLUMNS]
+        return headers if headers else []
+
+
+async def append_to_summary(bridge_info, file_path, number_column='Bridge Number', cleaner=clean_value):
+    """
+        Asynchronously appends bridge information to a summary CSV file, widening the header if new keys appear.
+        Args:
+            bridge_info: Dictionary containing bridge information.
+            file_path: Path to the summary CSV file.
+            number_column: Name of the running-number column.
+            cleaner: Function applied to every value before it is written.
+        """
+    create_folder(os.path.dirname(file_path))
+
+    async with locked_file(file_path):
+        existing_columns = get_existing_columns(file_path)
+        all_columns = [number_column] + list(existing_columns) + [col for col in bridge_info.keys() if
+                                                                  col not in existing_columns]
+
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                bridge_number = sum(1 for _ in f)
+        else:
+            bridge_number = 1
+
+        # Write headers if the file is new or rewrite the file if new columns are added
+        if not existing_columns:
+            async with open_async(file_path, 'w', newline='', encoding='utf-8') as f:
+                await f.write(';'.join(all_columns) + '\n')
+
+        elif len(all_columns) > len(existing_columns) + 1:
+            temp_data = []
+            async with open_async(file_path, 'r', encoding='utf-8') as f:
+                reader = csv.reader((await f.read()).splitlines(), delimiter=';')
+                next(reader, None)
+                for row in reader:
+                    while len(row) < len(existing_columns) + 1:
+                        row.append("N/A")
+                    temp_data.append(row)
+
+            async with open_async(file_path, 'w', newline='', encoding='utf-8') as f:
+                await f.write(';'.join(all_columns) + '\n')
+                for row in temp_data:
+                    row.extend("N/A" for _ in range(len(all_columns) - len(row)))
+                    await f.write(';'.join(row) + '\n')
+
+        cleaned_bridge_info = {key: cleaner(value) for key, value in bridge_info.items()}
+        bridge_data = [bridge_number] + [cleaned_bridge_info.get(column, "N/A") for column in all_columns[1:]]
+
+        async with open_async(file_path, 'a', newline='', encoding='utf-8') as f:
+            await f.write(';'.join(map(str, bridge_data)) + '\n')
+
+
+async def update_summary_row(bridge_info, file_path, key_column, number_column='Bridge Number', cleaner=clean_value):
+    """
+        Replaces the summary row of a bridge with new information, or appends a row if the bridge has none yet.
+        The row keeps its running number and the header is widened if new keys appear.
+        Args:
+            bridge_info: Dictionary containing bridge information.
+            file_path: Path to the summary CSV file.
+            key_column: Column identifying the bridge, e.g. its unique name.
+            number_column: Name of the running-number column of a new file.
+            cleaner: Function applied to every value before it is written.
+        Returns:
+            Running number of the bridge's row.
+        """
+    create_folder(os.path.dirname(file_path))
+    cleaned_bridge_info = {key: cleaner(value) for key, value in bridge_info.items()}
+    key_value = str(cleaned_bridge_info.get(key_column))
+
+    async with locked_file(file_path):
+        header = []
+        rows = []
+        if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+            async with open_async(file_path, 'r', encoding='utf-8') as f:
+                reader = csv.reader((await f.read()).splitlines(), delimiter=';')
+                header = next(reader, None) or []
+                rows = list(reader)
+
+        number_header = header[0] if header else number_column
+        columns = header[1:] + [col for col in cleaned_bridge_info.keys() if col not in header[1:]]
+        for row in rows:
+            row.extend("N/A" for _ in range(len(columns) + 1 - len(row)))
+
+        key_index = columns.index(key_column) + 1 if key_column in columns else None
+        bridge_row = next((row for row in rows if key_index is not None and row[key_index] == key_value), None)
+        if bridge_row is None:
+            bridge_row = [str(len(rows) + 1)]
+            rows.append(bridge_row)
+        bridge_row[1:] = [str(cleaned_bridge_info.get(column, "N/A")) for column in columns]
+
+        # The file is rewritten under a temporary name, so readers never see it half written.
+        temp_path = f"{file_path}.tmp"
+        async with open_async(temp_path, 'w', newline='', encoding='utf-8') as f:
+            await f.write(';'.join([number_header] + columns) + '\n')
+            for row in rows:
+                await f.write(';'.join(row) + '\n')
+        os.replace(temp_path, file_path)
+
+    return int(bridge_row[0]) if bridge_row[0].isdigit() else None
+
+
+def get_template_columns(file_path):
+    """
+        Retrieves column headers from a CSV template file.
+        Args:
+            file_path: Path to the CSV template file.
+        Returns:
+            A list of column headers from the CSV file.
+        """
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        return []
+    with open(file_path, 'r', encoding='utf-8-sig') as f:
+        reader = csv.reader(f, delimiter=';')
+        headers = next(reader, None)
+        if headers:
+            headers = [header for header in headers if header not in TEMPLATE_ID_COLUMNS]
+        return headers if headers else []
+
+
+async def append_to_template(bridge_info, template_path, output_path):
+    """
+        Asynchronously appends bridge information to a CSV file based on a template.
+        Args:
+            bridge_info: Dictionary containing bridge information.
+            template_path: Path to the CSV template file.
+            output_path: Path to the output CSV file where data will be appended.
+        """
+    create_folder(os.path.dirname(output_path))
+
+    template_columns = [col.lower() for col in get_template_columns(template_path)]
+    bridge_info_lower = {key.lower(): value for key, value in bridge_info.items()}
+
+    async with locked_file(output_path):
+        bridge_number = await get_next_bridge_number(output_path)
+        bridge_data = [bridge_number] + [bridge_info_lower.get(column, "N/A") for column in template_columns]
+
+        async with open_async(output_path, 'a', encoding='utf-8') as f:
+            await f.write('\n' + ';'.join(map(str, bridge_data)))
+
+
+async def update_template_row(bridge_info, template_path, output_path, bridge_number):
+    """
+        Replaces the row with the given running number in a filled-in template, or appends a row if there is none.
+        Args:
+            bridge_info: Dictionary containing bridge information.
+            template_path: Path to the CSV template file.
+            output_path: Path to the output CSV file.
+            bridge_number: Running number of the bridge's row.
+        """
+    template_columns = [col.lower() for col in get_template_columns(template_path)]
+    bridge_info_lower = {key.lower(): value for key, value in bridge_info.items()}
+
+    async with locked_file(output_path):
+        lines = []
+        if os.path.exists(output_path):
+            async with open_async(output_path, 'r', encoding='utf-8') as f:
+                lines = (await f.read()).split('\n')
+
+        prefix = f"{bridge_number};"
+        index = next((i for i, line in enumerate(lines) if i > 0 and line.startswith(prefix)), None)
+        if index is not None:
+            bridge_data = [bridge_number] + [bridge_info_lower.get(column, "N/A") for column in template_columns]
+            lines[index] = ';'.join(map(str, bridge_data))
+            temp_path = f"{output_path}.tmp"
+            async with open_async(temp_path, 'w', encoding='utf-8') as f:
+                await f.write('\n'.join(lines))
+            os.replace(temp_path, output_path)
+            return
+
+    await append_to_template(bridge_info, template_path, output_path)
+
+
+async def get_next_bridge_number(output_path):
+    """
+        Asynchronously retrieves the next bridge number to be used in the output CSV file.
+        Args:
+            output_path: Path to the output CSV file.
+        Returns:
+            The next bridge number as an integer.
+        """
+    bridge_number = 0
+    if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        async with open_async(output_path, 'r', encoding='utf-8') as f:
+            last_line = await get_last_line(f)
+            if last_line:
+                last_number = last_line.split(';')[0]
+                if last_number.isdigit():
+                    bridge_number = int(last_number)
+    bridge_number += 1
+    return bridge_number
+
+
+async def get_last_line(f):
+    """
+        Asynchronously reads the last line of a file.
+        Args:
+            f: File object opened for reading.
+        Returns:
+            The last line of the file as a string.
+        """
+    last_line = ''
+    while True:
+        line = await f.readline()
+        if not line:
+            break
+        last_line = line
+    return last_line.strip()
@@ -0,0 +1,357 @@
+"""
+    Resolves bridge names, e.g. the lines of bridges.txt, to structurae URLs from a local index.
+
+    Usage:
+        python -m bridge_downloader.names build [--listing TYPE ...]
+        python -m bridge_downloader.names resolve [--bridges-file FILE] [--threshold SCORE] [NAME ...]
+        python -m bridge_downloader.names status
+
+    build fills the bridge_names table of the crawl-state database with the slug of every structure URL stored by
+    python -m bridge_downloader.sitemap sync and, for each --listing type, with the names the type listing shows.
+    A name is then looked up without any request: first by its normalized form (case, umlauts, accents, spaces and
+    punctuation ignored, so 'Erzebachtal-Brücke' finds erzebachtalbruecke), then by the character trigrams it shares
+    with the indexed names. Fuzzy matches below the threshold, or too close to a second bridge, stay unresolved; the
+    crawls then fall back to the slug guessed from the name, which is all they had before the index. The crawl target
+    structurae=names/FILE resolves a name list the same way, e.g.
+
+        python -m bridge_downloader structurae=names/bridges.txt
+    """
+import argparse
+import array
+import collections
+import concurrent.futures
+import logging
+import re
+import threading
+import time
+
+from .linking import normalize, trigrams
+from .state import connect
+
+# Lowest trigram similarity of a fuzzy match.
+MATCH_THRESHOLD = 0.75
+# A fuzzy match is ambiguous if a different bridge scores within this margin.
+AMBIGUITY_MARGIN = 0.05
+# Names sharing a trigram beyond which the trigram only adds candidates if the rarer ones found none.
+MAX_POSTINGS = 5000
+# Candidates, by number of shared trigrams, whose similarity is computed.
+MAX_CANDIDATES = 50
+
+
+def name_key(name):
+    """
+        Returns the normalized form names are matched on exactly, e.g. "'t Groentje" -> 'tgroentje'.
+        """
+    return normalize(name).replace(' ', '')
+
+
+def name_trigrams(name):
+    return trigrams(normalize(name).split())
+
+
+def slug_name(slug):
+    return slug.replace('-', ' ')
+
+
+def base_slug(slug):
+    """
+        Returns the slug without the numeric suffix structurae gives later namesakes, e.g. 'golden-gate-bridge_1' ->
+        'golden-gate-bridge'.
+        """
+    return re.sub(r'_\d+$', '', slug)
+
+
+class NameMatcher:
+    """
+        In-memory exact and trigram lookup over the indexed names of one site.
+        Args:
+            rows: Iterable of (slug, name).
+        """
+
+    def __init__(self, rows):
+        self.keys = collections.defaultdict(set)
+        self.slug_keys = collections.defaultdict(set)
+        self.namesakes = collections.defaultdict(set)
+        self.names = []
+        self.slugs = []
+        postings = collections.defaultdict(lambda: array.array('I'))
+        for slug, name in rows:
+            self.keys[name_key(name)].add(slug)
+            self.slug_keys[slug].add(name_key(name))
+            self.namesakes[base_slug(slug)].add(slug)
+            entry = len(self.names)
+            self.names.append(name)
+            self.slugs.append(slug)
+            for gram in name_trigrams(name):
+                postings[gram].append(entry)
+        self.postings = dict(postings)
+
+    def __len__(self):
+        return len(self.names)
+
+    def are_namesakes(self, slugs):
+        """
+            Tells whether slugs belong to bridges of the same name: they share a name or differ only in the suffix
+            structurae gives later namesakes.
+            """
+        return (len({base_slug(slug) for slug in slugs}) == 1
+                or bool(set.intersection(*(self.slug_keys[slug] for slug in slugs))))
+
+    def pick_namesake(self, name, slugs):
+        """
+            Picks one of several bridges sharing a name and logs the others, so the choice can be checked.
+            """
+        # The shortest slug is the one structurae gave the name first; later namesakes get a suffix.
+        ordered = sorted(slugs, key=lambda slug: (len(slug), slug))
+        if len(ordered) > 1:
+            logging.warning(f"Name {name!r} is shared by {', '.join(ordered)}; using {ordered[0]}")
+        return ordered[0]
+
+    def lookup(self, name, threshold=MATCH_THRESHOLD):
+        """
+            Looks a name up, exactly by its normalized form first, then by trigram similarity. Both ways, a name
+            shared by several bridges resolves to the first of them, with the others logged; a fuzzy match that is
+            as close to two different names is ambiguous.
+            Args:
+                name: Bridge name as written by the user.
+                threshold: Lowest similarity (Dice coefficient of the trigram sets) of a fuzzy match.
+            Returns:
+                Tuple (slug, score), score being 1.0 for exact matches, or None if the name is unknown or ambiguous.
+            """
+        slugs = self.keys.get(name_key(name))
+        if slugs:
+            namesakes = set().union(*(self.namesakes[base_slug(slug)] for slug in slugs))
+            return self.pick_namesake(name, namesakes), 1.0
+
+        grams = name_trigrams(name)
+        if not grams:
+            return None
+        shared = collections.Counter()
+        for posting in sorted((self.postings[gram] for gram in grams if gram in self.postings), key=len):
+            if len(posting) > MAX_POSTINGS and shared:
+                break
+            shared.update(posting)
+
+        scores = {}
+        for entry, _ in shared.most_common(MAX_CANDIDATES):
+            entry_grams = name_trigrams(self.names[entry])
+            similarity = 2 * len(grams & entry_grams) / (len(grams) + len(entry_grams))
+            slug = self.slugs[entry]
+            scores[slug] = max(scores.get(slug, 0.0), similarity)
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        if not ranked or ranked[0][1] < threshold:
+            return None
+        closest = [slug for slug, score in ranked if ranked[0][1] - score < AMBIGUITY_MARGIN]
+        if len(closest) == 1:
+            return ranked[0]
+        if not self.are_namesakes(closest):
+            logging.warning(f"Name {name!r} matches both {closest[0]} and {closest[1]}")
+            return None
+        return self.pick_namesake(name, closest), ranked[0][1]
+
+
+class NameIndex:
+    """
+        The names bridges can be looked up by, stored with their URL slugs.
+        Args:
+            db_path: Path of the crawl-state database.
+        """
+
+    def __init__(self, db_path):
+        self.db = connect(db_path)
+        self.lock = threading.Lock()
+        self.matchers = {}
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS bridge_names (
+                site TEXT NOT NULL,
+                slug TEXT NOT NULL,
+                name TEXT NOT NULL,
+                source TEXT,
+                added REAL,
+                PRIMARY KEY (site, slug, name)
+            );
+        ''')
+
+    def add(self, site, entries, source):
+        """
+            Stores a batch of names.
+            Args:
+                site: Site name.
+                entries: List of (slug, name).
+                source: Where the names come from, e.g. 'sitemap' or 'listing'.
+            """
+        now = time.time()
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                self.db.executemany('INSERT OR IGNORE INTO bridge_names (site, slug, name, source, added) '
+                                    'VALUES (?, ?, ?, ?, ?)',
+                                    [(site, slug, name, source, now) for slug, name in entries if name])
+                self.db.execute('COMMIT')
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+            self.matchers.pop(site, None)
+
+    def matcher(self, site):
+        """
+            Returns the NameMatcher of a site, loading it from the database on first use.
+            """
+        with self.lock:
+            if site not in self.matchers:
+                rows = self.db.execute('SELECT slug, name FROM bridge_names WHERE site = ?', (site,)).fetchall()
+                self.matchers[site] = NameMatcher(rows)
+            return self.matchers[site]
+
+    def counts(self, site):
+        with self.lock:
+            return dict(self.db.execute('SELECT source, COUNT(*) FROM bridge_names WHERE site = ? GROUP BY source',
+                                        (site,)).fetchall())
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def guess_url(name, base_url):
+    """
+        Guesses the page URL of a bridge from its name, the way the by-name mode did before the index existed.
+        """
+    from .sites.structurae import format_text
+
+    return f"{base_url}/bauwerke/{format_text(name)}"
+
+
+def resolve_names(index, site, names, base_url, threshold=MATCH_THRESHOLD, guess=False):
+    """
+        Resolves bridge names to page URLs from the index, without network access.
+        Args:
+            index: NameIndex, or None when there is none.
+            site: Site name.
+            names: Bridge names.
+            base_url: German base URL, e.g. 'https://structurae.net/de'.
+            threshold: Lowest similarity of a fuzzy match.
+            guess: Fall back to the URL guessed from the name for names the index cannot resolve.
+        Returns:
+            Dictionary name -> URL (None for unresolved names), or None if the index holds no names of the site.
+            With guess, every name has a URL and a dictionary is always returned.
+        """
+    matcher = index.matcher(site) if index is not None else None
+    if matcher is None or not len(matcher):
+        return {name: guess_url(name, base_url) for name in names} if guess else None
+    urls = {}
+    for name in names:
+        match = matcher.lookup(name, threshold)
+        urls[name] = f"{base_url}/bauwerke/{match[0]}" if match else None
+        if match and match[1] < 1.0:
+            logging.info(f"Resolved {name!r} to {match[0]} (score {match[1]:.2f})")
+        elif not match and guess:
+            urls[name] = guess_url(name, base_url)
+            logging.warning(f"Bridge {name!r} is not in the name index; trying {urls[name]}")
+    return urls
+
+
+def read_names(file_path):
+    with open(file_path, encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def add_sitemap_names(index, site, sitemap):
+    """
+        Indexes the slugs of the structure URLs stored by the sitemap sync.
+        Returns:
+            Number of names added to the batch.
+        """
+    from .sites.structurae import get_unique_bridge_name_from_url
+
+    slugs = [get_unique_bridge_name_from_url(url) for url in sitemap.select(site)]
+    index.add(site, [(slug, slug_name(slug)) for slug in slugs], 'sitemap')
+    return len(slugs)
+
+
+def add_listing_names(index, adapter, bridge_type):
+    """
+        Indexes the names shown on the listing pages of one bridge type, page by page.
+        Returns:
+            Number of names read.
+        """
+    from .sites.structurae import get_bridge_names, get_full_bridge_url, get_listing_page_url, \
+        get_unique_bridge_name_from_url
+
+    bridge_type_url = get_full_bridge_url(None, bridge_type, adapter.base_url)
+    count = 0
+    page = 0
+    while True:
+        entries = get_bridge_names(adapter.fetch_page(get_listing_page_url(bridge_type_url, page)), adapter.base_url)
+        if not entries:
+            break
+        index.add(adapter.name, [(get_unique_bridge_name_from_url(url), name) for url, name in entries], 'listing')
+        count += len(entries)
+        # Listing pages hold 100 bridges; a shorter page is the last one.
+        if len(entries) < 100:
+            break
+        page += 1
+    return count
+
+
+def main():
+    from . import client
+    from .cli import add_engine_arguments, load_adapter, setup_engine
+    from .config import load_config
+    from .sitemap import SitemapStore
+
+    parser = argparse.ArgumentParser(prog='python -m bridge_downloader.names',
+                                     description=__doc__.splitlines()[1].strip())
+    parser.add_argument('--state-db', help='crawl-state database (default: crawl_state_db of the structurae config)')
+    add_engine_arguments(parser)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='index the sitemap slugs and the names of type listings')
+    build_parser.add_argument('--listing', action='append', default=[], metavar='TYPE',
+                              help='also index the names of this type listing, e.g. bogenbruecken (repeatable)')
+
+    resolve_parser = commands.add_parser('resolve', help='print the URL each name resolves to')
+    resolve_parser.add_argument('names', nargs='*', help='bridge names (default: the lines of --bridges-file)')
+    resolve_parser.add_argument('--bridges-file', default='bridges.txt', help='bridge names, one per line')
+    resolve_parser.add_argument('--threshold', type=float, default=MATCH_THRESHOLD,
+                                help='lowest similarity of a fuzzy match (default: %(default)s)')
+
+    commands.add_parser('status', help='show the number of indexed names')
+    args = parser.parse_args()
+
+    config = load_config(args.structurae_config)
+    index = NameIndex(args.state_db or config['crawl_state_db'])
+    scheduler = setup_engine(args, 'bridge_downloader_names.log')
+    start = time.perf_counter()
+    try:
+        if args.command == 'build':
+            sitemap = SitemapStore(args.state_db or config['crawl_state_db'])
+            try:
+                count = add_sitemap_names(index, 'structurae', sitemap)
+            finally:
+                sitemap.close()
+            adapter = load_adapter(args, 'structurae', {})
+            futures = [scheduler.submit_item(add_listing_names, index, adapter, bridge_type)
+                       for bridge_type in args.listing]
+            count += sum(future.result() for future in concurrent.futures.as_completed(futures))
+            print(f"{count} names indexed in {time.perf_counter() - start:.1f} s")
+        elif args.command == 'resolve':
+            names = args.names or read_names(args.bridges_file)
+            urls = resolve_names(index, 'structurae', names, config['base_URL'] + '/de', args.threshold)
+            if urls is None:
+                parser.error('the name index is empty; run the build command first')
+            for name in names:
+                print(f"{name}\t{urls[name] or '-'}")
+            resolved = sum(1 for url in urls.values() if url)
+            print(f"{resolved} of {len(names)} names resolved in {time.perf_counter() - start:.3f} s")
+        else:
+            counts = index.counts('structurae')
+            print(', '.join(f"{count} from {source}" for source, count in sorted(counts.items())) or 'No names')
+    finally:
+        index.close()
+        scheduler.shutdown()
+        client.close_sessions()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""
+    Sampling profiler that attributes wall-clock time to pipeline stages.
+
+    Code marks its stages with `with stage('parse'):`; while a profile runs, a background thread samples the stack of
+    every thread that is inside a stage, so browser waits, HTML parsing, downloads and CSV writes end up in separate
+    profiles even when they run concurrently. The main thread outside any stage is recorded as 'other'. Stages cost a
+    dictionary lookup when no profile is running.
+
+    Output, written to the profile folder when the run ends:
+        <stage>.collapsed         collapsed stacks, for flamegraph.pl, inferno or speedscope
+        profile.speedscope.json   every stage as one sampled profile, for https://www.speedscope.app
+        hotspots.txt              top functions by self and total time, per stage and overall
+    """
+import collections
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+OTHER = 'other'
+MAX_DEPTH = 128
+
+_profiler = None
+
+
+class StageProfiler:
+    """
+        Samples the stacks of threads inside a stage at a fixed interval.
+        Args:
+            interval: Seconds between samples.
+        """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = collections.defaultdict(collections.Counter)
+        self.thread_stages = {}
+        self.main_thread = threading.main_thread().ident
+        self.stopped = threading.Event()
+        self.thread = None
+        self.started = None
+        self.duration = 0.0
+
+    def enter(self, name):
+        marker = (name,)
+        self.thread_stages.setdefault(threading.get_ident(), []).append(marker)
+        return marker
+
+    def leave(self, marker):
+        stages = self.thread_stages.get(threading.get_ident(), [])
+        # Coroutines on one event loop can leave their stages out of order, so the marker is looked up from the end.
+        for index in range(len(stages) - 1, -1, -1):
+            if stages[index] is marker:
+                del stages[index]
+                break
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, name='profiler', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def run(self):
+        own_thread = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own_thread:
+                    continue
+                stages = self.thread_stages.get(ident)
+                if stages:
+                    name = stages[-1][0]
+                elif ident == self.main_thread:
+                    name = OTHER
+                else:
+                    continue
+                self.samples[name][stack_of(frame)] += 1
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+
+def stack_of(frame):
+    """
+        Returns the stack of a frame as a tuple of labels, outermost first.
+        """
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+
+@contextmanager
+def stage(name):
+    """
+        Marks the code inside the block as the named pipeline stage, e.g. 'fetch', 'parse' or 'download'.
+        """
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    marker = profiler.enter(name)
+    try:
+        yield
+    finally:
+        profiler.leave(marker)
+
+
+def staged(name):
+    """
+        Decorator running the whole function as the named stage.
+        """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def staged_iter(name, iterable):
+    """
+        Iterates lazily, producing each item as the named stage, e.g. media links resolved page by page.
+        """
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def write_collapsed(profiler, folder):
+    for name, stacks in profiler.samples.items():
+        with open(os.path.join(folder, f"{name}.collapsed"), 'w', encoding='utf-8') as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{';'.join(stack)} {count}\n")
+
+
+def write_speedscope(profiler, folder):
+    frames = []
+    frame_index = {}
+    profiles = []
+    for name, stacks in sorted(profiler.samples.items()):
+        samples = []
+        weights = []
+        for stack, count in stacks.items():
+            indices = []
+            for label in stack:
+                if label not in frame_index:
+                    frame_index[label] = len(frames)
+                    frames.append({'name': label})
+                indices.append(frame_index[label])
+            samples.append(indices)
+            weights.append(count * profiler.interval)
+        profiles.append({'type': 'sampled', 'name': name, 'unit': 'seconds', 'startValue': 0,
+                         'endValue': sum(weights), 'samples': samples, 'weights': weights})
+    document = {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': 'bridge_downloader',
+        'exporter': 'bridge_downloader.profiling',
+        'shared': {'frames': frames},
+        'profiles': profiles,
+    }
+    with open(os.path.join(folder, 'profile.speedscope.json'), 'w', encoding='utf-8') as f:
+        json.dump(document, f)
+
+
+def hotspots(stacks, top):
+    """
+        Ranks the functions of a set of stacks.
+        Args:
+            stacks: Counter of stack tuples.
+            top: Number of functions to return.
+        Returns:
+            Tuple (top functions by self samples, top functions by total samples), each a list of (label, samples).
+        """
+    self_samples = collections.Counter()
+    total_samples = collections.Counter()
+    for stack, count in stacks.items():
+        if stack:
+            self_samples[stack[-1]] += count
+        for label in set(stack):
+            total_samples[label] += count
+    return self_samples.most_common(top), total_samples.most_common(top)
+
+
+def report(profiler, top=15):
+    """
+        Formats the hotspot report: time per stage, then the top functions of every stage and of the whole run.
+        """
+    interval = profiler.interval
+    totals = {name: sum(stacks.values()) for name, stacks in profiler.samples.items()}
+    lines = [f"Profile of {profiler.duration:.1f} s, sampled every {interval * 1000:.0f} ms "
+             f"(stage times add up across threads)", '']
+    for name, count in sorted(totals.items(), key=lambda item: -item[1]):
+        lines.append(f"{name:<12} {count * interval:9.2f} s")
+
+    combined = collections.Counter()
+    for stacks in profiler.samples.values():
+        combined.update(stacks)
+    sections = [(name, profiler.samples[name]) for name in sorted(totals, key=lambda name: -totals[name])]
+    for name, stacks in [('all stages', combined)] + sections:
+        self_top, total_top = hotspots(stacks, top)
+        lines += ['', f"== {name}: self time", *(f"{count * interval:9.2f} s  {label}" for label, count in self_top)]
+        lines += [f"== {name}: total time", *(f"{count * interval:9.2f} s  {label}" for label, count in total_top)]
+    return '\n'.join(lines)
+
+
+@contextmanager
+def profile(folder, interval=0.005, top=15):
+    """
+        Context manager that profiles the stages run inside it and writes the results to a folder.
+        Args:
+            folder: Output folder; None or empty disables profiling.
+            interval: Seconds between samples.
+            top: Number of functions per section of the hotspot report.
+        """
+    global _profiler
+
+    if not folder:
+        yield None
+        return
+    profiler = StageProfiler(interval).start()
+    _profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _profiler = None
+        profiler.stop()
+        os.makedirs(folder, exist_ok=True)
+        write_collapsed(profiler, folder)
+        write_speedscope(profiler, folder)
+        text = report(profiler, top)
+        with open(os.path.join(folder, 'hotspots.txt'), 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        logging.info(f"Profile written to {folder}")
+        # The stage times; the function rankings are in hotspots.txt.
+        print(text.split('\n\n== ')[0])
+        print(f"Profile written to {folder}")
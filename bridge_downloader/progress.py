@@ -0,0 +1,295 @@
+"""
+    Live progress of a crawl: counters shared by every stage, a terminal dashboard and a machine-readable status.
+
+    The status is written as JSON to a file and/or served on http://127.0.0.1:PORT/status, e.g.
+        curl -s http://127.0.0.1:8700/status
+    """
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds over which the transfer rate is averaged.
+RATE_WINDOW = 10.0
+# Events kept for the dashboard.
+MAX_NOTES = 3
+
+
+class ProgressTracker:
+    """
+        Thread-safe counters of one crawl: items by outcome, work in flight per stage, transferred bytes and
+        download results per host.
+        Args:
+            unit: Name of the items in the dashboard, e.g. 'bridges' or 'queries'.
+        """
+
+    def __init__(self, unit='bridges'):
+        self.unit = unit
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.total = 0
+        self.items = collections.Counter()
+        self.in_flight = collections.Counter()
+        self.hosts = {}
+        self.bytes = 0
+        self.transfers = collections.deque()
+        self.notes = collections.deque(maxlen=MAX_NOTES)
+        self.live = False
+
+    def add_total(self, count=1):
+        with self.lock:
+            self.total += count
+
+    def item_done(self, outcome='done'):
+        """
+            Counts a finished item.
+            Args:
+                outcome: 'done', 'skipped' or 'failed'.
+            """
+        with self.lock:
+            self.items[outcome] += 1
+
+    @contextmanager
+    def stage(self, name):
+        """
+            Context manager counting one unit of work in flight in the named stage, e.g. 'detail' or 'media'.
+            """
+        with self.lock:
+            self.in_flight[name] += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.in_flight[name] -= 1
+
+    def add_bytes(self, nbytes):
+        now = time.monotonic()
+        with self.lock:
+            self.bytes += nbytes
+            self.transfers.append((now, nbytes))
+            while self.transfers and self.transfers[0][0] < now - RATE_WINDOW:
+                self.transfers.popleft()
+
+    def record_result(self, host, ok, kind='images'):
+        """
+            Counts the result of a request to a host.
+            Args:
+                host: Host the request went to.
+                ok: Whether the request succeeded.
+                kind: 'images' for media downloads, 'pages' for page fetches.
+            """
+        with self.lock:
+            counts = self.hosts.setdefault(host, collections.Counter())
+            counts[f"{kind}_ok" if ok else f"{kind}_failed"] += 1
+
+    def note(self, message):
+        """
+            Reports an event such as the bridge being processed: shown in the dashboard while it is live, printed
+            otherwise.
+            """
+        with self.lock:
+            self.notes.append(message)
+            live = self.live
+        if not live:
+            print(message)
+
+    def snapshot(self):
+        """
+            Returns the current state as a JSON-serialisable dictionary.
+            """
+        now = time.monotonic()
+        with self.lock:
+            elapsed = now - self.started
+            window = [nbytes for at, nbytes in self.transfers if at >= now - RATE_WINDOW]
+            finished = sum(self.items.values())
+            hosts = {}
+            for host, counts in self.hosts.items():
+                requests = sum(counts.values())
+                failed = counts['images_failed'] + counts['pages_failed']
+                hosts[host] = dict(counts, error_rate=round(failed / requests, 3) if requests else 0.0)
+            snapshot = {
+                'updated': time.time(),
+                'unit': self.unit,
+                'elapsed': round(elapsed, 1),
+                'items': {'total': self.total, 'done': self.items['done'], 'skipped': self.items['skipped'],
+                          'failed': self.items['failed']},
+                'images': {'done': sum(c['images_ok'] for c in self.hosts.values()),
+                           'failed': sum(c['images_failed'] for c in self.hosts.values())},
+                'in_flight': {name: count for name, count in self.in_flight.items() if count},
+                'bytes': self.bytes,
+                'mb_per_s': round(sum(window) / min(RATE_WINDOW, max(elapsed, 1e-3)) / 1e6, 3),
+                'hosts': hosts,
+                'notes': list(self.notes),
+            }
+        remaining = snapshot['items']['total'] - finished
+        snapshot['eta'] = round(remaining * elapsed / finished) if finished and remaining > 0 else None
+        return snapshot
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return '--:--'
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60:02d}:{rest % 60:02d}"
+
+
+def render(snapshot):
+    """
+        Formats a snapshot as the lines of the terminal dashboard.
+        """
+    items = snapshot['items']
+    in_flight = ', '.join(f"{name} {count}" for name, count in sorted(snapshot['in_flight'].items())) or 'idle'
+    lines = [
+        f"{snapshot['unit']} {items['done']}/{items['total']}  skipped {items['skipped']}  failed {items['failed']}  "
+        f"| images {snapshot['images']['done']} (failed {snapshot['images']['failed']})  "
+        f"| {snapshot['mb_per_s']:.2f} MB/s  | elapsed {format_duration(snapshot['elapsed'])}  "
+        f"ETA {format_duration(snapshot['eta'])}",
+        f"in flight: {in_flight}",
+    ]
+    for host, counts in sorted(snapshot['hosts'].items()):
+        lines.append(f"  {host}: {counts.get('images_ok', 0)} images, {counts.get('pages_ok', 0)} pages, "
+                     f"error rate {counts['error_rate']:.1%}")
+    lines.extend(f"> {note}" for note in snapshot['notes'])
+    return lines
+
+
+class Dashboard:
+    """
+        Refreshes the terminal view and the machine-readable status of a ProgressTracker in a background thread.
+        Args:
+            tracker: ProgressTracker to show.
+            interval: Seconds between refreshes.
+            status_path: JSON file rewritten on every refresh; None to disable.
+            port: Port of the local status endpoint on 127.0.0.1; None or 0 to disable.
+            live: Redraw the dashboard on the terminal; defaults to whether stderr is a terminal.
+        """
+
+    def __init__(self, tracker, interval=1.0, status_path=None, port=None, live=None):
+        self.tracker = tracker
+        self.interval = interval
+        self.status_path = status_path
+        self.port = port
+        self.live = sys.stderr.isatty() if live is None else live
+        self.stopped = threading.Event()
+        self.thread = None
+        self.server = None
+        self.drawn_lines = 0
+
+    def start(self):
+        if self.port:
+            from http.server import ThreadingHTTPServer
+
+            self.server = ThreadingHTTPServer(('127.0.0.1', self.port), self.handler())
+            threading.Thread(target=self.server.serve_forever, name='status-endpoint', daemon=True).start()
+            logging.info(f"Status endpoint on http://127.0.0.1:{self.port}/status")
+        with self.tracker.lock:
+            self.tracker.live = self.live
+        self.thread = threading.Thread(target=self.run, name='dashboard', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.refresh()
+        with self.tracker.lock:
+            self.tracker.live = False
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.refresh()
+
+    def refresh(self):
+        snapshot = self.tracker.snapshot()
+        if self.live:
+            self.draw(render(snapshot))
+        if self.status_path:
+            try:
+                write_status(self.status_path, snapshot)
+            except OSError as e:
+                logging.warning(f"Could not write the status file {self.status_path}: {e}")
+
+    def draw(self, lines):
+        # Move the cursor back to the first line of the previous frame and clear everything below it.
+        prefix = f"\x1b[{self.drawn_lines}F\x1b[J" if self.drawn_lines else ''
+        sys.stderr.write(prefix + '\n'.join(lines) + '\n')
+        sys.stderr.flush()
+        self.drawn_lines = len(lines)
+
+    def handler(self):
+        from http.server import BaseHTTPRequestHandler
+
+        tracker = self.tracker
+
+        class StatusHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('', '/status'):
+                    self.send_error(404)
+                    return
+                body = json.dumps(tracker.snapshot()).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return StatusHandler
+
+
+def write_status(path, snapshot):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, indent=2)
+    os.replace(temp_path, path)
+
+
+_progress = ProgressTracker()
+
+
+def get_progress():
+    """
+        Returns the process-wide ProgressTracker.
+        """
+    return _progress
+
+
+@contextmanager
+def show_progress(enabled=True, status_path=None, port=None, interval=1.0, unit='bridges'):
+    """
+        Context manager around one run: starts a fresh process-wide tracker and, if anything is to be shown, its
+        dashboard, which draws a final frame when the run ends.
+        Args:
+            enabled: Redraw the live view on the terminal (only when stderr is a terminal).
+            status_path: JSON status file; empty or None to disable.
+            port: Port of the local status endpoint; 0 or None to disable.
+            interval: Seconds between refreshes.
+            unit: Name of the items in the dashboard.
+        Returns:
+            Context manager yielding the ProgressTracker of the run.
+        """
+    global _progress
+
+    _progress = ProgressTracker(unit)
+    live = sys.stderr.isatty() if enabled else False
+    dashboard = None
+    if live or status_path or port:
+        dashboard = Dashboard(_progress, interval, status_path or None, port or None, live).start()
+    try:
+        yield _progress
+    finally:
+        if dashboard is not None:
+            dashboard.stop()
@@ -0,0 +1,112 @@
+"""
+    Runs the site parsers over the pages of a recorded crawl, offline and at disk speed.
+
+    Usage:
+        python -m bridge_downloader.replay DIR --site SITE [--repeat N] [--show N]
+
+    Every HTML page in the WARC files of DIR is parsed and handed to the parsers its URL calls for, e.g. listing pages
+    to get_bridge_links() and bridge pages to get_bridge_info(). The report counts pages and extracted items per page
+    kind, splits the time between HTML parsing and extraction, and lists the pages a parser failed on. The exit status
+    is 1 if any parser failed, so a parser change can be checked against the pages of a production run.
+
+    To replay a whole crawl, downloads included, pass --replay DIR to python -m bridge_downloader or a script.
+    """
+import argparse
+import collections
+import sys
+import time
+from urllib.parse import urlsplit
+
+from .sites import bing, historicbridges, structurae
+from .warc import WarcArchive
+
+
+def parse_structurae(url, soup, base_url):
+    if '/liste' in url:
+        return 'listing', len(structurae.get_bridge_links(soup, base_url))
+    if url.rstrip('/').endswith(('/medien', '/media')):
+        return 'media', len(structurae.get_image_data(soup))
+    if structurae.get_download_link(soup):
+        return 'image', 1
+    language = 'English' if '/en/' in url else 'Deutsch'
+    structurae.get_en_link(soup)
+    return 'bridge', len(structurae.get_bridge_info(soup, language))
+
+
+def parse_historicbridges(url, soup, base_url):
+    if 'b_a_list.php' in url:
+        return 'listing', len(historicbridges.get_bridge_links(soup, base_url))
+    historicbridges.get_bridge_name(soup)
+    historicbridges.get_bridge_images(soup, base_url)
+    return 'bridge', len(historicbridges.get_bridge_info(soup))
+
+
+def parse_bing(url, soup, base_url):
+    return 'results', len(bing.get_high_res_image_urls(bing.get_image_data(soup)))
+
+
+PAGE_PARSERS = {
+    'structurae': parse_structurae,
+    'historicbridges': parse_historicbridges,
+    'bing': parse_bing,
+}
+
+
+def replay_parsers(archive, site, repeat=1):
+    """
+        Parses every archived HTML page with the parsers of a site.
+        Args:
+            archive: WarcArchive to read.
+            site: Key of PAGE_PARSERS.
+            repeat: Number of passes over the pages, for steadier timings.
+        Returns:
+            Tuple (per kind Counter of 'pages' and 'items', Counter of 'html' and 'extract' seconds, list of
+            (URL, error) failures).
+        """
+    from bs4 import BeautifulSoup
+
+    parse_page = PAGE_PARSERS[site]
+    pages = list(archive.html_pages())
+    kinds = collections.defaultdict(collections.Counter)
+    timings = collections.Counter()
+    failures = []
+    for _ in range(repeat):
+        for url, html in pages:
+            start = time.perf_counter()
+            soup = BeautifulSoup(html, 'html.parser')
+            parsed = time.perf_counter()
+            timings['html'] += parsed - start
+            try:
+                kind, items = parse_page(url, soup, '{0.scheme}://{0.netloc}'.format(urlsplit(url)))
+                kinds[kind]['pages'] += 1
+                kinds[kind]['items'] += items
+            except Exception as e:
+                failures.append((url, f"{type(e).__name__}: {e}"))
+            timings['extract'] += time.perf_counter() - parsed
+    return kinds, timings, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1].strip())
+    parser.add_argument('folder', help='folder of the WARC files')
+    parser.add_argument('--site', required=True, choices=sorted(PAGE_PARSERS), help='site the pages come from')
+    parser.add_argument('--repeat', type=int, default=1, help='passes over the pages (default: 1)')
+    parser.add_argument('--show', type=int, default=10, help='failures to list (default: 10)')
+    args = parser.parse_args()
+
+    kinds, timings, failures = replay_parsers(WarcArchive(args.folder), args.site, args.repeat)
+    total_pages = sum(counts['pages'] for counts in kinds.values()) + len(failures)
+    seconds = timings['html'] + timings['extract']
+    for kind, counts in sorted(kinds.items()):
+        print(f"{kind:<10} {counts['pages']:>7} pages {counts['items']:>9} items")
+    print(f"{total_pages} pages in {seconds:.2f} s ({total_pages / max(seconds, 1e-9):.0f} pages/s): "
+          f"HTML parsing {timings['html']:.2f} s, extraction {timings['extract']:.2f} s")
+    if failures:
+        print(f"{len(failures)} pages failed:")
+        for url, error in failures[:args.show]:
+            print(f"  {url}: {error}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import concurrent.futures
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from .tuning import ConcurrencyLimit, ConcurrencyTuner
+
+
+class TokenBucket:
+    """
+        Thread-safe token bucket used for the process-wide bandwidth and request-rate budgets.
+        Args:
+            rate: Tokens (bytes or requests) added per second. None or 0 disables the limit.
+            capacity: Maximum burst size; defaults to one second worth of tokens.
+        """
+
+    def __init__(self, rate=None, capacity=None):
+        self.rate = rate or 0
+        self.capacity = capacity or self.rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        """
+            Blocks until `amount` tokens are available and takes them.
+            Args:
+                amount: Number of tokens to take.
+            """
+        if not self.rate or amount <= 0:
+            return
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # Requests larger than the bucket are let through once the bucket is full.
+                needed = min(amount, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return
+                wait = (needed - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Scheduler:
+    """
+        Shared concurrency and bandwidth budget for every site crawled in this process.
+        Args:
+            max_connections: Maximum number of simultaneous network transfers across all sites.
+            max_bytes_per_second: Bandwidth budget for response bodies; None for unlimited.
+            max_requests_per_second: Global request rate limit; None for unlimited.
+            item_workers: Number of bridges (or queries) processed concurrently.
+            download_workers: Number of threads for media downloads; defaults to max_connections.
+            item_time_budget: Seconds the media downloads of one item may take in total; None for unlimited.
+            autotune_max: If set, the number of connections starts at max_connections and is tuned at runtime
+                between autotune_min and autotune_max to the measured throughput and error rate.
+            autotune_min: Lowest number of connections the tuner may choose.
+            autotune_interval: Seconds between tuning steps.
+        """
+
+    def __init__(self, max_connections=8, max_bytes_per_second=None, max_requests_per_second=None, item_workers=1,
+                 download_workers=None, item_time_budget=None, autotune_max=None, autotune_min=1,
+                 autotune_interval=5.0):
+        self.max_connections = max_connections
+        self.item_time_budget = item_time_budget
+        self.connections = ConcurrencyLimit(max_connections)
+        self.bandwidth = TokenBucket(max_bytes_per_second)
+        self.request_rate = TokenBucket(max_requests_per_second)
+        self.tuner = None
+        if autotune_max:
+            self.tuner = ConcurrencyTuner(self.connections, autotune_min, autotune_max, autotune_interval).start()
+        self.item_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=item_workers, thread_name_prefix='item')
+        self.download_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=download_workers or max(max_connections, autotune_max or 0), thread_name_prefix='download')
+
+    @contextmanager
+    def connection(self):
+        """
+            Context manager that holds one of the shared connection slots for the duration of a transfer.
+            Entering it also counts one request against the global request rate.
+            """
+        self.request_rate.consume(1)
+        self.connections.acquire()
+        try:
+            yield
+        finally:
+            self.connections.release()
+
+    def throttle(self, nbytes):
+        """
+            Charges transferred bytes against the bandwidth budget, sleeping if it is exhausted.
+            Args:
+                nbytes: Number of bytes just transferred.
+            """
+        self.bandwidth.consume(nbytes)
+        if self.tuner is not None:
+            self.tuner.record_bytes(nbytes)
+
+    def record_download(self, ok):
+        """
+            Reports the outcome of a media download to the concurrency tuner.
+            Args:
+                ok: False if the download failed in a way more connections can cause: a timeout, an abandoned or
+                    broken transfer, HTTP 429 or a server error.
+            """
+        if self.tuner is not None:
+            self.tuner.record_result(ok)
+
+    # Work runs in the context of its submitter, so the log fields of an item carry over to its downloads.
+    def submit_item(self, fn, *args, **kwargs):
+        return self.item_executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    def submit_download(self, fn, *args, **kwargs):
+        return self.download_executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        if self.tuner is not None:
+            self.tuner.stop()
+            self.tuner = None
+        self.item_executor.shutdown(wait=wait)
+        self.download_executor.shutdown(wait=wait)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def configure_scheduler(**kwargs):
+    """
+        Replaces the process-wide scheduler.
+        Args:
+            kwargs: Passed on to Scheduler().
+        Returns:
+            The new Scheduler instance.
+        """
+    global _scheduler
+
+    with _scheduler_lock:
+        previous = _scheduler
+        _scheduler = Scheduler(**kwargs)
+    if previous is not None:
+        previous.shutdown(wait=False)
+    return _scheduler
+
+
+def get_scheduler():
+    """
+        Returns the process-wide scheduler, creating one with default limits on first use.
+        """
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
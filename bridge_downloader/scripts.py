@@ -0,0 +1,79 @@
+"""
+    Command-line handling shared by the downloader scripts: configuration lookup, settings overrides and a
+    non-interactive mode for scheduled runs.
+    """
+import argparse
+
+from .config import load_config, parse_overrides, resolve_config_path
+
+
+def script_parser(description, default_config, env_var):
+    """
+        Creates the argument parser of a downloader script with the options every script shares.
+        Args:
+            description: Description shown by --help.
+            default_config: Default configuration file name.
+            env_var: Environment variable that may hold the configuration path.
+        Returns:
+            argparse.ArgumentParser; scripts add their own options before parsing.
+        """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--config', help=f'configuration file (default: ${env_var} or {default_config})')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='override a configuration value, e.g. --set total_workers=8 (repeatable)')
+    parser.add_argument('--non-interactive', action='store_true',
+                        help='never prompt; missing choices are an error and the script runs once')
+    parser.add_argument('--profile', metavar='DIR', help='profile the pipeline stages and write the results to DIR')
+    parser.add_argument('--status-file', help='JSON file the progress status is written to')
+    parser.add_argument('--status-port', type=int, help='serve the progress status on http://127.0.0.1:PORT/status')
+    parser.add_argument('--no-dashboard', action='store_true', help='do not draw the live progress view')
+    parser.add_argument('--record', metavar='DIR', help='record all traffic to compressed WARC files in DIR')
+    parser.add_argument('--replay', metavar='DIR', help='serve all requests from the WARC files in DIR, offline')
+    parser.set_defaults(default_config=default_config, env_var=env_var)
+    return parser
+
+
+def load_script_config(args):
+    """
+        Loads the configuration selected by the parsed arguments and applies the command-line overrides.
+        Args:
+            args: Namespace returned by the parser of script_parser().
+        Returns:
+            Dictionary with the configuration.
+        """
+    try:
+        overrides = parse_overrides(args.set)
+    except ValueError as e:
+        raise SystemExit(f"Invalid --set: {e}")
+    if args.profile:
+        overrides['profile_dir'] = args.profile
+    if args.status_file:
+        overrides['status_file'] = args.status_file
+    if args.status_port:
+        overrides['status_port'] = args.status_port
+    if args.no_dashboard:
+        overrides['dashboard'] = False
+    if args.record:
+        overrides['warc_record_dir'] = args.record
+    if args.replay:
+        overrides['warc_replay_dir'] = args.replay
+    return load_config(resolve_config_path(args.config, args.env_var, args.default_config), overrides=overrides)
+
+
+def ask(value, question, interactive=True):
+    """
+        Returns a choice given on the command line, or asks for it.
+        Args:
+            value: Value from the command line, or None.
+            question: Prompt shown when asking.
+            interactive: Whether prompting is allowed.
+        Returns:
+            The value, or the answer as a string.
+        Raises:
+            SystemExit: If the value is missing and prompting is not allowed.
+        """
+    if value is not None:
+        return value
+    if not interactive:
+        raise SystemExit(f"Missing a value for '{question.strip()}' in non-interactive mode, see --help")
+    return input(question)
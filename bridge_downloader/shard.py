@@ -0,0 +1,234 @@
+"""
+    Spreads a crawl over several processes or machines through a lease-based work queue.
+
+    Usage:
+        python -m bridge_downloader.shard [options] enqueue SITE=TARGET[:COUNT] [SITE=TARGET[:COUNT] ...]
+        python -m bridge_downloader.shard [options] work [--batch-size N] [--lease SECONDS] [--wait]
+        python -m bridge_downloader.shard [options] merge
+        python -m bridge_downloader.shard [options] status
+
+    The coordinator enumerates the bridge URLs into the queue (enqueue). Any number of workers, on any machine that
+    sees the queue file and the image folders, claim batches of URLs and download them (work). Workers do not touch
+    the summary; merge writes the records they report into one summary and the template outputs, in queue order.
+    """
+import argparse
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import as_completed
+
+from .cli import add_engine_arguments, load_adapter, parse_job, setup_engine
+from .client import close_sessions
+from .crawl import fetch_item, write_item_metadata
+from .logs import log_fields
+from .profiling import profile
+from .progress import get_progress, show_progress
+from .storage import create_folder, get_existing_items
+from .workqueue import DONE, FAILED, LEASED, PENDING, WorkQueue
+
+
+class LeaseKeeper(threading.Thread):
+    """
+        Background thread renewing the leases of the tasks a worker is processing, every third of the lease time.
+        Args:
+            queue: WorkQueue the tasks were claimed from.
+            worker: Name of the worker.
+            lease_seconds: Lease duration.
+        """
+
+    def __init__(self, queue, worker, lease_seconds):
+        super().__init__(name='lease-keeper', daemon=True)
+        self.queue = queue
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self.task_ids = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def hold(self, task_ids):
+        with self.lock:
+            self.task_ids.update(task_ids)
+
+    def release(self, task_id):
+        with self.lock:
+            self.task_ids.discard(task_id)
+
+    def run(self):
+        while not self.stopped.wait(self.lease_seconds / 3):
+            with self.lock:
+                task_ids = list(self.task_ids)
+            if not task_ids:
+                continue
+            try:
+                renewed = self.queue.renew(self.worker, task_ids, self.lease_seconds)
+                if renewed < len(task_ids):
+                    logging.warning(f"{len(task_ids) - renewed} leases of {self.worker} were lost")
+            except Exception as e:
+                logging.error(f"Failed to renew leases: {e}")
+
+    def stop(self):
+        self.stopped.set()
+
+
+def enqueue(queue, jobs, args):
+    """
+        Coordinator: enumerates the items of every job into the queue.
+        Args:
+            queue: WorkQueue.
+            jobs: List of (site, target, limit) tuples.
+            args: Parsed engine options.
+        """
+    adapters = {}
+    for site, target, limit in jobs:
+        adapter = load_adapter(args, site, adapters)
+        try:
+            added = queue.enqueue(site, target, adapter.iter_items(target, limit))
+        except Exception as e:
+            logging.error(f"An error occurred while listing {site} target {target}: {e}")
+            print(f"{site} {target}: listing failed, see log")
+            continue
+        print(f"{site} {target}: {added} new items queued")
+
+
+def work(queue, args, scheduler):
+    """
+        Worker: claims batches of tasks and downloads them until the queue is drained.
+        Args:
+            queue: WorkQueue.
+            args: Parsed engine and worker options.
+            scheduler: Shared Scheduler.
+        Returns:
+            Number of items this worker completed.
+        """
+    worker = args.worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    keeper = LeaseKeeper(queue, worker, args.lease)
+    keeper.start()
+    adapters = {}
+    completed = 0
+    progress = get_progress()
+
+    try:
+        while True:
+            tasks = queue.claim(worker, args.batch_size, args.lease, args.site)
+            if not tasks:
+                counts = queue.counts()
+                if not args.wait and not counts[PENDING] and not counts[LEASED]:
+                    break
+                # Other workers still hold leases that may expire and come back to the queue.
+                time.sleep(args.poll_interval)
+                continue
+
+            keeper.hold(task_id for task_id, _, _, _ in tasks)
+            progress.add_total(len(tasks))
+            existing_items = {}
+            futures = {}
+            for task_id, site, url, attempt in tasks:
+                adapter = load_adapter(args, site, adapters)
+                if site not in existing_items:
+                    create_folder(adapter.image_folder)
+                    existing_items[site] = get_existing_items(adapter.image_folder)
+                # A retried task (failed, or reclaimed from a dead worker) may have left its folder behind without
+                # finishing, so only first attempts may be skipped for an existing folder.
+                skip_folders = existing_items[site] if attempt == 1 else set()
+                with log_fields(site=site, item=url, worker=worker):
+                    future = scheduler.submit_item(fetch_item, adapter, url, skip_folders, scheduler)
+                futures[future] = (task_id, site, url)
+
+            for future in as_completed(futures):
+                task_id, site, url = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.error(f"An error occurred while processing {site} item {url}: {e}")
+                    queue.fail(worker, task_id, e, args.max_attempts)
+                    progress.item_done('failed')
+                else:
+                    if result is None:
+                        report = {'skipped': True}
+                        progress.item_done('skipped')
+                    else:
+                        progress.item_done()
+                        record, media_count, downloaded = result
+                        report = {'id': record['id'], 'url': record['url'], 'info': record['info'],
+                                  'media_count': media_count, 'downloaded': downloaded}
+                    if queue.complete(worker, task_id, report):
+                        completed += 1
+                    else:
+                        logging.warning(f"Lease of {site} item {url} was lost, result discarded")
+                keeper.release(task_id)
+    finally:
+        keeper.stop()
+
+    logging.info(f"Worker {worker} finished after {completed} items")
+    return completed
+
+
+def merge(queue, args):
+    """
+        Writes the records reported by the workers into the summary and template outputs, once each.
+        Args:
+            queue: WorkQueue.
+            args: Parsed engine options.
+        Returns:
+            Number of records merged.
+        """
+    adapters = {}
+    merged = 0
+    for task_id, site, result in queue.unmerged_results():
+        if not result.get('skipped'):
+            write_item_metadata(load_adapter(args, site, adapters), result)
+            merged += 1
+        queue.mark_merged(task_id)
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m bridge_downloader.shard',
+                                     description=__doc__.splitlines()[1].strip())
+    parser.add_argument('--queue', default='crawl_queue.sqlite', help='work queue database (default: %(default)s)')
+    add_engine_arguments(parser)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = commands.add_parser('enqueue', help='enumerate items into the queue')
+    enqueue_parser.add_argument('jobs', nargs='+', type=parse_job, metavar='SITE=TARGET[:COUNT]')
+
+    work_parser = commands.add_parser('work', help='claim and download queued items')
+    work_parser.add_argument('--batch-size', type=int, default=8, help='tasks claimed at once (default: 8)')
+    work_parser.add_argument('--lease', type=float, default=300, help='lease duration in seconds (default: 300)')
+    work_parser.add_argument('--max-attempts', type=int, default=3,
+                             help='attempts before a task is marked failed (default: 3)')
+    work_parser.add_argument('--poll-interval', type=float, default=5,
+                             help='seconds between claims while the queue is empty (default: 5)')
+    work_parser.add_argument('--wait', action='store_true', help='keep polling when the queue is empty')
+    work_parser.add_argument('--site', action='append', help='only claim tasks of this site (repeatable)')
+    work_parser.add_argument('--worker-id', help='worker name (default: host-pid-random)')
+
+    commands.add_parser('merge', help='write finished records into the summary')
+    commands.add_parser('status', help='show the number of tasks per status')
+    args = parser.parse_args()
+
+    scheduler = setup_engine(args, 'bridge_downloader_shard.log')
+    queue = WorkQueue(args.queue)
+    try:
+        if args.command == 'enqueue':
+            enqueue(queue, args.jobs, args)
+        elif args.command == 'work':
+            with profile(args.profile, args.profile_interval / 1000), \
+                    show_progress(not args.no_dashboard, args.status_file, args.status_port):
+                completed = work(queue, args, scheduler)
+            print(f"{completed} items done")
+        elif args.command == 'merge':
+            print(f"{merge(queue, args)} records merged into the summary")
+        counts = queue.counts()
+        print(', '.join(f"{status}: {counts[status]}" for status in (PENDING, LEASED, DONE, FAILED)))
+    finally:
+        queue.close()
+        scheduler.shutdown()
+        close_sessions()
+
+
+if __name__ == '__main__':
+    main()
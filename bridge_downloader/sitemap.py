@@ -0,0 +1,353 @@
+"""
+    Enumerates the structures of structurae from its XML sitemaps, without a browser.
+
+    Usage:
+        python -m bridge_downloader.sitemap sync [--sitemap URL]
+        python -m bridge_downloader.sitemap classify [--limit N]
+        python -m bridge_downloader.sitemap list [--type TEXT] [--country TEXT] [--since DATE] [--limit N]
+        python -m bridge_downloader.sitemap status
+
+    sync streams the sitemap index and every sitemap it lists over plain HTTP and stores each /bauwerke/ URL with its
+    last-modified date in the sitemap_urls table of the crawl-state database. A URL whose date changed is marked as
+    modified, so later syncs show what is new. classify fetches the pages not classified yet, again over plain HTTP,
+    and stores the texts of their typology and location tables; crawled bridges are classified on the way. list
+    filters the classified pages by type and country offline. The crawl target structurae=sitemap[/TYPE[/COUNTRY]]
+    and the type and country modes of downloader-structurae.py take the classified matches first and classify further
+    pages only as far as their limit needs, e.g.
+
+        python -m bridge_downloader structurae=sitemap/bogenbruecke/frankreich:200
+    """
+import argparse
+import concurrent.futures
+import logging
+import threading
+import time
+import zlib
+from xml.etree.ElementTree import XMLPullParser
+
+from . import client
+from .scheduler import get_scheduler
+from .state import connect
+from .units import fold_umlauts
+
+# Rows written per transaction while syncing.
+BATCH_SIZE = 1000
+# Unclassified pages fetched at a time when a filtered selection has to classify more of them.
+CLASSIFY_BATCH_SIZE = 100
+
+
+def fold(text):
+    return fold_umlauts(text or '').lower()
+
+
+def parse_sitemap(chunks):
+    """
+        Parses a sitemap or sitemap index incrementally, so large files never have to be held in memory.
+        Gzip-compressed sitemaps (.xml.gz) are decompressed on the fly.
+        Args:
+            chunks: Iterator over the body chunks.
+        Returns:
+            Generator of (kind, loc, lastmod), kind being 'url' for a page and 'sitemap' for a nested sitemap.
+        """
+    parser = XMLPullParser(events=('end',))
+    decompressor = None
+    first = True
+    for chunk in chunks:
+        if first:
+            first = False
+            if chunk[:2] == b'\x1f\x8b':
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)
+        parser.feed(decompressor.decompress(chunk) if decompressor else chunk)
+        for _, element in parser.read_events():
+            kind = element.tag.rpartition('}')[2]
+            if kind not in ('url', 'sitemap'):
+                continue
+            values = {child.tag.rpartition('}')[2]: (child.text or '').strip() for child in element}
+            element.clear()
+            if values.get('loc'):
+                yield kind, values['loc'], values.get('lastmod') or None
+    parser.close()
+
+
+def iter_sitemap(url, user_agent, seen=None):
+    """
+        Streams the page URLs of a sitemap, following the nested sitemaps of a sitemap index.
+        Args:
+            url: URL of the sitemap or sitemap index.
+            user_agent: User-Agent header to send.
+            seen: Sitemaps already read, to guard against cycles.
+        Returns:
+            Generator of (loc, lastmod).
+        """
+    seen = set() if seen is None else seen
+    if url in seen:
+        return
+    seen.add(url)
+    scheduler = get_scheduler()
+    nested = []
+    headers = {'User-Agent': user_agent, 'Accept-Encoding': client.HTML_ACCEPT_ENCODING}
+    with scheduler.connection(), client.open_stream(url, headers) as chunks:
+        def throttled():
+            for chunk in chunks:
+                scheduler.throttle(len(chunk))
+                yield chunk
+
+        for kind, loc, lastmod in parse_sitemap(throttled()):
+            if kind == 'sitemap':
+                nested.append(loc)
+            else:
+                yield loc, lastmod
+    logging.info(f"Read sitemap {url}", extra={'url': url, 'stage': 'sitemap'})
+    for nested_url in nested:
+        try:
+            yield from iter_sitemap(nested_url, user_agent, seen)
+        except Exception as e:
+            logging.error(f"Error reading sitemap {nested_url}: {e}")
+
+
+class SitemapStore:
+    """
+        The URLs found in the sitemaps of a site, with their last-modified dates and, once classified, the typology
+        and location texts they can be filtered by.
+        Args:
+            db_path: Path of the crawl-state database.
+        """
+
+    def __init__(self, db_path):
+        self.db = connect(db_path)
+        self.lock = threading.Lock()
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS sitemap_urls (
+                site TEXT NOT NULL,
+                url TEXT NOT NULL,
+                lastmod TEXT,
+                seen REAL,
+                changed REAL,
+                typology TEXT,
+                location TEXT,
+                classified REAL,
+                PRIMARY KEY (site, url)
+            );
+            CREATE INDEX IF NOT EXISTS sitemap_urls_changed ON sitemap_urls (site, changed);
+        ''')
+
+    def add(self, site, entries, seen):
+        """
+            Stores a batch of sitemap entries. New URLs and URLs with a different last-modified date get their
+            changed time set to seen.
+            Args:
+                site: Site name.
+                entries: List of (URL, lastmod).
+                seen: Time of the sync.
+            """
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                self.db.executemany(
+                    'INSERT INTO sitemap_urls (site, url, lastmod, seen, changed) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (site, url) DO UPDATE SET seen = excluded.seen, '
+                    'changed = CASE WHEN lastmod IS excluded.lastmod THEN changed ELSE excluded.seen END, '
+                    'lastmod = excluded.lastmod',
+                    [(site, url, lastmod, seen, seen) for url, lastmod in entries])
+                self.db.execute('COMMIT')
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+
+    def classify(self, site, url, typology, location):
+        """
+            Stores the typology and location texts of a URL; both are empty for pages that are no structure.
+            """
+        with self.lock:
+            self.db.execute('UPDATE sitemap_urls SET typology = ?, location = ?, classified = ? '
+                            'WHERE site = ? AND url = ?', (fold(typology), fold(location), time.time(), site, url))
+
+    def select(self, site, bridge_type=None, country=None, since=None, unclassified=False, limit=None, urls=None):
+        """
+            Returns stored URLs, oldest first.
+            Args:
+                site: Site name.
+                bridge_type: Text the typology must contain, e.g. 'bogenbruecke'; umlauts may be written either way.
+                country: Text the location must contain, e.g. 'frankreich'.
+                since: Only URLs whose lastmod is this ISO date or later.
+                unclassified: Only URLs that were not classified yet.
+                limit: Maximum number of URLs.
+                urls: Only URLs among these.
+            Returns:
+                List of URLs.
+            """
+        conditions, parameters = ['site = ?'], [site]
+        if urls is not None:
+            conditions.append(f"url IN ({', '.join('?' * len(urls))})")
+            parameters.extend(urls)
+        if unclassified:
+            conditions.append('classified IS NULL')
+        else:
+            # Pages that turned out not to be structures have an empty typology.
+            conditions.append("(classified IS NULL OR typology != '')" if not (bridge_type or country) else
+                              "typology != ''")
+        for column, text in (('typology', bridge_type), ('location', country)):
+            if text:
+                conditions.append(f"instr({column}, ?) > 0")
+                parameters.append(fold(text))
+        if since:
+            conditions.append('lastmod >= ?')
+            parameters.append(since)
+        query = f"SELECT url FROM sitemap_urls WHERE {' AND '.join(conditions)} ORDER BY rowid"
+        if limit is not None:
+            query += ' LIMIT ?'
+            parameters.append(limit)
+        with self.lock:
+            return [row[0] for row in self.db.execute(query, parameters)]
+
+    def counts(self, site, since=None):
+        """
+            Returns a dictionary with the number of stored, changed (since the given time), classified and
+            structure URLs of a site.
+            """
+        with self.lock:
+            row = self.db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(changed >= ?), 0), COUNT(classified), '
+                "COALESCE(SUM(typology != ''), 0) FROM sitemap_urls WHERE site = ?", (since or 0, site)).fetchone()
+        return dict(zip(('urls', 'changed', 'classified', 'structures'), row))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def sync(store, site, sitemap_url, user_agent, base_url):
+    """
+        Streams the structure URLs of the sitemaps into the store.
+        Returns:
+            Dictionary of counts as returned by SitemapStore.counts(), 'changed' counting URLs new or modified since
+            the last sync.
+        """
+    from .sites.structurae import get_structure_url
+
+    started = time.time()
+    batch = []
+    for loc, lastmod in iter_sitemap(sitemap_url, user_agent):
+        url = get_structure_url(loc, base_url)
+        if url is None:
+            continue
+        batch.append((url, lastmod))
+        if len(batch) >= BATCH_SIZE:
+            store.add(site, batch, started)
+            batch = []
+    if batch:
+        store.add(site, batch, started)
+    return store.counts(site, started)
+
+
+def classify(store, site, urls, user_agent, scheduler):
+    """
+        Fetches pages over plain HTTP and stores their typology and location texts.
+        Returns:
+            Number of pages classified as structures.
+        """
+    from .sites.structurae import get_structure_classification
+
+    def classify_url(url):
+        try:
+            classification = get_structure_classification(client.fetch_soup(url, user_agent))
+        except Exception as e:
+            logging.error(f"Error classifying {url}: {e}")
+            return False
+        typology, location = classification or ('', '')
+        store.classify(site, url, typology, location)
+        return classification is not None
+
+    futures = [scheduler.submit_item(classify_url, url) for url in urls]
+    return sum(1 for future in concurrent.futures.as_completed(futures) if future.result())
+
+
+def iter_matching(store, site, bridge_type, country, user_agent, scheduler, limit=None, since=None):
+    """
+        Yields the stored structure URLs whose typology and location contain the given texts. The classified
+        matches come first; unclassified URLs are then classified batch by batch, only until the limit is reached,
+        so a filtered crawl does not need a full classify pass first.
+        Args:
+            store: SitemapStore.
+            site: Site name.
+            bridge_type: Text the typology must contain, or None.
+            country: Text the location must contain, or None.
+            user_agent: User-Agent header sent when classifying.
+            scheduler: Scheduler the classification fetches run on.
+            limit: Maximum number of URLs.
+            since: Only URLs whose lastmod is this ISO date or later.
+        """
+    count = 0
+    for url in store.select(site, bridge_type, country, since, limit=limit):
+        yield url
+        count += 1
+    if not (bridge_type or country):
+        return
+    # Read up front, so pages whose classification fails are not fetched again in the same run.
+    unclassified = store.select(site, since=since, unclassified=True)
+    for start in range(0, len(unclassified), CLASSIFY_BATCH_SIZE):
+        if limit is not None and count >= limit:
+            return
+        batch = unclassified[start:start + CLASSIFY_BATCH_SIZE]
+        classify(store, site, batch, user_agent, scheduler)
+        for url in store.select(site, bridge_type, country, urls=batch):
+            if limit is not None and count >= limit:
+                return
+            yield url
+            count += 1
+
+
+def main():
+    from .cli import add_engine_arguments, setup_engine
+    from .config import load_config
+
+    parser = argparse.ArgumentParser(prog='python -m bridge_downloader.sitemap',
+                                     description=__doc__.splitlines()[1].strip())
+    parser.add_argument('--state-db', help='crawl-state database (default: crawl_state_db of the structurae config)')
+    add_engine_arguments(parser)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    sync_parser = commands.add_parser('sync', help='stream the sitemap URLs into the crawl-state database')
+    sync_parser.add_argument('--sitemap', help='sitemap or sitemap index URL (default: sitemap_url of the config)')
+
+    classify_parser = commands.add_parser('classify', help='fetch the type and location of unclassified pages')
+    classify_parser.add_argument('--limit', type=int, help='pages to classify (default: all)')
+
+    list_parser = commands.add_parser('list', help='print stored structure URLs')
+    list_parser.add_argument('--type', help='text the typology contains, e.g. bogenbruecke')
+    list_parser.add_argument('--country', help='text the location contains, e.g. frankreich')
+    list_parser.add_argument('--since', help='only URLs modified on or after this ISO date')
+    list_parser.add_argument('--limit', type=int, help='URLs to print (default: all)')
+
+    commands.add_parser('status', help='show the number of stored and classified URLs')
+    args = parser.parse_args()
+
+    config = load_config(args.structurae_config)
+    store = SitemapStore(args.state_db or config['crawl_state_db'])
+    scheduler = setup_engine(args, 'bridge_downloader_sitemap.log')
+    start = time.perf_counter()
+    try:
+        if args.command == 'sync':
+            counts = sync(store, 'structurae', args.sitemap or config['sitemap_url'], config['user_agent'],
+                          config['base_URL'] + '/de')
+            print(f"{counts['urls']} structure URLs stored, {counts['changed']} new or modified, "
+                  f"in {time.perf_counter() - start:.1f} s")
+        elif args.command == 'classify':
+            urls = store.select('structurae', unclassified=True, limit=args.limit)
+            structures = classify(store, 'structurae', urls, config['user_agent'], scheduler)
+            print(f"{len(urls)} pages fetched, {structures} structures classified "
+                  f"in {time.perf_counter() - start:.1f} s")
+        elif args.command == 'list':
+            for url in store.select('structurae', args.type, args.country, args.since, limit=args.limit):
+                print(url)
+        else:
+            counts = store.counts('structurae')
+            print(f"{counts['urls']} URLs, {counts['classified']} classified, {counts['structures']} structures")
+    finally:
+        store.close()
+        scheduler.shutdown()
+        client.close_sessions()
+
+
+if __name__ == '__main__':
+    main()
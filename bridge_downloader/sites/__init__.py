@@ -0,0 +1,25 @@
+from .bing import BingAdapter
+from .historicbridges import HistoricBridgesAdapter
+from .structurae import StructuraeAdapter
+
+# Adapter class and default configuration file of every supported site.
+SITES = {
+    'bing': (BingAdapter, 'config_bing.json'),
+    'historicbridges': (HistoricBridgesAdapter, 'config_his.json'),
+    'structurae': (StructuraeAdapter, 'config.json'),
+}
+
+
+def create_adapter(site, config):
+    """
+        Instantiates the adapter of a site.
+        Args:
+            site: Site name, one of SITES.
+            config: Site configuration dictionary.
+        Returns:
+            SiteAdapter instance.
+        """
+    if site not in SITES:
+        raise ValueError(f"Unknown site '{site}', expected one of {', '.join(SITES)}")
+    adapter_class, _ = SITES[site]
+    return adapter_class(config)
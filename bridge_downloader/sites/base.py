@@ -0,0 +1,145 @@
+from .. import metadata
+
+
+class SiteAdapter:
+    """
+        Base class of the per-site adapters driven by the crawl engine.
+
+        An adapter only knows how to read one site: it enumerates items (bridges or search queries) for a target,
+        turns an item into a record with its metadata, and lists the media URLs of a record. Fetch scheduling,
+        storage, downloads and metadata output are handled by the engine.
+        Args:
+            config: Site configuration dictionary.
+        """
+
+    name = None
+    number_column = 'Bridge Number'
+    # Items whose folder already exists are not crawled again.
+    skip_existing = True
+    # SpatialIndex the locations of crawled items are stored in, or None.
+    spatial_index = None
+
+    def __init__(self, config):
+        self.config = config
+
+    @property
+    def user_agent(self):
+        raise NotImplementedError
+
+    @property
+    def image_folder(self):
+        raise NotImplementedError
+
+    @property
+    def summary_csv_path(self):
+        """
+            Path of the summary CSV file, or None if the site produces no metadata.
+            """
+        return None
+
+    @property
+    def summary_key_column(self):
+        """
+            Summary column identifying an item, used to update its row in place when it is refreshed; None if rows
+            cannot be matched.
+            """
+        return None
+
+    def clean_value(self, value):
+        return metadata.clean_value(value)
+
+    def iter_items(self, target, limit=None):
+        """
+            Listing stage: yields the URLs of the items belonging to a target.
+            Args:
+                target: Site-specific target, e.g. a bridge type, country code or search query.
+                limit: Maximum number of items to yield.
+            """
+        raise NotImplementedError
+
+    def item_id(self, item_url):
+        """
+            Returns the folder name of an item if it can be derived without fetching it, else None.
+            Args:
+                item_url: URL of the item.
+            """
+        return None
+
+    def fetch_detail(self, item_url):
+        """
+            Detail stage: fetches an item and extracts its metadata.
+            Args:
+                item_url: URL of the item.
+            Returns:
+                Record dictionary with at least 'id', 'url' and 'info' (None if the site has no metadata).
+            """
+        raise NotImplementedError
+
+    def iter_media(self, record):
+        """
+            Media stage: yields the absolute URLs of the media files of a record.
+            Args:
+                record: Record returned by fetch_detail().
+            """
+        raise NotImplementedError
+
+    def list_media(self, record):
+        """
+            Cheap part of the media stage, used by refreshes: yields one entry per media file without resolving it,
+            so a refresh can tell from the entries alone whether anything changed. By default the entries are the
+            media URLs themselves.
+            Args:
+                record: Record returned by fetch_detail().
+            """
+        return self.iter_media(record)
+
+    def resolve_media(self, record, entry):
+        """
+            Turns an entry of list_media() into the absolute URL of its media file.
+            Args:
+                record: Record returned by fetch_detail().
+                entry: Entry yielded by list_media().
+            Returns:
+                Media URL, or None if it cannot be resolved.
+            """
+        return entry
+
+    def media_limit(self, record):
+        """
+            Returns the number of media files to download for a record, or None to download all of them.
+            Args:
+                record: Record returned by fetch_detail().
+            """
+        return None
+
+    def media_downloaded(self, record, media_url, file_name):
+        """
+            Hook called for every file downloaded for a record, e.g. to remember its URL across sessions.
+            Args:
+                record: Record returned by fetch_detail().
+                media_url: URL of the media file.
+                file_name: Name of the file it was saved as.
+            """
+
+    def finish_record(self, record, media_count):
+        """
+            Hook called after the media of a record were downloaded, before its metadata is written.
+            Args:
+                record: Record returned by fetch_detail().
+                media_count: Number of media files found for the record.
+            """
+
+    async def write_extra_metadata(self, record):
+        """
+            Hook for site-specific metadata outputs written after the summary row.
+            Args:
+                record: Record returned by fetch_detail().
+            """
+
+    async def update_extra_metadata(self, record, row_number):
+        """
+            Hook for refreshing the site-specific metadata outputs of a record whose summary row was updated in place.
+            Args:
+                record: Record returned by fetch_detail().
+                row_number: Running number of the record's summary row.
+            """
@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import time
+import urllib.parse
+
+from .. import client
+from ..urlindex import UrlIndex
+from .base import SiteAdapter
+
+SEARCH_URL = "{}/images/search?q={}&form=AWIR&first={}&count={}"
+
+
+def get_image_data(soup):
+    image_containers = soup.find_all('a', {'class': 'iusc'})
+    image_data = []
+    for container in image_containers:
+        m_data = container.get('m')
+        if m_data:
+            data = json.loads(m_data)
+            image_data.append(data)
+    return image_data
+
+
+def get_high_res_image_urls(image_data):
+    return [urllib.parse.quote(data["murl"], safe=":/") for data in image_data if data.get("murl")]
+
+
+def get_query_slug(user_query):
+    return user_query.replace(" ", "+")
+
+
+def get_search_url(base_url, user_query, start_index, images_per_page):
+    url_encoded_query = urllib.parse.quote(get_query_slug(user_query), safe='')
+    return SEARCH_URL.format(base_url, url_encoded_query, start_index, images_per_page)
+
+
+class BingAdapter(SiteAdapter):
+    """
+        Site adapter for Bing image search. Every search query is one item; its media are the full-size
+        image URLs ('murl') of consecutive result pages.
+        A target has the form 'QUERY' or 'QUERY:COUNT[:START_PAGE]'. With url_index enabled, URLs downloaded for the
+        query in earlier sessions (by the engine or downloader-bing.py) are skipped.
+        """
+
+    name = 'bing'
+    skip_existing = False
+
+    @property
+    def user_agent(self):
+        return self.config['user_agent']
+
+    @property
+    def image_folder(self):
+        return self.config['image_folder']
+
+    def iter_items(self, target, limit=None):
+        yield target
+
+    def open_url_index(self, user_query):
+        if not self.config['url_index']:
+            return None
+        return UrlIndex(os.path.join(self.image_folder, '.url_index'), get_query_slug(user_query),
+                        self.config['url_index_capacity'], self.config['url_index_error_rate'])
+
+    def fetch_detail(self, item_url):
+        user_query, _, rest = item_url.partition(':')
+        count, _, page_number = rest.partition(':')
+        return {
+            'id': get_query_slug(user_query),
+            'url': user_query,
+            'info': None,
+            'count': int(count) if count else self.config['images_per_page'],
+            'page_number': int(page_number) if page_number else 0,
+            'url_index': self.open_url_index(user_query),
+        }
+
+    def media_limit(self, record):
+        return record['count']
+
+    def iter_media(self, record):
+        """
+            Yields the image URLs of consecutive result pages that were not downloaded before. Paging stops at an
+            empty result page, or after max_pages_without_new pages in a row that held no new URL.
+            """
+        images_per_page = self.config['images_per_page']
+        page_number = record['page_number']
+        url_index = record['url_index']
+        seen_urls = set()
+        pages_without_new = 0
+        while True:
+            url = get_search_url(self.config['base_URL'], record['url'], images_per_page * page_number,
+                                 images_per_page)
+            try:
+                high_res_image_urls = get_high_res_image_urls(get_image_data(client.fetch_soup(url, self.user_agent)))
+            except Exception as e:
+                logging.error(f"Failed to fetch result page {url}: {e}")
+                return
+            if not high_res_image_urls:
+                return
+            new_urls = [image_url for image_url in dict.fromkeys(high_res_image_urls)
+                        if image_url not in seen_urls and (url_index is None or image_url not in url_index)]
+            seen_urls.update(high_res_image_urls)
+            if new_urls:
+                pages_without_new = 0
+            else:
+                pages_without_new += 1
+                if pages_without_new >= self.config['max_pages_without_new']:
+                    logging.info(f"No new images on {pages_without_new} result pages of {record['url']!r}")
+                    return
+            yield from new_urls
+            page_number += 1
+            time.sleep(self.config['time_lag'])
+
+    def media_downloaded(self, record, media_url, file_name):
+        if record['url_index'] is not None:
+            record['url_index'].add(media_url, file_name)
+
+    def finish_record(self, record, media_count):
+        if record['url_index'] is not None:
+            record['url_index'].close()
+            record['url_index'] = None
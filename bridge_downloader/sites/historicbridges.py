@@ -0,0 +1,118 @@
+from urllib.parse import urljoin
+
+from .. import client
+from ..spatial import SpatialIndex, extract_coordinates
+from ..storage import clean_folder_name
+from .base import SiteAdapter
+
+
+def get_full_bridge_url(country_code, base_url):
+    if country_code == "ZHEJIANG":
+        final_address = f"{base_url}/b_a_list.php?ct=China&c=&ptype=state&pname={country_code}"
+    elif country_code == "Scotland" or country_code == "England" or country_code == "Wales":
+        final_address = f"{base_url}/b_a_list.php?ct=United+Kingdom&c=&ptype=state&pname={country_code}"
+    else:
+        final_address = f"{base_url}/b_a_list.php?ct=&c=&ptype=country&pname={country_code}"
+    return final_address
+
+
+def get_bridge_links(soup, base_url):
+    bridge_urls = []
+    for div in soup.find_all('div', class_='col-md-2'):
+        if div.find('a'):
+            bridge_url = urljoin(base_url, div.find('a')['href'])
+            if bridge_url not in bridge_urls:
+                bridge_urls.append(bridge_url)
+    return bridge_urls
+
+
+def get_bridge_images(soup, base_url):
+    images = []
+    seen_urls = set()
+
+    for img in soup.find_all('img', class_='blackborders'):
+        img_url = img.get('src')
+        full_url = urljoin(base_url, img_url)
+        if img_url and full_url not in seen_urls:
+            seen_urls.add(full_url)
+            images.append(full_url)
+
+    return images
+
+
+def get_bridge_name(soup):
+    bridge_name = soup.find('h1', class_='center').text.strip()
+    return bridge_name
+
+
+def extract_div_data(div):
+    div_data = {}
+    key = div.find('strong').text.strip() if div.find('strong') else "Unknown"
+
+    texts = [text for text in div.stripped_strings if text != key]
+    combined_text = ' '.join(texts).strip()
+
+    div_data[key] = combined_text
+    return div_data
+
+
+def get_bridge_info(soup):
+    bridge_info = {}
+
+    bridge_name = soup.find('h1', class_='center').text.strip()
+    bridge_info['Bridge Name'] = bridge_name
+
+    info_divs = soup.find_all('div', class_='col-md-3')
+    for div in info_divs:
+        bridge_info.update(extract_div_data(div))
+
+    info_divs = soup.find_all('div', class_='col-md-2')
+    for div in info_divs:
+        bridge_info.update(extract_div_data(div))
+
+    bridge_info.update(extract_coordinates(bridge_info))
+    return bridge_info
+
+
+class HistoricBridgesAdapter(SiteAdapter):
+    name = 'historicbridges'
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.spatial_index = SpatialIndex(config['spatial_index_path']) if config['spatial_index_path'] else None
+
+    @property
+    def user_agent(self):
+        return self.config['USER_AGENT']
+
+    @property
+    def image_folder(self):
+        return self.config['IMAGE_FOLDER']
+
+    @property
+    def summary_csv_path(self):
+        return self.config['summary_csv_path']
+
+    @property
+    def summary_key_column(self):
+        return 'Bridge Name'
+
+    def iter_items(self, target, limit=None):
+        base_url = self.config['BASE_URL']
+        bridge_urls = get_bridge_links(self.fetch_soup(get_full_bridge_url(target.upper(), base_url)), base_url)
+        return iter(bridge_urls if limit is None else bridge_urls[:limit])
+
+    def fetch_detail(self, item_url):
+        bridge_info_soup = self.fetch_soup(item_url)
+        return {
+            'id': clean_folder_name(get_bridge_name(bridge_info_soup)),
+            'url': item_url,
+            'info': get_bridge_info(bridge_info_soup),
+            'soup': bridge_info_soup,
+        }
+
+    def iter_media(self, record):
+        return iter(get_bridge_images(record['soup'], self.config['BASE_URL']))
+
+    def fetch_soup(self, url):
+        return client.fetch_soup(url, self.user_agent)
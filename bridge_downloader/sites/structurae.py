@@ -0,0 +1,682 @@
+import logging
+import os
+import re
+import shutil
+from urllib.parse import urljoin, urlsplit
+
+from .. import client
+from ..deadletter import RESOLVE, record_failure
+from ..linkcache import LanguageLinkCache
+from ..metadata import append_to_template, get_file_lock, update_template_row
+from ..spatial import SpatialIndex, extract_coordinates
+from ..storage import clean_folder_name
+from ..units import extract_numeric_columns
+from .base import SiteAdapter
+
+# Country names in the German location texts of structure pages, by the codes the type listings filter on.
+LOCATION_COUNTRIES = {'DE': 'Deutschland', 'BE': 'Belgien', 'FR': 'Frankreich', 'US': 'USA', 'CN': 'China'}
+
+# Column renames applied to the raw table keys, per output language.
+KEY_MAPPINGS = {
+    "English": {"Structure": "Structure type", "Material": "Bridge type"},
+    "Deutsch": {"Baustoff": "Brücke typ"},
+}
+
+
+def get_full_bridge_url(country_code, bridge_type, base_usl):
+    """
+        Constructs the full URL for a specific bridge type and country.
+        Args:
+            country_code: Code of the country.
+            bridge_type: Type of the bridge.
+            base_usl: Base URL for the website.
+        Returns:
+            The constructed URL as a string.
+        """
+    if country_code:
+        final_address = f"{base_usl}/bauwerke/bruecken/{bridge_type}/liste?filtercountry={country_code}"
+        return final_address
+    else:
+        final_address = f"{base_usl}/bauwerke/bruecken/{bridge_type}/liste"
+        return final_address
+
+
+def get_typology_text(bridge_type):
+    """
+        Turns the slug of a type listing, e.g. 'bogenbruecken', into the text the typology of its structures
+        contains, e.g. 'bogenbruecke'.
+        """
+    text = bridge_type.replace('-', ' ')
+    return text[:-1] if text.endswith('en') else text
+
+
+def get_listing_page_url(bridge_type_url, page):
+    """
+        Returns the URL of the given page (100 bridges each) of a type listing.
+        Args:
+            bridge_type_url: URL of the first listing page.
+            page: Zero-based page number.
+        Returns:
+            URL of the listing page.
+        """
+    return bridge_type_url if page == 0 else f"{bridge_type_url}?min={page * 100}"
+
+
+def get_bridge_links(soup, base_url):
+    """
+        Extracts the bridge URLs from a type listing page.
+        Args:
+            soup: BeautifulSoup object of the listing page.
+            base_url: Base URL used to resolve relative links.
+        Returns:
+            A list of bridge URLs.
+        """
+    return [urljoin(base_url, link['href']) for link in soup.select("td > a.listableleft") if link.get('href')]
+
+
+def get_bridge_names(soup, base_url):
+    """
+        Extracts the bridge URLs of a type listing page together with the names they are listed under.
+        Args:
+            soup: BeautifulSoup object of the listing page.
+            base_url: Base URL used to resolve relative links.
+        Returns:
+            A list of (bridge URL, name).
+        """
+    return [(urljoin(base_url, link['href']), link.get_text(' ', strip=True))
+            for link in soup.select("td > a.listableleft") if link.get('href')]
+
+
+def get_unique_bridge_name_from_url(bridge_url):
+    """
+        Extracts a unique bridge name from its URL.
+        Args:
+            bridge_url: URL of the bridge.
+        Returns:
+            Unique bridge name as a string.
+        """
+    unique_identifier = bridge_url.rstrip('/').split('/')[-1]
+    return unique_identifier
+
+
+# Path of a structure page, e.g. /de/bauwerke/golden-gate-bridge; the German prefix may be missing in sitemaps.
+STRUCTURE_PATH = re.compile(r'^(?:/de)?/bauwerke/([^/]+)/?$')
+
+
+def get_structure_url(url, base_url):
+    """
+        Maps a URL listed in a sitemap onto the German structure page URL used by the crawler.
+        Args:
+            url: URL from the sitemap.
+            base_url: German base URL, e.g. 'https://structurae.net/de'.
+        Returns:
+            The structure page URL, or None if the URL is not a structure page.
+        """
+    match = STRUCTURE_PATH.match(urlsplit(url).path)
+    return f"{base_url}/bauwerke/{match.group(1)}" if match else None
+
+
+def get_structure_classification(soup):
+    """
+        Extracts the texts a structure is filtered by: its typology (e.g. 'Bogenbrücke') and its location.
+        Args:
+            soup: BeautifulSoup object of the structure page.
+        Returns:
+            Tuple (typology, location), or None if the page has no typology table.
+        """
+    texts = []
+    for table_id in ('typology', 'geographic'):
+        div = soup.find('div', {'class': 'js-acordion-body', 'id': table_id})
+        table = div.find('table', {'class': 'aligned-tables'}) if div else None
+        if table is None and table_id == 'typology':
+            return None
+        texts.append(' | '.join(extract_table_data(table).values()) if table else '')
+    return tuple(texts)
+
+
+def get_image_data(soup):
+    """
+        Extracts image data from the BeautifulSoup object of a bridge's media page.
+        Args:
+            soup: BeautifulSoup object of the bridge's media page.
+        Returns:
+            A list of image URLs.
+        """
+    image_entries = soup.find_all('div', class_='jg-entry')
+
+    image_data = []
+    for entry in image_entries:
+        link = entry.find('a', class_='imageThumbLink_2')
+        if link:
+            href = link['href']
+            image_data.append(href)
+
+    return image_data
+
+
+def get_download_link(soup):
+    """
+        Extracts the download link for an image from its BeautifulSoup object.
+        Args:
+            soup: BeautifulSoup object of the image page.
+        Returns:
+            The download link for the image.
+        """
+    img_tag = soup.find('img', {'class': 'flexible bordered mediaObject'})
+    if img_tag:
+        return img_tag['src']
+
+    return None
+
+
+def get_en_link(soup):
+    """
+        Extracts the English version link of a bridge page from its BeautifulSoup object.
+        Args:
+            soup: BeautifulSoup object of the bridge's page.
+        Returns:
+            The URL of the English version of the page.
+        """
+    li_tag = soup.select_one('li.short-language:not(.language-active-li)')
+    if li_tag:
+        a_tag = li_tag.find('a')
+        if a_tag:
+            return a_tag['href']
+
+    return None
+
+
+def format_text(text):
+    """
+       Formats the given text by replacing special characters and converting to lowercase.
+       Args:
+           text: The text to format.
+       Returns:
+           Formatted text as a string.
+       """
+    name = text.replace("ä", "ae").replace("ö", "oe").replace("ü", "ue").replace("ß", "ss").replace("Ä", "AE").replace(
+        "Ö", "Oe").replace("Ü", "Ue")
+    name = name.replace(" ", "-").lower()
+    return name
+
+
+def extract_table_data(table):
+    """
+        Extracts data from a table element in the BeautifulSoup object.
+        Args:
+            table: Table element from BeautifulSoup object.
+        Returns:
+            Dictionary of extracted data with headers as keys and corresponding values.
+        """
+    data = {}
+    rows = table.find_all('tr')
+    for row in rows:
+        header = row.find('th')
+        value = row.find('td')
+        if header and value:
+            data[header.text.strip()] = value.text.strip()
+    return data
+
+
+def extract_technical_data(technical_div, bridge_info):
+    """
+        Extracts technical data about a bridge from its BeautifulSoup object.
+        Args:
+            technical_div: Div element containing technical data from BeautifulSoup object.
+            bridge_info: Dictionary to store extracted data.
+        """
+    tab_bodies = technical_div.find_all('div', class_='tabbody')
+
+    for tab_body in tab_bodies:
+        table = tab_body.find('table')
+        if table:
+            rows = table.find_all('tr')
+            current_header = ""
+
+            for row in rows:
+                cells = row.find_all(['th', 'td'])
+
+                if len(cells) == 3:
+                    current_header = cells[0].text.strip()
+                    key = cells[1].text.strip()
+                    value = cells[2].text.strip()
+                    full_key = f"{current_header} {key}" if current_header else key
+                elif len(cells) == 2:
+                    if 'rowspan' in cells[0].attrs:
+                        current_header = cells[0].text.strip()
+                        key = cells[1].text.strip()
+                        full_key = current_header
+                    else:
+                        key = cells[0].text.strip()
+                        value = cells[1].text.strip()
+                        full_key = f"{current_header} {key}" if current_header else key
+                elif len(cells) == 1:
+                    value = cells[0].text.strip()
+                    full_key = current_header
+
+                bridge_info[full_key] = value
+
+
+def get_bridge_info(soup, language="Deutsch"):
+    """
+        Extracts comprehensive information about a bridge from its BeautifulSoup object.
+        Args:
+            soup: BeautifulSoup object of the bridge's page.
+            language: Output language, "English" or "Deutsch".
+        Returns:
+            Dictionary containing various details about the bridge.
+        """
+    bridge_info = {}
+
+    table_ids = ['general', 'typology', 'geographic']
+    for table_id in table_ids:
+        table = soup.find('div', {'class': 'js-acordion-body', 'id': table_id}).find('table',
+                                                                                     {'class': 'aligned-tables'})
+        bridge_info.update(extract_table_data(table))
+
+    technical_info_div = soup.find('div', {'class': 'js-acordion-body', 'id': 'technical'})
+    if technical_info_div:
+        extract_technical_data(technical_info_div, bridge_info)
+    else:
+        logging.error("Technical information is not available.")
+
+    bridge_name_tag = soup.find("h1", {"itemprop": "name"})
+    if language == "English":
+        bridge_info["Bridge Name"] = bridge_name_tag.get_text(strip=True) if bridge_name_tag else "Unknown_bridge"
+    else:
+        bridge_info["Brücke Name"] = bridge_name_tag.get_text(strip=True) if bridge_name_tag else "Unbekannte_Brücke"
+
+    return bridge_info
+
+
+def deal_with_value(bridge_info, key_mapping, language="Deutsch"):
+    """
+        Data cleansing for specific parts of the source data.
+        Args:
+            bridge_info: The original dictionary with keys to be cleaned.
+            key_mapping: Dictionary mapping old keys to new keys.
+            language: Output language, used as number-format hint for the numeric columns.
+        Returns:
+            New dictionary with cleaned data as per the mapping.
+        """
+    more_address = False
+
+    cleaned_bridge_info = {clean_value(key): clean_value(value) for key, value in bridge_info.items()}
+    replaced_bridge_info = replace_keys_in_dict(cleaned_bridge_info, key_mapping)
+
+    if "Baubeginn" in replaced_bridge_info:
+        construction_start = replaced_bridge_info["Baubeginn"]
+        year_start, month_start, day_start = parse_date(construction_start)
+        if year_start is not None:
+            replaced_bridge_info['Jahr_beginn'] = year_start
+        if month_start is not None:
+            replaced_bridge_info['Monat_beginn'] = month_start
+        if day_start is not None:
+            replaced_bridge_info['Tag_beginn'] = day_start
+
+    if "Fertigstellung" in replaced_bridge_info:
+        completion = replaced_bridge_info["Fertigstellung"]
+        year_end, month_end, day_end = parse_date(completion)
+        if year_end is not None:
+            replaced_bridge_info['Jahr_fertig'] = year_end
+        if month_end is not None:
+            replaced_bridge_info['Monat_fertig'] = month_end
+        if day_end is not None:
+            replaced_bridge_info['Tag_fertig'] = day_end
+
+    if "Lage" in replaced_bridge_info:
+        lage = replaced_bridge_info["Lage"]
+
+        city, region3, region2, region1, country, more_address = parse_location(lage)
+        replaced_bridge_info['Stadt'] = city
+        replaced_bridge_info['Region3'] = region3
+        replaced_bridge_info['Region2'] = region2
+        replaced_bridge_info['Region1'] = region1
+        replaced_bridge_info['Land'] = country
+
+    replaced_bridge_info.update(extract_numeric_columns(replaced_bridge_info, language))
+    replaced_bridge_info.update(extract_coordinates(replaced_bridge_info))
+
+    return replaced_bridge_info, more_address
+
+
+def replace_keys_in_dict(original_dict, key_mapping):
+    """
+        Replaces keys in a dictionary based on a provided mapping.
+        Args:
+            original_dict: The original dictionary with keys to be replaced.
+            key_mapping: Dictionary mapping old keys to new keys.
+        Returns:
+            New dictionary with keys replaced as per the mapping.
+        """
+    new_dict = {}
+    for key, value in original_dict.items():
+        new_key = key_mapping.get(key, key)
+        new_dict[new_key] = value
+    return new_dict
+
+
+def clean_value(value):
+    """
+        Cleans a given value by removing unwanted characters and whitespace.
+        Args:
+            value: The value to be cleaned.
+        Returns:
+            Cleaned value as a string.
+        """
+    if isinstance(value, str):
+        return value.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ').replace(':', '').replace('Ä', 'Ae') \
+            .replace('Ö', 'Oe').replace('Ü', 'Ue').replace('ä', 'ae').replace('ü', 'ue').replace('ö', 'oe').replace('ß',
+                                                                                                                    'ss').strip()
+    return value
+
+
+def parse_date(date):
+    """
+        Data cleansing and segmentation for date segments.
+        Args:
+            date: The value to be cleaned.
+        Returns:
+            Cleaned value as strings.
+        """
+    parts = re.split(r'\.|\s', date)
+    parts = [part for part in parts if part.strip()]
+    parts = parts[::-1]
+    year = parts[0] if len(parts) > 0 else None
+    month = parts[1] if len(parts) > 1 else None
+    day = parts[2] if len(parts) > 2 else None
+    if year == "Jahrhundert":
+        year = date
+        month = None
+        day = None
+
+    return year, month, day
+
+
+def parse_location(location):
+    """
+    Data cleansing and segmentation for location segments.
+    Args:
+        location: The value to be cleaned.
+    Returns:
+        Cleaned value as strings.
+        """
+
+    city = ""
+    region3 = ""
+    region2 = ""
+    region1 = ""
+    country = ""
+    more_address = False
+
+    parts = location.split(', ')
+    if parts:
+        if len(parts) > 5:
+            more_address = True
+        if len(parts) == 5:
+            city = parts[0]
+            region3 = parts[1]
+            region2 = parts[2]
+            region1 = parts[3]
+            country = parts[4]
+        if len(parts) == 4:
+            city = parts[0]
+            region3 = parts[1]
+            region2 = parts[2]
+            country = parts[3]
+        elif len(parts) == 3:
+            city = parts[0]
+            region3 = parts[1]
+            country = parts[2]
+        else:
+            city = parts[0]
+            country = parts[1]
+
+    return city, region3, region2, region1, country, more_address
+
+
+async def process_all_templates(bridge_info, template_folder, output_folder):
+    """
+        Asynchronously processes all CSV templates and appends bridge information to them.
+        Args:
+            bridge_info: Dictionary containing bridge information.
+            template_folder: Folder holding the CSV templates.
+            output_folder: Folder holding the filled-in copies of the templates.
+        """
+    template_files = [f for f in os.listdir(template_folder) if f.endswith('.csv')]
+
+    for template_file in template_files:
+        template_path = os.path.join(template_folder, template_file)
+        output_path = os.path.join(output_folder, template_file)
+        await append_to_template(bridge_info, template_path, output_path)
+
+
+async def update_all_templates(bridge_info, template_folder, output_folder, bridge_number):
+    """
+        Asynchronously replaces a bridge's row in all filled-in templates.
+        Args:
+            bridge_info: Dictionary containing bridge information.
+            template_folder: Folder holding the CSV templates.
+            output_folder: Folder holding the filled-in copies of the templates.
+            bridge_number: Running number of the bridge's rows.
+        """
+    template_files = [f for f in os.listdir(template_folder) if f.endswith('.csv')]
+
+    for template_file in template_files:
+        template_path = os.path.join(template_folder, template_file)
+        output_path = os.path.join(output_folder, template_file)
+        await update_template_row(bridge_info, template_path, output_path, bridge_number)
+
+
+def copy_all_templates(template_folder, output_folder, overwrite=True):
+    """
+        Copies all CSV template files from the template folder to the output folder.
+        Args:
+            template_folder: Folder holding the CSV templates.
+            output_folder: Folder the templates are copied to.
+            overwrite: If False, templates that already have an output file are left alone.
+        """
+    template_files = [f for f in os.listdir(template_folder) if f.endswith('.csv')]
+
+    for template_file in template_files:
+        template_path = os.path.join(template_folder, template_file)
+        output_path = os.path.join(output_folder, template_file)
+        if overwrite or not os.path.exists(output_path):
+            shutil.copyfile(template_path, output_path)
+
+
+class StructuraeAdapter(SiteAdapter):
+    """
+        Site adapter for structurae.net.
+        Pages are fetched over plain HTTP by default; pass a browser-backed fetch_page to render them instead.
+        Args:
+            config: Configuration loaded from config.json.
+            fetch_page: Optional callable url -> BeautifulSoup used for listing and bridge pages.
+        """
+
+    name = 'structurae'
+
+    def __init__(self, config, fetch_page=None):
+        super().__init__(config)
+        self.base_url = config['base_URL'] + '/de'
+        self.language = config['language']
+        self.key_mapping = KEY_MAPPINGS.get(self.language, {})
+        self.fetch_page = fetch_page or self.fetch_soup
+        self.language_links = LanguageLinkCache(config['language_link_cache']) if self.language == "English" else None
+        self.spatial_index = SpatialIndex(config['spatial_index_path']) if config['spatial_index_path'] else None
+        self.sitemap = None
+        self.names = None
+
+    @property
+    def user_agent(self):
+        return self.config['user_agent']
+
+    @property
+    def image_folder(self):
+        return self.config['image_folder']
+
+    @property
+    def summary_csv_path(self):
+        return self.config['summary_csv_path']
+
+    @property
+    def number_column(self):
+        return 'Bridge Number' if self.language == "English" else 'Brückennummer'
+
+    @property
+    def template_folder(self):
+        return self.config['template_folder_en'] if self.language == "English" else self.config['template_folder_de']
+
+    @property
+    def summary_key_column(self):
+        return 'Unique Name' if self.language == "English" else 'eindeutiger Name'
+
+    def clean_value(self, value):
+        return clean_value(value)
+
+    def sitemap_store(self):
+        """
+            Returns the SitemapStore in the crawl-state database, opening it on first use.
+            """
+        from ..sitemap import SitemapStore
+
+        if self.sitemap is None:
+            self.sitemap = SitemapStore(self.config['crawl_state_db'])
+        return self.sitemap
+
+    def name_index(self):
+        """
+            Returns the NameIndex in the crawl-state database, opening it on first use.
+            """
+        from ..names import NameIndex
+
+        if self.names is None:
+            self.names = NameIndex(self.config['crawl_state_db'])
+        return self.names
+
+    def iter_items(self, target, limit=None):
+        """
+            Yields bridge URLs of one bridge type, page by page, the stored sitemap URLs matching a type and
+            country (see python -m bridge_downloader.sitemap), or the URLs the names of a file resolve to in the
+            local name index (see python -m bridge_downloader.names).
+            Args:
+                target: Bridge type slug, optionally followed by '/COUNTRY_CODE', 'sitemap[/TYPE[/COUNTRY]]' with
+                    TYPE and COUNTRY matched against the typology and location texts (unclassified pages are
+                    classified as far as the limit needs), or 'names/FILE'.
+                limit: Maximum number of URLs to yield.
+            """
+        if target.startswith('names/'):
+            from ..names import read_names, resolve_names
+
+            names = read_names(target[len('names/'):])[:limit]
+            urls = resolve_names(self.name_index(), self.name, names, self.base_url, guess=True)
+            for name in names:
+                yield urls[name]
+            return
+
+        if target == 'sitemap' or target.startswith('sitemap/'):
+            from ..scheduler import get_scheduler
+            from ..sitemap import iter_matching
+
+            _, bridge_type, country = (target.split('/', 2) + ['', ''])[:3]
+            yield from iter_matching(self.sitemap_store(), self.name, bridge_type or None, country or None,
+                                     self.user_agent, get_scheduler(), limit)
+            return
+
+        bridge_type, _, country_code = target.partition('/')
+        bridge_type_url = get_full_bridge_url(country_code or None, bridge_type, self.base_url)
+
+        count = 0
+        page = 0
+        while limit is None or count < limit:
+            bridge_urls = get_bridge_links(self.fetch_page(get_listing_page_url(bridge_type_url, page)), self.base_url)
+            if not bridge_urls:
+                break
+            for bridge_url in bridge_urls:
+                yield bridge_url
+                count += 1
+                if limit is not None and count >= limit:
+                    break
+            page += 1
+
+    def item_id(self, item_url):
+        return get_unique_bridge_name_from_url(item_url)
+
+    def fetch_detail(self, item_url):
+        if self.language == "English":
+            bridge_info_soup = self.fetch_english_page(item_url)
+        else:
+            bridge_info_soup = self.fetch_page(item_url)
+            classification = get_structure_classification(bridge_info_soup)
+            if classification is not None and self.config['crawl_state_db']:
+                self.sitemap_store().classify(self.name, item_url, *classification)
+
+        bridge_info = get_bridge_info(bridge_info_soup, self.language)
+        replaced_bridge_info, _ = deal_with_value(bridge_info, self.key_mapping, self.language)
+
+        return {'id': get_unique_bridge_name_from_url(item_url), 'url': item_url, 'info': replaced_bridge_info}
+
+    def fetch_english_page(self, item_url):
+        """
+            Fetches the English page of a bridge, reading the link from the German page only if it is not cached yet.
+            Args:
+                item_url: URL of the German bridge page.
+            Returns:
+                BeautifulSoup object of the English page, or of the German page if there is no English version.
+            """
+        bridge_url_en = self.language_links.get(item_url)
+        if bridge_url_en is None:
+            bridge_info_soup_de = self.fetch_page(item_url)
+            bridge_url_en = get_en_link(bridge_info_soup_de)
+            if not bridge_url_en:
+                return bridge_info_soup_de
+            self.language_links.set(item_url, bridge_url_en)
+        return self.fetch_page(urljoin(self.base_url, bridge_url_en))
+
+    def list_media(self, record):
+        return get_image_data(self.fetch_page(f"{record['url']}/medien"))
+
+    def resolve_media(self, record, entry):
+        try:
+            download_link = get_download_link(self.fetch_soup(urljoin(self.config['base_URL'], entry)))
+        except Exception as e:
+            logging.error(f"Error resolving media page {entry}: {e}")
+            record_failure(RESOLVE, urljoin(self.config['base_URL'], entry), e, self.name,
+                           folder=os.path.join(self.image_folder, clean_folder_name(record['id'])),
+                           base_url=self.config['base_URL'], user_agent=self.user_agent)
+            return None
+        return urljoin(self.config['base_URL'], download_link) if download_link else None
+
+    def iter_media(self, record):
+        for media_page_url in self.list_media(record):
+            media_url = self.resolve_media(record, media_page_url)
+            if media_url:
+                yield media_url
+
+    def finish_record(self, record, media_count):
+        if self.language == "English":
+            record['info']['Image Count'] = media_count
+        else:
+            record['info']['Anzahl der Bilder'] = media_count
+        record['info'][self.summary_key_column] = record['id']
+
+    async def write_extra_metadata(self, record):
+        output_folder = self.config['output_folder']
+        if not os.path.isdir(self.template_folder):
+            return
+        os.makedirs(output_folder, exist_ok=True)
+        with get_file_lock(output_folder):
+            copy_all_templates(self.template_folder, output_folder, overwrite=False)
+        await process_all_templates(record['info'], self.template_folder, output_folder)
+
+    async def update_extra_metadata(self, record, row_number):
+        output_folder = self.config['output_folder']
+        if not os.path.isdir(self.template_folder):
+            return
+        os.makedirs(output_folder, exist_ok=True)
+        with get_file_lock(output_folder):
+            copy_all_templates(self.template_folder, output_folder, overwrite=False)
+        await update_all_templates(record['info'], self.template_folder, output_folder, row_number)
+
+    def fetch_soup(self, url):
+        return client.fetch_soup(url, self.user_agent)
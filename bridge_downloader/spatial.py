@@ -0,0 +1,353 @@
+"""
+    Spatial index of crawled bridge locations.
+
+    Usage:
+        python -m bridge_downloader.spatial build --site SITE [--summary FILE] [--index FILE]
+        python -m bridge_downloader.spatial radius LAT LON KM --site SITE
+        python -m bridge_downloader.spatial bbox SOUTH WEST NORTH EAST --site SITE
+        python -m bridge_downloader.spatial nearest LAT LON [-k 10] --site SITE
+
+    Coordinates are parsed from the location fields of a bridge (decimal degrees or degrees, minutes and seconds with
+    N/S/E/W or O for Ost) into the numeric latitude and longitude columns of the summary. Each located bridge is also
+    stored with its geohash in a SQLite table indexed on the geohash, so a query only reads the rows of the few geohash
+    cells covering its area instead of scanning the summary. Radius queries filter those rows by great-circle distance,
+    and nearest-neighbour queries widen the radius until enough bridges are found.
+    """
+import argparse
+import csv
+import math
+import re
+import threading
+import time
+
+from .state import connect
+from .units import fold_umlauts
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Precision of the stored geohashes, about 5 m.
+GEOHASH_PRECISION = 9
+# Most geohash cells a query reads; coarser cells are used for larger areas.
+MAX_QUERY_CELLS = 32
+EARTH_RADIUS_KM = 6371.0088
+
+# Key fragments (lower case, umlauts folded) of location fields holding coordinates.
+COORDINATE_KEYS = ('koordinat', 'coordinat', 'gps', 'latitude', 'longitude', 'breitengrad', 'laengengrad',
+                   'geographische breite', 'geografische breite', 'geographische laenge', 'geografische laenge')
+LATITUDE_KEYS = ('latitude', 'breitengrad', 'breite')
+LONGITUDE_KEYS = ('longitude', 'laengengrad', 'laenge')
+
+COMPONENT_PATTERN = re.compile(
+    r"(?<![A-Za-z\d.])(?P<before>[NSEOW](?![A-Za-z]))?\s*"
+    r"(?P<degrees>[-+−]?\d{1,3}(?:[.,]\d+)?)(?![\d])\s*(?:°|º|deg\b)?\s*"
+    r"(?:(?P<minutes>\d{1,2}(?:[.,]\d+)?)\s*['′’]\s*"
+    r"(?:(?P<seconds>\d{1,2}(?:[.,]\d+)?)\s*(?:\"|″|”|'')\s*)?)?"
+    r"(?P<after>[NSEOW](?![A-Za-z]))?"
+)
+
+
+def parse_components(text):
+    """
+        Parses the angles written in a coordinate text.
+        Args:
+            text: Text such as '48.8566, 2.3522' or '48° 51' 24" N, 2° 21' 8" O'.
+        Returns:
+            List of (signed degrees, hemisphere letter or None).
+        """
+    components = []
+    for match in COMPONENT_PATTERN.finditer(text):
+        degrees = float(match.group('degrees').replace('−', '-').replace(',', '.'))
+        sign = -1.0 if degrees < 0 else 1.0
+        degrees = abs(degrees)
+        if match.group('minutes'):
+            degrees += float(match.group('minutes').replace(',', '.')) / 60
+        if match.group('seconds'):
+            degrees += float(match.group('seconds').replace(',', '.')) / 3600
+        hemisphere = match.group('before') or match.group('after')
+        if hemisphere in ('S', 'W'):
+            sign = -1.0
+        components.append((sign * degrees, hemisphere))
+    return components
+
+
+def parse_coordinates(text):
+    """
+        Parses a latitude and longitude pair.
+        Args:
+            text: Text with the latitude first, unless hemisphere letters say otherwise.
+        Returns:
+            Tuple (latitude, longitude) in decimal degrees, or None if the text holds no valid pair.
+        """
+    components = parse_components(text)
+    if len(components) < 2:
+        return None
+    (first, first_hemisphere), (second, _) = components[:2]
+    latitude, longitude = (second, first) if first_hemisphere in ('E', 'O', 'W') else (first, second)
+    if abs(latitude) > 90 or abs(longitude) > 180:
+        return None
+    return latitude, longitude
+
+
+def extract_coordinates(bridge_info):
+    """
+        Derives the numeric latitude and longitude columns from the location fields of a bridge.
+        Args:
+            bridge_info: Dictionary containing bridge information.
+        Returns:
+            Dictionary with 'latitude' and 'longitude' in decimal degrees, or an empty dictionary if no coordinates
+            were found.
+        """
+    latitude = longitude = None
+    for key, value in bridge_info.items():
+        lowered = fold_umlauts(str(key)).lower()
+        if not isinstance(value, str) or not any(fragment in lowered for fragment in COORDINATE_KEYS):
+            continue
+        is_latitude = any(fragment in lowered for fragment in LATITUDE_KEYS)
+        is_longitude = any(fragment in lowered for fragment in LONGITUDE_KEYS)
+        if is_latitude != is_longitude:
+            components = parse_components(value)
+            if components and is_latitude and abs(components[0][0]) <= 90:
+                latitude = components[0][0]
+            elif components and is_longitude and abs(components[0][0]) <= 180:
+                longitude = components[0][0]
+        elif latitude is None and longitude is None:
+            latitude, longitude = parse_coordinates(value) or (None, None)
+    if latitude is None or longitude is None:
+        return {}
+    return {'latitude': round(latitude, 6), 'longitude': round(longitude, 6)}
+
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+        Encodes a location as a geohash: interleaved longitude and latitude bisections, five bits per character.
+        """
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    characters, bits, value, even = [], 0, 0, True
+    while len(characters) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            characters.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return ''.join(characters)
+
+
+def cell_size(precision):
+    """
+        Returns the (latitude, longitude) extent in degrees of a geohash cell of the given precision.
+        """
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covering_cells(south, west, north, east, max_cells=MAX_QUERY_CELLS):
+    """
+        Returns the geohash prefixes of the cells covering a bounding box, at the finest precision that needs no more
+        than max_cells cells. Boxes crossing the antimeridian (west > east) are split in two.
+        """
+    if west > east:
+        return covering_cells(south, west, north, 180.0, max_cells) | covering_cells(south, -180.0, north, east,
+                                                                                     max_cells)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_size, lon_size = cell_size(precision)
+        rows = math.floor((north + 90) / lat_size) - math.floor((south + 90) / lat_size) + 1
+        columns = math.floor((east + 180) / lon_size) - math.floor((west + 180) / lon_size) + 1
+        if rows * columns <= max_cells or precision == 1:
+            break
+    cells = set()
+    first_row, first_column = math.floor((south + 90) / lat_size), math.floor((west + 180) / lon_size)
+    for row in range(first_row, first_row + rows):
+        for column in range(first_column, first_column + columns):
+            latitude = min(90.0, (row + 0.5) * lat_size - 90)
+            longitude = min(180.0, (column + 0.5) * lon_size - 180)
+            cells.add(geohash_encode(latitude, longitude, precision))
+    return cells
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """
+        Great-circle distance by the haversine formula.
+        """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class SpatialIndex:
+    """
+        Persistent index of bridge locations, queried by bounding box, radius or nearest neighbours.
+        Args:
+            db_path: Path of the index database.
+        """
+
+    def __init__(self, db_path):
+        self.db = connect(db_path)
+        self.lock = threading.Lock()
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS bridge_locations (
+                site TEXT NOT NULL,
+                bridge_id TEXT NOT NULL,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                geohash TEXT NOT NULL,
+                updated REAL,
+                PRIMARY KEY (site, bridge_id)
+            );
+            CREATE INDEX IF NOT EXISTS bridge_locations_geohash ON bridge_locations (geohash);
+        ''')
+
+    def add(self, site, bridge_id, latitude, longitude):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO bridge_locations VALUES (?, ?, ?, ?, ?, ?)',
+                            (site, bridge_id, latitude, longitude, geohash_encode(latitude, longitude), time.time()))
+
+    def add_bridge(self, site, bridge_id, bridge_info):
+        """
+            Stores the location of a bridge if its information has coordinates.
+            Args:
+                site: Site the bridge was crawled from.
+                bridge_id: Summary key of the bridge, e.g. its unique name.
+                bridge_info: Dictionary containing bridge information.
+            Returns:
+                True if the bridge was located.
+            """
+        coordinates = extract_coordinates(bridge_info)
+        if not coordinates or not bridge_id:
+            return False
+        self.add(site, bridge_id, coordinates['latitude'], coordinates['longitude'])
+        return True
+
+    def within_bbox(self, south, west, north, east, site=None):
+        """
+            Returns the bridges inside a bounding box.
+            Args:
+                south, west, north, east: Bounds in decimal degrees; west > east crosses the antimeridian.
+                site: Optional site to restrict the results to.
+            Returns:
+                List of (site, bridge_id, latitude, longitude).
+            """
+        rows = []
+        with self.lock:
+            for prefix in sorted(covering_cells(south, west, north, east)):
+                rows.extend(self.db.execute(
+                    'SELECT site, bridge_id, latitude, longitude FROM bridge_locations '
+                    'WHERE geohash >= ? AND geohash < ?', (prefix, prefix + '~')))
+        in_longitude = (lambda lon: west <= lon <= east) if west <= east else (lambda lon: lon >= west or lon <= east)
+        return [row for row in rows
+                if south <= row[2] <= north and in_longitude(row[3]) and (site is None or row[0] == site)]
+
+    def within_radius(self, latitude, longitude, radius_km, site=None):
+        """
+            Returns the bridges within a great-circle distance of a point, nearest first.
+            Returns:
+                List of (distance in km, site, bridge_id, latitude, longitude).
+            """
+        lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+        south, north = max(-90.0, latitude - lat_delta), min(90.0, latitude + lat_delta)
+        cos_latitude = min(math.cos(math.radians(south)), math.cos(math.radians(north)))
+        if north >= 90 or south <= -90 or cos_latitude <= 0 or lat_delta / cos_latitude >= 180:
+            west, east = -180.0, 180.0
+        else:
+            lon_delta = lat_delta / cos_latitude
+            west = (longitude - lon_delta + 180) % 360 - 180
+            east = (longitude + lon_delta + 180) % 360 - 180
+        results = []
+        for row in self.within_bbox(south, west, north, east, site):
+            distance = distance_km(latitude, longitude, row[2], row[3])
+            if distance <= radius_km:
+                results.append((distance,) + tuple(row))
+        return sorted(results)
+
+    def nearest(self, latitude, longitude, k=10, site=None, start_km=5.0):
+        """
+            Returns the k bridges nearest to a point, nearest first.
+            The search radius doubles from start_km until k bridges are inside it; they are then the k nearest.
+            Returns:
+                List of (distance in km, site, bridge_id, latitude, longitude).
+            """
+        radius_km = start_km
+        while True:
+            results = self.within_radius(latitude, longitude, radius_km, site)
+            if len(results) >= k or radius_km >= math.pi * EARTH_RADIUS_KM:
+                return results[:k]
+            radius_km *= 2
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM bridge_locations').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def build_from_summary(index, site, summary_path, key_column):
+    """
+        Adds the located bridges of a summary CSV to the index, e.g. for summaries written before the index existed.
+        Returns:
+            Tuple (number of rows, number of bridges located).
+        """
+    rows = located = 0
+    with open(summary_path, encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f, delimiter=';'):
+            rows += 1
+            located += index.add_bridge(site, row.get(key_column), row)
+    return rows, located
+
+
+def main():
+    from .config import load_config
+    from .sites import SITES
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1].strip())
+    parser.add_argument('--site', required=True, choices=['structurae', 'historicbridges'],
+                        help='site whose index (spatial_index_path of its config) is used')
+    parser.add_argument('--index', help='index database (default: spatial_index_path of the site config)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='index the located bridges of the summary CSV')
+    build.add_argument('--summary', help='summary CSV (default: summary_csv_path of the site config)')
+    radius = commands.add_parser('radius', help='bridges within KM of a point')
+    radius.add_argument('coordinates', type=float, nargs=3, metavar=('LAT', 'LON', 'KM'))
+    bbox = commands.add_parser('bbox', help='bridges inside a bounding box')
+    bbox.add_argument('bounds', type=float, nargs=4, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'))
+    nearest = commands.add_parser('nearest', help='bridges nearest to a point')
+    nearest.add_argument('coordinates', type=float, nargs=2, metavar=('LAT', 'LON'))
+    nearest.add_argument('-k', type=int, default=10, help='number of bridges (default: 10)')
+    args = parser.parse_args()
+
+    config = load_config(SITES[args.site][1])
+    index = SpatialIndex(args.index or config['spatial_index_path'])
+
+    start = time.perf_counter()
+    if args.command == 'build':
+        if args.site == 'structurae':
+            key_column = 'Unique Name' if config['language'] == "English" else 'eindeutiger Name'
+        else:
+            key_column = 'Bridge Name'
+        rows, located = build_from_summary(index, args.site, args.summary or config['summary_csv_path'], key_column)
+        print(f"{located} of {rows} bridges located, {len(index)} in the index")
+    else:
+        if args.command == 'bbox':
+            results = [(None,) + tuple(row) for row in index.within_bbox(*args.bounds, site=args.site)]
+        elif args.command == 'radius':
+            results = index.within_radius(*args.coordinates, site=args.site)
+        else:
+            results = index.nearest(*args.coordinates, k=args.k, site=args.site)
+        for distance, _, bridge_id, latitude, longitude in results:
+            suffix = f";{distance:.3f} km" if distance is not None else ''
+            print(f"{bridge_id};{latitude:.6f};{longitude:.6f}{suffix}")
+        print(f"{len(results)} bridges in {(time.perf_counter() - start) * 1000:.1f} ms")
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+import os
+import sqlite3
+
+from .storage import create_folder
+
+
+def connect(db_path):
+    """
+        Opens one of the crawl-state SQLite databases.
+        The connection may be shared between threads (callers serialise access) and uses WAL journaling, so several
+        processes can read while one writes.
+        Args:
+            db_path: Path of the database file; its folder is created if needed.
+        Returns:
+            sqlite3.Connection in autocommit mode.
+        """
+    create_folder(os.path.dirname(db_path))
+    connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
@@ -0,0 +1,80 @@
+import os
+import re
+
+IMAGE_NAME_PATTERN = re.compile(r'image_(\d+)\.\w+$')
+
+
+def create_folder(folder_name):
+    """
+        Creates a new folder if it does not already exist.
+        Args:
+            folder_name: Name of the folder to create.
+        """
+    if folder_name and not os.path.exists(folder_name):
+        os.makedirs(folder_name, exist_ok=True)
+
+
+def clean_folder_name(folder_name):
+    """
+        Cleans and formats the folder name by removing invalid characters.
+        Args:
+            folder_name: The original folder name.
+        Returns:
+            Cleaned folder name as a string.
+        """
+    return re.sub(r'[<>:"/\\|?*]', '_', folder_name)
+
+
+def create_item_folder(root_folder, item_id):
+    """
+        Creates the folder that holds the media of one bridge (or one search query).
+        Args:
+            root_folder: Image folder of the site.
+            item_id: Unique name of the bridge or query.
+        Returns:
+            Path of the created folder.
+        """
+    item_folder = os.path.join(root_folder, clean_folder_name(item_id))
+    create_folder(item_folder)
+
+    return item_folder
+
+
+def get_existing_items(root_folder):
+    """
+        Lists the bridges (or queries) that already have a folder.
+        Args:
+            root_folder: Image folder of the site.
+        Returns:
+            Set of folder names.
+        """
+    if not os.path.isdir(root_folder):
+        return set()
+    return {name for name in os.listdir(root_folder) if os.path.isdir(os.path.join(root_folder, name))}
+
+
+def image_path(item_folder, index, extension='.jpg'):
+    """
+        Builds the path of the index-th image of a bridge.
+        Args:
+            item_folder: Folder of the bridge.
+            index: Running number of the image.
+            extension: File extension including the dot.
+        Returns:
+            Path of the image file.
+        """
+    return os.path.join(item_folder, f"image_{index}{extension}")
+
+
+def next_image_index(item_folder):
+    """
+        Returns the number following the highest existing image_N file, so new downloads continue the numbering.
+        Args:
+            item_folder: Folder of the bridge or query.
+        Returns:
+            Next free image number (0 for an empty or missing folder).
+        """
+    if not os.path.isdir(item_folder):
+        return 0
+    numbers = [int(match.group(1)) for match in map(IMAGE_NAME_PATTERN.match, os.listdir(item_folder)) if match]
+    return max(numbers) + 1 if numbers else 0
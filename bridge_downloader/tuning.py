@@ -0,0 +1,167 @@
+"""
+    Adaptive connection concurrency.
+
+    The tuner looks at the transfer rate and the download error rate of the last interval and moves the number of
+    connection slots by an AIMD hill climb: one more slot while throughput keeps growing, back one step once an extra
+    slot stops paying off (the knee), and a multiplicative cut when errors or timeouts pile up. After settling it
+    holds for a few intervals and probes one level higher again, so it follows a link or CDN that gets faster or
+    slower during the run.
+    """
+import logging
+import threading
+import time
+
+
+class ConcurrencyLimit:
+    """
+        Counting semaphore whose limit can change while it is in use.
+        Args:
+            limit: Initial number of slots.
+        """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self.saturated = False
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            if self.in_use >= self.limit:
+                self.saturated = True
+            self.condition.wait_for(lambda: self.in_use < self.limit)
+            self.in_use += 1
+            if self.in_use >= self.limit:
+                self.saturated = True
+
+    def release(self):
+        with self.condition:
+            self.in_use -= 1
+            self.condition.notify()
+
+    def set_limit(self, limit):
+        with self.condition:
+            self.limit = limit
+            self.condition.notify_all()
+
+    def take_saturated(self):
+        """
+            Returns whether every slot was taken at some point since the last call.
+            """
+        with self.condition:
+            saturated = self.saturated or self.in_use >= self.limit
+            self.saturated = False
+            return saturated
+
+
+class ConcurrencyTuner:
+    """
+        Background thread adjusting a ConcurrencyLimit to the measured throughput and error rate.
+        Args:
+            limit: ConcurrencyLimit to adjust; its current limit is the starting level.
+            minimum: Lowest number of slots.
+            maximum: Highest number of slots.
+            interval: Seconds between adjustments.
+            max_error_rate: Share of failed downloads in an interval above which the level is cut.
+            min_gain: Relative throughput gain an extra slot has to bring to be kept.
+            backoff: Factor applied to the level when it is cut.
+            hold: Intervals to stay at a settled level before probing the next one.
+        """
+
+    def __init__(self, limit, minimum, maximum, interval=5.0, max_error_rate=0.1, min_gain=0.05, backoff=0.7,
+                 hold=6):
+        self.limit = limit
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.interval = interval
+        self.max_error_rate = max_error_rate
+        self.min_gain = min_gain
+        self.backoff = backoff
+        self.hold = hold
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.ok = 0
+        self.failed = 0
+        self.previous = None
+        self.holding = 0
+        self.stopped = threading.Event()
+        self.thread = None
+        limit.set_limit(min(self.maximum, max(self.minimum, limit.limit)))
+
+    def record_bytes(self, nbytes):
+        with self.lock:
+            self.bytes += nbytes
+
+    def record_result(self, ok):
+        with self.lock:
+            if ok:
+                self.ok += 1
+            else:
+                self.failed += 1
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='tuner', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        logging.info(f"Connection concurrency settled at {self.limit.limit}",
+                     extra={'stage': 'tuning', 'concurrency': self.limit.limit})
+
+    def run(self):
+        started = time.monotonic()
+        while not self.stopped.wait(self.interval):
+            now = time.monotonic()
+            with self.lock:
+                nbytes, ok, failed = self.bytes, self.ok, self.failed
+                self.bytes = self.ok = self.failed = 0
+            self.adjust(nbytes / (now - started), failed / (ok + failed) if ok + failed else 0.0,
+                        self.limit.take_saturated())
+            started = now
+
+    def adjust(self, rate, error_rate, saturated):
+        """
+            Chooses the level for the next interval.
+            Args:
+                rate: Bytes per second transferred during the last interval.
+                error_rate: Share of downloads that failed during the last interval.
+                saturated: Whether every slot was in use at some point; if not, the rate says nothing about the level.
+            Returns:
+                The new level.
+            """
+        level = self.limit.limit
+        new_level, reason = level, None
+        if error_rate > self.max_error_rate:
+            new_level, reason = max(self.minimum, int(level * self.backoff)), f"error rate {error_rate:.0%}"
+            self.holding = self.hold
+        elif not saturated:
+            # Fewer transfers than slots were waiting: nothing to learn about this level.
+            self.previous = None
+            return level
+        elif self.previous is None:
+            new_level, reason = level + 1, 'probing'
+        else:
+            previous_level, previous_rate = self.previous
+            if previous_level < level:
+                if rate > previous_rate * (1 + self.min_gain):
+                    new_level, reason = level + 1, 'throughput still rising'
+                else:
+                    new_level, reason = previous_level, 'no gain from the last slot'
+                    self.holding = self.hold
+            elif self.holding > 0:
+                self.holding -= 1
+            else:
+                new_level, reason = level + 1, 'probing'
+
+        new_level = min(self.maximum, max(self.minimum, new_level))
+        self.previous = (level, rate)
+        if new_level != level:
+            self.limit.set_limit(new_level)
+            logging.info(f"Connection concurrency {level} -> {new_level} ({reason}) at {rate / 1e6:.2f} MB/s, "
+                         f"error rate {error_rate:.0%}",
+                         extra={'stage': 'tuning', 'concurrency': new_level, 'mb_per_s': round(rate / 1e6, 3),
+                                'error_rate': round(error_rate, 3)})
+        return new_level
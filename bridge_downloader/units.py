@@ -0,0 +1,273 @@
+import csv
+import math
+import os
+import re
+import statistics
+from array import array
+
+
+def fold_umlauts(text):
+    """
+        Replaces German umlauts and sharp s by their two-letter spellings.
+        Args:
+            text: Text to fold.
+        Returns:
+            Folded text.
+        """
+    return text.replace('Ä', 'Ae').replace('Ö', 'Oe').replace('Ü', 'Ue').replace('ä', 'ae').replace('ö', 'oe') \
+        .replace('ü', 'ue').replace('ß', 'ss')
+
+
+# Canonical numeric columns and the (cleaned, lower-case) key patterns that feed them.
+# Keys are matched after fold_umlauts(), so umlauts appear as 'ae', 'oe', 'ue'. German words end compounds such as
+# 'Hauptspannweite' and are matched anywhere; English words only as whole words, so 'span' misses 'Spannglieder'.
+NUMERIC_COLUMNS = {
+    'span_m': (r'spannweite', r'stuetzweite', r'\bspans?\b'),
+    'length_m': (r'laenge', r'\blengths?\b'),
+    'height_m': (r'hoehe', r'\bheights?\b', r'\bclearance\b'),
+    'width_m': (r'breite', r'\bwidths?\b'),
+    'area_m2': (r'flaeche', r'\bareas?\b'),
+}
+NUMERIC_KEY_PATTERNS = {column: re.compile('|'.join(patterns)) for column, patterns in NUMERIC_COLUMNS.items()}
+
+# Columns whose cells may list several values, e.g. 'Spannweiten: 40 m - 50 m - 40 m', of which the largest counts.
+LARGEST_QUANTITY_COLUMNS = ('span_m', 'length_m')
+
+# Key fragments that look like a dimension but describe coordinates or elevation.
+NUMERIC_KEY_EXCLUDES = ('geograph', 'koordinat', 'coordinat', 'latitude', 'longitude', 'grad', 'meereshoehe',
+                        'ueber nn', 'sea level', 'elevation')
+
+# Conversion factors to SI: metres for lengths, square metres for areas.
+LENGTH_UNITS = {
+    'km': 1000.0, 'm': 1.0, 'cm': 0.01, 'mm': 0.001,
+    'mi': 1609.344, 'ft': 0.3048, 'feet': 0.3048, 'foot': 0.3048, "'": 0.3048,
+}
+AREA_UNITS = {
+    'km²': 1e6, 'km2': 1e6, 'ha': 1e4, 'm²': 1.0, 'm2': 1.0, 'qm': 1.0, 'cm²': 1e-4,
+    'ft²': 0.09290304, 'ft2': 0.09290304, 'sq ft': 0.09290304, 'acres': 4046.8564224, 'acre': 4046.8564224,
+}
+
+QUANTITY_PATTERN = re.compile(
+    r"(?P<number>\d[\d\s  .,']*\d|\d)\s*"
+    r"(?P<unit>km²|km2|cm²|m²|m2|ft²|ft2|sq\s?ft|acres?|ha|qm|km|cm|mm|mi|m|feet|foot|ft|')(?![a-zäöü])",
+    re.IGNORECASE
+)
+
+
+def classify_numeric_key(key):
+    """
+        Maps a technical data key onto one of the canonical numeric columns.
+        Args:
+            key: Key as stored in the bridge information.
+        Returns:
+            Name of the canonical column, or None if the key is not a dimension.
+        """
+    lowered = fold_umlauts(key).lower()
+    if any(fragment in lowered for fragment in NUMERIC_KEY_EXCLUDES):
+        return None
+    # Areas first, since e.g. 'Deckflaeche' must not fall through to a length column.
+    for column in ('area_m2', 'span_m', 'height_m', 'width_m', 'length_m'):
+        if NUMERIC_KEY_PATTERNS[column].search(lowered):
+            return column
+    return None
+
+
+def parse_number(text, language_hint="Deutsch"):
+    """
+        Parses a number written in German or English notation.
+        Args:
+            text: Digits with optional thousands and decimal separators, e.g. '1 234,5' or '1,234.5'.
+            language_hint: Decides ambiguous cases such as '1.234' (thousands in German, decimal in English).
+        Returns:
+            The number as a float, or None if it cannot be parsed.
+        """
+    digits = re.sub(r"[\s  ']", '', text)
+    if not digits:
+        return None
+
+    if '.' in digits and ',' in digits:
+        decimal = '.' if digits.rfind('.') > digits.rfind(',') else ','
+    elif ',' in digits or '.' in digits:
+        separator = ',' if ',' in digits else '.'
+        integer_part, _, fraction = digits.rpartition(separator)
+        if digits.count(separator) > 1:
+            decimal = None
+        elif len(fraction) == 3 and len(integer_part) <= 3:
+            if separator == ',':
+                decimal = None if language_hint == "English" else ','
+            else:
+                decimal = None if language_hint != "English" else '.'
+        else:
+            decimal = separator
+    else:
+        decimal = None
+
+    thousands = {'.', ','} - {decimal}
+    for separator in thousands:
+        digits = digits.replace(separator, '')
+    if decimal == ',':
+        digits = digits.replace(',', '.')
+
+    try:
+        return float(digits)
+    except ValueError:
+        return None
+
+
+def parse_quantity(value, column, language_hint="Deutsch"):
+    """
+        Converts a raw technical value into a float in SI units.
+        Args:
+            value: Raw value such as 'Hauptspannweite 120.00 m' or '3 500 m²'.
+            column: Canonical column the value belongs to; decides between length and area units.
+            language_hint: Passed on to parse_number().
+        Returns:
+            The value in metres or square metres, or None if no quantity with a matching unit is found. Spans and
+            lengths give the largest quantity of the value, other columns the first.
+        """
+    if not isinstance(value, str):
+        return None
+
+    units = AREA_UNITS if column == 'area_m2' else LENGTH_UNITS
+    largest = None
+    for match in QUANTITY_PATTERN.finditer(value):
+        unit = re.sub(r'\s+', ' ', match.group('unit').lower())
+        if unit not in units:
+            continue
+        number = parse_number(match.group('number'), language_hint)
+        if number is None:
+            continue
+        if column not in LARGEST_QUANTITY_COLUMNS:
+            return number * units[unit]
+        if largest is None or number * units[unit] > largest:
+            largest = number * units[unit]
+    return largest
+
+
+def parse_quantities(values, column, language_hint="Deutsch"):
+    """
+        Batch form of parse_quantity() for a whole column of raw values.
+        Identical raw strings are parsed only once, which makes re-parsing a large summary cheap.
+        Args:
+            values: Iterable of raw values.
+            column: Canonical column the values belong to.
+            language_hint: Passed on to parse_number().
+        Returns:
+            An array('d') of the same length, with NaN for values that could not be parsed.
+        """
+    parsed = {}
+    result = array('d')
+    for value in values:
+        if value not in parsed:
+            quantity = parse_quantity(value, column, language_hint)
+            parsed[value] = math.nan if quantity is None else quantity
+        result.append(parsed[value])
+    return result
+
+
+def extract_numeric_columns(bridge_info, language_hint="Deutsch"):
+    """
+        Derives the canonical numeric columns (span, length, height, width, area) from a bridge's technical data.
+        If several keys feed the same column, e.g. 'Spannweiten' and 'Hauptspannweite', the largest value is kept.
+        Args:
+            bridge_info: Dictionary containing bridge information.
+            language_hint: Passed on to parse_number().
+        Returns:
+            Dictionary of canonical column names to floats in SI units.
+        """
+    numeric_data = {}
+    for key, value in bridge_info.items():
+        column = classify_numeric_key(key)
+        if column is None:
+            continue
+        quantity = parse_quantity(value, column, language_hint)
+        if quantity is not None and quantity > numeric_data.get(column, -math.inf):
+            numeric_data[column] = quantity
+    return numeric_data
+
+
+def load_numeric_columns(file_path, columns=None, language_hint="Deutsch"):
+    """
+        Loads canonical numeric columns from a summary CSV file as typed arrays.
+        Rows written before the numeric columns existed are re-parsed from their raw technical values.
+        Args:
+            file_path: Path to the summary CSV file.
+            columns: Optional list of canonical column names; defaults to all of NUMERIC_COLUMNS.
+            language_hint: Passed on to parse_number().
+        Returns:
+            Dictionary of column name to array('d'), one entry per bridge and NaN where the value is unknown.
+        """
+    columns = list(columns or NUMERIC_COLUMNS)
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        return {column: array('d') for column in columns}
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f, delimiter=';')
+        headers = next(reader, None) or []
+        rows = list(reader)
+
+    numeric_columns = {}
+    for column in columns:
+        merged = array('d', [math.nan]) * len(rows)
+        sources = [idx for idx, header in enumerate(headers) if classify_numeric_key(header) == column]
+        if column in headers:
+            sources.insert(0, headers.index(column))
+        for idx in sources:
+            raw_values = [row[idx] if idx < len(row) else "N/A" for row in rows]
+            if headers[idx] == column:
+                parsed = array('d', (parse_typed_value(value) for value in raw_values))
+            else:
+                parsed = parse_quantities(raw_values, column, language_hint)
+            for row_idx, quantity in enumerate(parsed):
+                if not math.isnan(quantity) and (math.isnan(merged[row_idx]) or quantity > merged[row_idx]):
+                    merged[row_idx] = quantity
+        numeric_columns[column] = merged
+
+    return numeric_columns
+
+
+def parse_typed_value(value):
+    """
+        Reads back a value that was written to a canonical numeric column.
+        Args:
+            value: Raw CSV cell.
+        Returns:
+            The value as a float, NaN if the cell is empty or not a number.
+        """
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+
+def select_range(numeric_column, low=-math.inf, high=math.inf):
+    """
+        Returns the row indices whose value lies within [low, high].
+        Args:
+            numeric_column: Typed column as returned by load_numeric_columns().
+            low: Lower bound (inclusive).
+            high: Upper bound (inclusive).
+        Returns:
+            List of row indices.
+        """
+    return [idx for idx, value in enumerate(numeric_column) if low <= value <= high]
+
+
+def describe_numeric_column(numeric_column):
+    """
+        Computes summary statistics over a typed column, ignoring unknown values.
+        Args:
+            numeric_column: Typed column as returned by load_numeric_columns().
+        Returns:
+            Dictionary with count, min, max, mean and median (None when the column is empty).
+        """
+    known = [value for value in numeric_column if not math.isnan(value)]
+    if not known:
+        return {'count': 0, 'min': None, 'max': None, 'mean': None, 'median': None}
+    return {
+        'count': len(known),
+        'min': min(known),
+        'max': max(known),
+        'mean': statistics.fmean(known),
+        'median': statistics.median(known),
+    }
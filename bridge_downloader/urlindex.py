@@ -0,0 +1,115 @@
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from .state import connect
+from .storage import create_folder
+
+BLOOM_MAGIC = b'BLOOM001'
+BLOOM_HEADER = struct.Struct('<8sQQI')
+
+
+class BloomFilter:
+    """
+        Bloom filter whose bit array lives in a memory-mapped file, so its size does not count against the heap and
+        it survives across sessions.
+        Args:
+            path: Path of the filter file; created with the given parameters if it does not exist.
+            capacity: Expected number of items.
+            error_rate: Target false-positive rate at capacity.
+        """
+
+    def __init__(self, path, capacity=1000000, error_rate=0.001):
+        self.path = path
+        self.lock = threading.Lock()
+
+        if not os.path.exists(path):
+            num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+            num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+            create_folder(os.path.dirname(path))
+            with open(path, 'wb') as f:
+                f.write(BLOOM_HEADER.pack(BLOOM_MAGIC, num_bits, capacity, num_hashes))
+                f.truncate(BLOOM_HEADER.size + (num_bits + 7) // 8)
+
+        self.file = open(path, 'r+b')
+        self.bits = mmap.mmap(self.file.fileno(), 0)
+        magic, self.num_bits, self.capacity, self.num_hashes = BLOOM_HEADER.unpack_from(self.bits, 0)
+        if magic != BLOOM_MAGIC:
+            self.close()
+            raise ValueError(f"Not a Bloom filter file: {path}")
+
+    def positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        with self.lock:
+            for position in self.positions(item):
+                offset = BLOOM_HEADER.size + position // 8
+                self.bits[offset] |= 1 << (position % 8)
+
+    def __contains__(self, item):
+        for position in self.positions(item):
+            if not self.bits[BLOOM_HEADER.size + position // 8] & (1 << (position % 8)):
+                return False
+        return True
+
+    def flush(self):
+        with self.lock:
+            self.bits.flush()
+
+    def close(self):
+        self.bits.close()
+        self.file.close()
+
+
+class UrlIndex:
+    """
+        Persistent index of the media URLs already downloaded for one query (or bridge).
+        Lookups go to the Bloom filter first; only its positive answers are confirmed against the exact SQLite store,
+        so memory stays bounded and most misses cost no disk access.
+        Args:
+            index_folder: Folder holding the index files.
+            name: Name of the query; used as file name stem.
+            capacity: Expected number of URLs, used to size a new Bloom filter.
+            error_rate: False-positive rate of a new Bloom filter.
+        """
+
+    def __init__(self, index_folder, name, capacity=1000000, error_rate=0.001):
+        self.bloom = BloomFilter(os.path.join(index_folder, f"{name}.bloom"), capacity, error_rate)
+        self.db = connect(os.path.join(index_folder, f"{name}.sqlite"))
+        self.db.execute('CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, file TEXT, added REAL)')
+        self.lock = threading.Lock()
+
+    def __contains__(self, url):
+        if url not in self.bloom:
+            return False
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM urls WHERE url = ?', (url,)).fetchone() is not None
+
+    def add(self, url, file_name=None):
+        """
+            Records a downloaded URL.
+            Args:
+                url: Media URL.
+                file_name: Name of the file it was saved as.
+            """
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO urls (url, file, added) VALUES (?, ?, ?)',
+                            (url, file_name, time.time()))
+        self.bloom.add(url)
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM urls').fetchone()[0]
+
+    def close(self):
+        self.bloom.flush()
+        self.bloom.close()
+        with self.lock:
+            self.db.close()
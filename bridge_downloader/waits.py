@@ -0,0 +1,172 @@
+"""
+    Wait conditions for browser-rendered pages, with recorded wait-time distributions.
+
+    Usage:
+        python -m bridge_downloader.waits [STATS_FILE]
+
+    prints the recorded distributions and the timeouts they suggest.
+    """
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from .profiling import staged
+
+CONTENT = 'content'
+EMPTY = 'empty'
+# Judged empty only because no content appeared for settle_time seconds after loading; a slow page looks the same.
+SETTLED = 'settled'
+TIMEOUT = 'timeout'
+# Samples kept per wait and outcome; older ones are dropped so the file stays small and follows site changes.
+MAX_SAMPLES = 2000
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class WaitStats:
+    """
+        Wait durations per named wait and outcome, persisted as JSON so timeouts can be tuned across sessions.
+        Args:
+            path: JSON file the samples are loaded from and saved to; None keeps them in memory only.
+        """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.samples = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.samples = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning(f"Ignoring unreadable wait statistics {path}: {e}")
+
+    def record(self, name, outcome, seconds):
+        with self.lock:
+            durations = self.samples.setdefault(name, {}).setdefault(outcome, [])
+            durations.append(round(seconds, 3))
+            del durations[:-MAX_SAMPLES]
+
+    def durations(self, name, outcome):
+        with self.lock:
+            return sorted(self.samples.get(name, {}).get(outcome, []))
+
+    def suggest_timeout(self, name, default, min_samples=20, quantile=0.99, margin=1.5, minimum=1.0):
+        """
+            Suggests a timeout that covers nearly all observed content waits.
+            Args:
+                name: Name of the wait.
+                default: Timeout returned while there are fewer than min_samples content samples.
+                min_samples: Number of content samples needed before a suggestion is made.
+                quantile: Share of content waits the timeout should cover.
+                margin: Factor applied to that quantile.
+                minimum: Lower bound of the suggestion.
+            Returns:
+                Timeout in seconds, never above default.
+            """
+        durations = self.durations(name, CONTENT)
+        if len(durations) < min_samples:
+            return default
+        return min(default, max(minimum, percentile(durations, quantile) * margin))
+
+    def report(self):
+        lines = []
+        for name in sorted(self.samples):
+            for outcome in (CONTENT, EMPTY, SETTLED, TIMEOUT):
+                durations = self.durations(name, outcome)
+                if not durations:
+                    continue
+                lines.append(f"{name:<10} {outcome:<8} n={len(durations):<5} p50={percentile(durations, 0.5):6.2f} s  "
+                             f"p90={percentile(durations, 0.9):6.2f} s  p99={percentile(durations, 0.99):6.2f} s  "
+                             f"max={durations[-1]:6.2f} s")
+        return '\n'.join(lines)
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            data = json.dumps(self.samples)
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(temp_path, self.path)
+
+
+@staged('browser')
+def wait_for_any(driver, name, content_selector, empty_selectors=(), timeout=10, settle_time=None, stats=None,
+                 poll_frequency=0.1):
+    """
+        Waits until a page shows either the expected content or a sign that it has none, whichever comes first.
+        A page counts as empty when one of the empty selectors matches. With a settle_time, a page that has finished
+        loading (document.readyState is 'complete') and shows no content settle_time seconds later counts as settled;
+        this fallback cannot tell an empty page from one whose scripts are slow, so callers should treat it as
+        unconfirmed.
+        Args:
+            driver: Selenium WebDriver instance.
+            name: Name under which the wait duration is recorded, e.g. 'media' or 'listing'.
+            content_selector: CSS selector of the expected content.
+            empty_selectors: CSS selectors of markers the site shows when there is no content.
+            timeout: Upper bound of the wait in seconds.
+            settle_time: Seconds to keep waiting after the load completed; None (the default) disables the fallback.
+            stats: Optional WaitStats receiving the duration and outcome.
+            poll_frequency: Seconds between checks.
+        Returns:
+            'content', 'empty', 'settled' or 'timeout'.
+        """
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    start = time.monotonic()
+    loaded_at = []
+
+    def resolved(d):
+        if d.find_elements(By.CSS_SELECTOR, content_selector):
+            return CONTENT
+        for selector in empty_selectors:
+            if d.find_elements(By.CSS_SELECTOR, selector):
+                return EMPTY
+        if settle_time is not None and d.execute_script('return document.readyState') == 'complete':
+            if not loaded_at:
+                loaded_at.append(time.monotonic())
+            elif time.monotonic() - loaded_at[0] >= settle_time:
+                return SETTLED
+        return False
+
+    try:
+        outcome = WebDriverWait(driver, timeout, poll_frequency=poll_frequency).until(resolved)
+    except TimeoutException:
+        outcome = TIMEOUT
+
+    elapsed = time.monotonic() - start
+    if stats is not None:
+        stats.record(name, outcome, elapsed)
+    logging.debug(f"Wait '{name}' resolved as {outcome} after {elapsed:.2f} s")
+    return outcome
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else 'wait_stats.json'
+    if not os.path.exists(path):
+        print(f"No wait statistics at {path}")
+        return
+    stats = WaitStats(path)
+    print(stats.report())
+    for name in sorted(stats.samples):
+        if not stats.durations(name, CONTENT):
+            continue
+        print(f"suggested timeout for '{name}': {stats.suggest_timeout(name, float('inf'), min_samples=1):.1f} s")
+
+
+if __name__ == '__main__':
+    main()
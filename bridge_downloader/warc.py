@@ -0,0 +1,401 @@
+"""
+    Record and replay of crawl traffic in WARC files.
+
+    While recording, every HTTP exchange of the pooled client is appended to rolling, gzip-compressed WARC 1.1 files
+    as a request and a response record, and every page rendered in the browser as a resource record holding its DOM.
+    Each record is its own gzip member, as WARC tools expect, and each file has a JSON-lines index next to it
+    (<file>.idx) with the offset of every record, so a replay opens a record with one seek.
+
+    Response bodies are stored decoded: Content-Encoding and Transfer-Encoding are dropped from the recorded headers
+    and Content-Length is set to the stored body. Error responses are stored without their body and raise the same
+    error again on replay.
+    """
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+# Response headers that describe the transfer rather than the stored body.
+TRANSFER_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length', 'connection', 'keep-alive'}
+# Bodies larger than this are spooled to disk while they are captured.
+SPOOL_BYTES = 1024 * 1024
+READ_SIZE = 1024 * 1024
+
+_recorder = None
+_archive = None
+
+
+class ArchiveMiss(LookupError):
+    """
+        Raised on replay when a URL is not in the archive.
+        """
+
+
+def warc_date():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def block_digest(block):
+    return 'sha1:' + base64.b32encode(hashlib.sha1(block).digest()).decode('ascii')
+
+
+def format_headers(headers):
+    return ''.join(f"{name}: {value}\r\n" for name, value in headers).encode('utf-8')
+
+
+def http_reason(status):
+    try:
+        return HTTPStatus(status).phrase
+    except ValueError:
+        return ''
+
+
+class WarcWriter:
+    """
+        Appends records to rolling, compressed WARC files.
+        Args:
+            folder: Folder of the WARC files.
+            prefix: Start of the file names.
+            max_bytes: Size after which the next file is started.
+        """
+
+    def __init__(self, folder, prefix='crawl', max_bytes=1024 ** 3):
+        self.folder = folder
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.file = None
+        self.index = None
+        os.makedirs(folder, exist_ok=True)
+
+    def open_next(self):
+        # Called with the lock held.
+        self.close()
+        name = f"{self.prefix}-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{self.sequence:05d}.warc.gz"
+        self.sequence += 1
+        path = os.path.join(self.folder, name)
+        self.file = open(path, 'ab')
+        self.index = open(f"{path}.idx", 'a', encoding='utf-8')
+        info = b'software: bridge_downloader\r\nformat: WARC File Format 1.1\r\n'
+        self.file.write(self.compress('warcinfo', None, 'application/warc-fields', info, {'WARC-Filename': name})[1])
+        logging.info(f"Recording traffic to {path}")
+
+    @staticmethod
+    def compress(record_type, uri, content_type, block, extra_headers=None):
+        """
+            Builds one compressed WARC record.
+            Returns:
+                Tuple (record id, compressed bytes, index entry).
+            """
+        record_id = f"<urn:uuid:{uuid.uuid4()}>"
+        headers = [('WARC-Type', record_type), ('WARC-Record-ID', record_id), ('WARC-Date', warc_date())]
+        if uri is not None:
+            headers.append(('WARC-Target-URI', uri))
+        headers += list((extra_headers or {}).items())
+        headers += [('Content-Type', content_type), ('Content-Length', len(block)),
+                    ('WARC-Block-Digest', block_digest(block))]
+        data = b'WARC/1.1\r\n' + format_headers(headers) + b'\r\n' + block + b'\r\n\r\n'
+        return record_id, gzip.compress(data, compresslevel=6), {'type': record_type, 'uri': uri}
+
+    def append(self, records):
+        """
+            Writes compressed records one after another, starting a new file first if the current one is full.
+            Args:
+                records: List of tuples returned by compress().
+            """
+        with self.lock:
+            if self.file is None or self.file.tell() >= self.max_bytes:
+                self.open_next()
+            for _, data, entry in records:
+                self.index.write(json.dumps(dict(entry, offset=self.file.tell(), length=len(data))) + '\n')
+                self.file.write(data)
+            self.file.flush()
+            self.index.flush()
+
+    def write_exchange(self, method, url, request_headers, status, response_headers, body):
+        """
+            Records one HTTP exchange as a request and a response record.
+            Args:
+                method: HTTP method.
+                url: Requested URL.
+                request_headers: Headers that were sent.
+                status: HTTP status code.
+                response_headers: Headers that were received.
+                body: Decoded response body, as bytes or a binary file positioned at its start.
+            """
+        if not isinstance(body, bytes):
+            body = body.read()
+        parts = urlsplit(url)
+        target = parts.path or '/'
+        if parts.query:
+            target += f"?{parts.query}"
+        request_block = f"{method} {target} HTTP/1.1\r\n".encode('utf-8') + \
+            format_headers([('Host', parts.netloc), *request_headers.items()]) + b'\r\n'
+        kept = [(name, value) for name, value in response_headers.items() if name.lower() not in TRANSFER_HEADERS]
+        response_block = f"HTTP/1.1 {status} {http_reason(status)}\r\n".encode('utf-8') + \
+            format_headers([*kept, ('Content-Length', len(body))]) + b'\r\n' + body
+        response_id, response_data, response_entry = self.compress(
+            'response', url, 'application/http;msgtype=response', response_block)
+        response_entry.update(method=method, status=status)
+        request = self.compress('request', url, 'application/http;msgtype=request', request_block,
+                                {'WARC-Concurrent-To': response_id})
+        self.append([request, (response_id, response_data, response_entry)])
+
+    def write_resource(self, url, content, content_type='text/html; charset=utf-8'):
+        """
+            Records a document that was not fetched over HTTP by the client, e.g. the DOM of a rendered page.
+            """
+        self.append([self.compress('resource', url, content_type, content)])
+
+    def close(self):
+        # Called with the lock held, or once writing has stopped.
+        if self.file is not None:
+            self.file.close()
+            self.index.close()
+            self.file = None
+            self.index = None
+
+
+class Capture:
+    """
+        Copies a response body into a spool file while it is read and records the exchange once the body is
+        complete. Bodies that are not read to the end, e.g. image probes, are not recorded.
+        """
+
+    def __init__(self, writer, method, url, request_headers, status, response_headers):
+        self.writer = writer
+        self.exchange = (method, url, dict(request_headers), status, dict(response_headers))
+        self.spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        self.complete = False
+
+    def tee(self, chunks):
+        for chunk in chunks:
+            self.spool.write(chunk)
+            yield chunk
+        self.complete = True
+
+    def finish(self):
+        try:
+            if self.complete:
+                self.spool.seek(0)
+                method, url, request_headers, status, response_headers = self.exchange
+                self.writer.write_exchange(method, url, request_headers, status, response_headers, self.spool)
+        except OSError as e:
+            logging.warning(f"Could not record {self.exchange[1]}: {e}")
+        finally:
+            self.spool.close()
+
+
+def iter_members(path):
+    """
+        Scans a WARC file member by member, for files without an index.
+        Args:
+            path: Path of a .warc.gz file.
+        Returns:
+            Generator of tuples (offset, length, decompressed record).
+        """
+    with open(path, 'rb') as f:
+        data = b''
+        offset = 0
+        while True:
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            record = []
+            consumed = 0
+            while not decompressor.eof:
+                if not data:
+                    data = f.read(READ_SIZE)
+                    if not data:
+                        return
+                record.append(decompressor.decompress(data))
+                consumed += len(data) - len(decompressor.unused_data)
+                data = decompressor.unused_data
+            yield offset, consumed, b''.join(record)
+            offset += consumed
+
+
+def parse_record(record):
+    """
+        Splits a decompressed WARC record into its headers and its block.
+        Returns:
+            Tuple (dictionary of WARC headers, block bytes).
+        """
+    head, _, rest = record.partition(b'\r\n\r\n')
+    headers = {}
+    for line in head.decode('utf-8').split('\r\n')[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip()] = value.strip()
+    return headers, rest[:int(headers.get('Content-Length', len(rest)))]
+
+
+def parse_http_response(block):
+    """
+        Splits the block of a response record.
+        Returns:
+            Tuple (status code, list of (name, value) headers, body bytes).
+        """
+    head, _, body = block.partition(b'\r\n\r\n')
+    lines = head.decode('iso-8859-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = []
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers.append((name.strip(), value.strip()))
+    return status, headers, body
+
+
+def index_entries(path):
+    """
+        Returns the index entries of a WARC file, from its .idx file or by scanning it.
+        """
+    index_path = f"{path}.idx"
+    if os.path.exists(index_path):
+        with open(index_path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    entries = []
+    for offset, length, record in iter_members(path):
+        headers, block = parse_record(record)
+        entry = {'type': headers.get('WARC-Type'), 'uri': headers.get('WARC-Target-URI'), 'offset': offset,
+                 'length': length}
+        if entry['type'] == 'response':
+            entry['status'] = parse_http_response(block)[0]
+            entry['method'] = 'GET'
+        entries.append(entry)
+    return entries
+
+
+def looks_like_html(body):
+    # For servers that label pages with a generic content type.
+    head = body[:512].lstrip().lower()
+    return head.startswith((b'<!doctype html', b'<html'))
+
+
+def warc_files(folder):
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.endswith(('.warc.gz', '.warc')))
+
+
+class WarcArchive:
+    """
+        Read access to the responses and resources of a folder of WARC files, by URL. When a URL was recorded more
+        than once, the latest record wins; the rendered DOM of a page takes precedence over its plain HTTP response.
+        Args:
+            folder: Folder of the WARC files.
+        """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.records = {}
+        self.resources = {}
+        for path in warc_files(folder):
+            for entry in index_entries(path):
+                location = (path, entry['offset'], entry['length'])
+                if entry['type'] == 'response' and entry.get('method', 'GET') == 'GET':
+                    self.records[entry['uri']] = location
+                elif entry['type'] == 'resource':
+                    self.resources[entry['uri']] = location
+        logging.info(f"Replaying {len(self.records)} responses and {len(self.resources)} pages from {folder}")
+
+    def __len__(self):
+        return len(self.records) + len(self.resources)
+
+    def urls(self):
+        return sorted(set(self.records) | set(self.resources))
+
+    def html_pages(self):
+        """
+            Yields every archived HTML page, preferring the rendered DOM over the HTTP response of the same URL.
+            Returns:
+                Generator of tuples (URL, HTML bytes).
+            """
+        for url in self.urls():
+            if url in self.resources:
+                yield url, self.read(self.resources[url])[1]
+                continue
+            status, headers, body = self.response(url)
+            content_type = next((value for name, value in headers if name.lower() == 'content-type'), '')
+            if status == 200 and ('html' in content_type or looks_like_html(body)):
+                yield url, body
+
+    def read(self, location):
+        path, offset, length = location
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        return parse_record(gzip.decompress(data) if path.endswith('.gz') else data)
+
+    def response(self, url):
+        """
+            Returns the recorded HTTP response of a URL.
+            Returns:
+                Tuple (status code, list of (name, value) headers, body bytes).
+            Raises:
+                ArchiveMiss: If the URL was not recorded.
+            """
+        location = self.records.get(url)
+        if location is None:
+            raise ArchiveMiss(f"{url} is not in the archive {self.folder}")
+        _, block = self.read(location)
+        return parse_http_response(block)
+
+    def page(self, url):
+        """
+            Returns the HTML of a page: its rendered DOM if the browser recorded one, else its HTTP response body.
+            Raises:
+                ArchiveMiss: If the URL was not recorded.
+            """
+        location = self.resources.get(url)
+        if location is not None:
+            return self.read(location)[1]
+        return self.response(url)[2]
+
+
+def start_recording(folder, max_bytes=1024 ** 3, prefix='crawl'):
+    """
+        Records the traffic of this process to a folder of WARC files; an empty folder stops recording.
+        """
+    global _recorder
+
+    if _recorder is not None:
+        _recorder.close()
+    _recorder = WarcWriter(folder, prefix, max_bytes) if folder else None
+
+
+def start_replay(folder):
+    """
+        Serves the pooled client from a folder of WARC files instead of the network; an empty folder ends the replay.
+        """
+    global _archive
+
+    _archive = WarcArchive(folder) if folder else None
+
+
+def get_recorder():
+    return _recorder
+
+
+def record_page(url, html):
+    """
+        Records the rendered DOM of a page if traffic is recorded.
+        Args:
+            url: URL the browser was sent to.
+            html: Page source as a string.
+        """
+    if _recorder is not None:
+        try:
+            _recorder.write_resource(url, html.encode('utf-8'))
+        except OSError as e:
+            logging.warning(f"Could not record {url}: {e}")
+
+
+def get_archive():
+    return _archive
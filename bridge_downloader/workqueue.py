@@ -0,0 +1,194 @@
+import json
+import threading
+import time
+
+from .state import connect
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class WorkQueue:
+    """
+        Lease-based work queue of item URLs, stored in SQLite so it can live on storage shared by several processes
+        or machines.
+
+        A worker claims a batch of pending tasks, which leases them to it until a deadline; it must renew the lease
+        while it works and report every task as complete or failed. Leases that run out (because the worker died)
+        are handed to the next worker that claims.
+        Args:
+            db_path: Path of the queue database.
+        """
+
+    def __init__(self, db_path):
+        self.db = connect(db_path)
+        self.lock = threading.Lock()
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                site TEXT NOT NULL,
+                target TEXT,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                merged INTEGER NOT NULL DEFAULT 0,
+                updated REAL,
+                UNIQUE (site, url)
+            );
+            CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_expires);
+        ''')
+
+    def transaction(self, statements):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can never claim the same rows.
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                result = statements(self.db)
+                self.db.execute('COMMIT')
+                return result
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+
+    def enqueue(self, site, target, urls):
+        """
+            Adds item URLs to the queue; URLs already queued for the site are ignored.
+            Args:
+                site: Site name.
+                target: Target the URLs were enumerated from.
+                urls: Iterable of item URLs.
+            Returns:
+                Number of new tasks.
+            """
+        # Enumeration may be slow (listing pages are fetched lazily), so it happens before the write lock is taken.
+        urls = list(urls)
+        now = time.time()
+
+        def insert(db):
+            before = db.total_changes
+            db.executemany('INSERT OR IGNORE INTO tasks (site, target, url, updated) VALUES (?, ?, ?, ?)',
+                           [(site, target, url, now) for url in urls])
+            return db.total_changes - before
+
+        return self.transaction(insert)
+
+    def claim(self, worker, batch_size=10, lease_seconds=300, sites=None):
+        """
+            Leases up to batch_size pending tasks to a worker, reclaiming expired leases first.
+            Args:
+                worker: Unique name of the worker.
+                batch_size: Maximum number of tasks to claim.
+                lease_seconds: Lease duration.
+                sites: Optional collection of site names the worker can handle.
+            Returns:
+                List of (task id, site, url, attempt) tuples; attempt is above 1 for tasks that failed before or whose
+                lease ran out.
+            """
+        now = time.time()
+
+        def lease(db):
+            db.execute('UPDATE tasks SET status = ?, worker = NULL, lease_expires = NULL, updated = ? '
+                       'WHERE status = ? AND lease_expires < ?', (PENDING, now, LEASED, now))
+            query = 'SELECT id, site, url, attempts + 1 FROM tasks WHERE status = ?'
+            parameters = [PENDING]
+            if sites:
+                query += f" AND site IN ({', '.join('?' * len(sites))})"
+                parameters.extend(sites)
+            tasks = db.execute(query + ' ORDER BY id LIMIT ?', parameters + [batch_size]).fetchall()
+            db.executemany('UPDATE tasks SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, '
+                           'updated = ? WHERE id = ?',
+                           [(LEASED, worker, now + lease_seconds, now, task_id) for task_id, _, _, _ in tasks])
+            return tasks
+
+        return self.transaction(lease)
+
+    def renew(self, worker, task_ids, lease_seconds=300):
+        """
+            Extends the leases a worker still holds.
+            Args:
+                worker: Name of the worker.
+                task_ids: IDs of the tasks being worked on.
+                lease_seconds: New lease duration from now.
+            Returns:
+                Number of leases renewed; fewer than len(task_ids) means some were reclaimed by another worker.
+            """
+        now = time.time()
+
+        def extend(db):
+            before = db.total_changes
+            db.executemany('UPDATE tasks SET lease_expires = ?, updated = ? '
+                           'WHERE id = ? AND worker = ? AND status = ?',
+                           [(now + lease_seconds, now, task_id, worker, LEASED) for task_id in task_ids])
+            return db.total_changes - before
+
+        return self.transaction(extend)
+
+    def complete(self, worker, task_id, result=None):
+        """
+            Reports a task as done. Results of a worker that lost its lease are discarded.
+            Args:
+                worker: Name of the worker.
+                task_id: ID of the task.
+                result: JSON-serialisable result, e.g. the record to merge into the summary.
+            Returns:
+                True if the result was accepted.
+            """
+        def finish(db):
+            return db.execute('UPDATE tasks SET status = ?, result = ?, lease_expires = NULL, updated = ? '
+                              'WHERE id = ? AND worker = ? AND status = ?',
+                              (DONE, json.dumps(result, ensure_ascii=False), time.time(), task_id, worker,
+                               LEASED)).rowcount == 1
+
+        return self.transaction(finish)
+
+    def fail(self, worker, task_id, error, max_attempts=3):
+        """
+            Reports a failed task. It is queued again until it has been tried max_attempts times.
+            Args:
+                worker: Name of the worker.
+                task_id: ID of the task.
+                error: Error message.
+                max_attempts: Number of attempts after which the task is given up.
+            """
+        def release(db):
+            db.execute('UPDATE tasks SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, worker = NULL, '
+                       'lease_expires = NULL, error = ?, updated = ? WHERE id = ? AND worker = ? AND status = ?',
+                       (max_attempts, FAILED, PENDING, str(error), time.time(), task_id, worker, LEASED))
+
+        self.transaction(release)
+
+    def unmerged_results(self):
+        """
+            Returns the results of done tasks that were not merged yet, in queue order.
+            Returns:
+                List of (task id, site, result) tuples.
+            """
+        with self.lock:
+            rows = self.db.execute('SELECT id, site, result FROM tasks WHERE status = ? AND merged = 0 ORDER BY id',
+                                   (DONE,)).fetchall()
+        return [(task_id, site, json.loads(result)) for task_id, site, result in rows]
+
+    def mark_merged(self, task_id):
+        with self.lock:
+            self.db.execute('UPDATE tasks SET merged = 1 WHERE id = ?', (task_id,))
+
+    def counts(self):
+        """
+            Returns the number of tasks per status, counting expired leases as pending.
+            """
+        with self.lock:
+            rows = self.db.execute('SELECT CASE WHEN status = ? AND lease_expires < ? THEN ? ELSE status END AS s, '
+                                   'COUNT(*) FROM tasks GROUP BY s', (LEASED, time.time(), PENDING)).fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(rows)
+        return counts
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -1,124 +1,371 @@
 import os
-import json
 import time
-import http.client
-import ssl
-import urllib.request
-import socket
-from bs4 import BeautifulSoup
+import uuid
+import asyncio
+import concurrent.futures
+from collections import deque
+from bridge_downloader.client import configure_client, fetch_soup, download_image
+from bridge_downloader.logs import log_fields, setup_logging
+from bridge_downloader.profiling import profile
+from bridge_downloader.progress import get_progress, show_progress
+from bridge_downloader.sites.bing import get_image_data, get_high_res_image_urls, get_query_slug, get_search_url
+from bridge_downloader.scheduler import configure_scheduler
+from bridge_downloader.scripts import ask, load_script_config, script_parser
+from bridge_downloader.storage import create_folder, image_path, next_image_index
+from bridge_downloader.urlindex import UrlIndex
 
 
-def create_unverified_ssl_context():
-    context = ssl.create_default_context()
-    context.check_hostname = False
-    context.verify_mode = ssl.CERT_NONE
-    return context
+def parse_arguments():
+    parser = script_parser('Downloads image search results from Bing.', 'config_bing.json', 'BING_CONFIG')
+    parser.add_argument('--query', help='search keywords (prompted for if missing)')
+    parser.add_argument('--count', type=int, help='number of images to download (prompted for if missing)')
+    parser.add_argument('--page', type=int,
+                        help='result page to start from (prompted for if missing, 0 in non-interactive mode)')
+    parser.add_argument('--batch-file', help='run the queries of this file instead of a single query')
+    parsed = parser.parse_args()
+    if parsed.non_interactive and parsed.page is None:
+        parsed.page = 0
+    return parsed
 
 
-def get_soup(url):
-    context = create_unverified_ssl_context()
-    req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-    with urllib.request.urlopen(req, context=context) as response:
-        content = response.read()
-    soup = BeautifulSoup(content, 'html.parser')
-    return soup
+args = parse_arguments()
+interactive = not args.non_interactive
+config = load_script_config(args)
 
+base_URL = config['base_URL']
+user_agent = config['user_agent']
+image_folder = config['image_folder']
+images_per_page = config['images_per_page']
+socket_timeout = config['socket_timeout']
+time_lag = config['time_lag']
+pool_size = config['pool_size']
+http2 = config['http2']
+async_mode = config['async_mode']
+concurrent_downloads = config['concurrent_downloads']
+prefetch_pages = config['prefetch_pages']
+batch_file = args.batch_file or config['batch_file']
+batch_concurrent_queries = config['batch_concurrent_queries']
+max_connections = config['max_connections']
+max_requests_per_second = config['max_requests_per_second']
+max_bytes_per_second = config['max_bytes_per_second']
+url_index_enabled = config['url_index']
+url_index_capacity = config['url_index_capacity']
+url_index_error_rate = config['url_index_error_rate']
+max_pages_without_new = config['max_pages_without_new']
+min_image_width = config['min_image_width']
+min_image_height = config['min_image_height']
+max_image_bytes = config['max_image_bytes']
+dashboard = config['dashboard']
+status_file = config['status_file']
+status_port = config['status_port']
+profile_dir = config['profile_dir']
+log_max_bytes = config['log_max_bytes']
+warc_record_dir = config['warc_record_dir']
+warc_max_bytes = config['warc_max_bytes']
+warc_replay_dir = config['warc_replay_dir']
 
-def download_image(url, save_path):
-    if os.path.exists(save_path):
-        print(f"File already exists, skip download:{save_path}")
-        return False
+setup_logging('bridge_downloader_bing.log', max_bytes=log_max_bytes)
 
-    context = create_unverified_ssl_context()
+
+def open_url_index(user_query):
+    # Persistent record of the image URLs already downloaded for a query, kept next to the query folders.
+    if not url_index_enabled:
+        return None
+    return UrlIndex(os.path.join(image_folder, '.url_index'), get_query_slug(user_query), url_index_capacity,
+                    url_index_error_rate)
+
+
+def is_known_url(high_res_image_url, downloaded_urls, url_index):
+    return high_res_image_url in downloaded_urls or (url_index is not None and high_res_image_url in url_index)
+
+
+def get_page_image_urls(user_query, page_number):
+    url = get_search_url(base_URL, user_query, images_per_page * page_number, images_per_page)
+    soup = fetch_soup(url, user_agent)
+    return get_high_res_image_urls(get_image_data(soup))
+
+
+def download_query(user_query, images_to_download, page_number, image_count, downloaded_urls, query_directory,
+                   url_index=None, index_offset=0):
+    # Known images are skipped without stopping, so a re-run pages past the results of earlier sessions.
+    pages_without_new = 0
+    while image_count < images_to_download:
+        high_res_image_urls = get_page_image_urls(user_query, page_number)
+        if not high_res_image_urls:
+            get_progress().note("No more results. Stopping the download.")
+            break
+
+        new_image_urls = [url for url in dict.fromkeys(high_res_image_urls)
+                          if not is_known_url(url, downloaded_urls, url_index)]
+        pages_without_new = 0 if new_image_urls else pages_without_new + 1
+        if pages_without_new >= max_pages_without_new:
+            get_progress().note(f"No new images on {pages_without_new} result pages. Stopping the download.")
+            break
+
+        for high_res_image_url in new_image_urls:
+            if image_count >= images_to_download:
+                break
+
+            save_path = image_path(query_directory, index_offset + image_count)
+            download_success = download_image(high_res_image_url, save_path, user_agent)
+            if download_success:
+                downloaded_urls.add(high_res_image_url)
+                if url_index is not None:
+                    url_index.add(high_res_image_url, os.path.basename(save_path))
+                image_count += 1
+                print_progress(image_count)
+
+        page_number += 1
+        time.sleep(time_lag)
+
+    return image_count
+
+
+async def prefetch_candidates(user_query, page_number, downloaded_urls, url_index, candidates):
+    # Keeps up to `prefetch_pages` result pages in flight and feeds their new image URLs to the download workers.
+    pending_pages = deque()
+    next_page = page_number
+    pages_without_new = 0
+    try:
+        while True:
+            while len(pending_pages) < prefetch_pages:
+                pending_pages.append(asyncio.create_task(asyncio.to_thread(get_page_image_urls, user_query, next_page)))
+                next_page += 1
+
+            try:
+                high_res_image_urls = await pending_pages.popleft()
+            except Exception as e:
+                get_progress().note(f"Failed to fetch result page: {e}")
+                break
+
+            if not high_res_image_urls:
+                get_progress().note("No more results. Stopping the download.")
+                break
+            new_image_urls = [url for url in dict.fromkeys(high_res_image_urls)
+                              if not is_known_url(url, downloaded_urls, url_index)]
+            pages_without_new = 0 if new_image_urls else pages_without_new + 1
+            if pages_without_new >= max_pages_without_new:
+                get_progress().note(f"No new images on {pages_without_new} result pages. Stopping the download.")
+                break
+
+            for high_res_image_url in new_image_urls:
+                downloaded_urls.add(high_res_image_url)
+                await candidates.put(high_res_image_url)
+    finally:
+        for task in pending_pages:
+            task.cancel()
+    await candidates.put(None)
+
+
+def print_progress(image_count):
+    get_progress().note(f"Downloaded images: {image_count}")
+
+
+async def download_query_async(user_query, images_to_download, page_number, image_count, downloaded_urls,
+                               query_directory, on_progress=print_progress, url_index=None, index_offset=0):
+    # Files are downloaded under temporary names and numbered only once they succeed, so the numbering has no gaps
+    # and the download stops exactly at images_to_download.
+    candidates = asyncio.Queue(maxsize=images_per_page * prefetch_pages)
+    state = {'done': image_count, 'in_flight': 0}
+    slots = asyncio.Condition()
+    failed_urls = set()
+
+    async def worker():
+        while True:
+            high_res_image_url = await candidates.get()
+            if high_res_image_url is None:
+                candidates.put_nowait(None)
+                return
+
+            async with slots:
+                await slots.wait_for(lambda: state['done'] + state['in_flight'] < images_to_download
+                                     or state['done'] >= images_to_download)
+                if state['done'] >= images_to_download:
+                    downloaded_urls.discard(high_res_image_url)
+                    return
+                state['in_flight'] += 1
+
+            temp_path = os.path.join(query_directory, f".{uuid.uuid4().hex}.part")
+            download_success = await asyncio.to_thread(download_image, high_res_image_url, temp_path, user_agent)
+
+            async with slots:
+                state['in_flight'] -= 1
+                if download_success:
+                    save_path = image_path(query_directory, index_offset + state['done'])
+                    os.replace(temp_path, save_path)
+                    if url_index is not None:
+                        url_index.add(high_res_image_url, os.path.basename(save_path))
+                    state['done'] += 1
+                    on_progress(state['done'])
+                else:
+                    failed_urls.add(high_res_image_url)
+                slots.notify_all()
+
+    producer = asyncio.create_task(prefetch_candidates(user_query, page_number, downloaded_urls, url_index,
+                                                       candidates))
+    await asyncio.gather(*(worker() for _ in range(concurrent_downloads)))
+    producer.cancel()
+    await asyncio.gather(producer, return_exceptions=True)
+
+    # Candidates that were queued but never tried, and failed ones, may be retried in a later round.
+    downloaded_urls.difference_update(failed_urls)
+    while not candidates.empty():
+        high_res_image_url = candidates.get_nowait()
+        if high_res_image_url is not None:
+            downloaded_urls.discard(high_res_image_url)
+
+    return state['done']
+
+
+def read_batch_file(file_path):
+    # One query per line: 'keywords;number of images[;start page]'. Empty lines and lines starting with '#' are skipped.
+    jobs = []
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = [field.strip() for field in line.split(';')]
+            try:
+                user_query = fields[0]
+                images_to_download = int(fields[1])
+                page_number = int(fields[2]) if len(fields) > 2 and fields[2] else 0
+            except (IndexError, ValueError):
+                print(f"Invalid line {line_number} in {file_path}, skipped: {line}")
+                continue
+            jobs.append((user_query, images_to_download, page_number))
+    return jobs
+
+
+async def download_batch_async(jobs):
+    # Queries run concurrently; all of them share the connection pools, the scheduler's connection and rate budget
+    # and the thread pool of the event loop.
+    query_slots = asyncio.Semaphore(batch_concurrent_queries)
+    total_target = sum(images_to_download for _, images_to_download, _ in jobs)
+    progress = {user_query: 0 for user_query, _, _ in jobs}
+    start_time = time.time()
+    tracker = get_progress()
+    tracker.add_total(len(jobs))
+
+    async def run_query(user_query, images_to_download, page_number):
+        async with query_slots, log_fields(query=user_query):
+            query_directory = os.path.join(image_folder, get_query_slug(user_query))
+            create_folder(query_directory)
+
+            def on_progress(image_count):
+                progress[user_query] = image_count
+                done = sum(progress.values())
+                rate = done / max(time.time() - start_time, 1e-6)
+                tracker.note(f"[{user_query}] {image_count}/{images_to_download} | "
+                             f"overall {done}/{total_target} ({rate:.1f} images/s)")
+
+            tracker.note(f"[{user_query}] started at page {page_number}")
+            url_index = open_url_index(user_query)
+            try:
+                with tracker.stage('query'):
+                    image_count = await download_query_async(user_query, images_to_download, page_number, 0, set(),
+                                                             query_directory, on_progress, url_index,
+                                                             next_image_index(query_directory))
+            finally:
+                if url_index is not None:
+                    url_index.close()
+            tracker.item_done('done' if image_count >= images_to_download else 'failed')
+            tracker.note(f"[{user_query}] finished with {image_count}/{images_to_download} images")
+            return image_count
+
+    return await asyncio.gather(*(run_query(*job) for job in jobs))
+
+
+def run_async(coroutine, max_workers=None):
+    loop = asyncio.new_event_loop()
+    loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_workers or concurrent_downloads + prefetch_pages))
     try:
-        req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req, context=context) as response, open(save_path, 'wb') as out_file:
-            data = response.read()
-            out_file.write(data)
-            return True
-    except urllib.error.URLError as e:
-        print(f"Failed to download image: {url} -> {save_path}, reason: {e}")
-    except http.client.RemoteDisconnected as e:
-        print(f"Remote connection is closed: {url} -> {save_path}, reason: {e}")
-    except ConnectionResetError as e:
-        print(f"Connection reset by remote host: {url} -> {save_path}, reason: {e}")
-    except socket.timeout as e:
-        print(f"Download timeout: {url} -> {save_path}, reason: {e}")
-
-    return False
-
-
-def get_image_data(soup):
-    image_containers = soup.find_all('a', {'class': 'iusc'})
-    image_data = []
-    for container in image_containers:
-        m_data = container.get('m')
-        if m_data:
-            data = json.loads(m_data)
-            image_data.append(data)
-    return image_data
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.run_until_complete(loop.shutdown_default_executor())
+        loop.close()
+
+
+def run_batch():
+    jobs = read_batch_file(batch_file)
+    if not jobs:
+        print(f"No queries found in {batch_file}.")
+        return
+
+    configure_client(timeout=socket_timeout, pool_size=pool_size, http2=http2, min_image_width=min_image_width,
+                     min_image_height=min_image_height, max_image_bytes=max_image_bytes, record_dir=warc_record_dir,
+                     record_max_bytes=warc_max_bytes, replay_dir=warc_replay_dir)
+    configure_scheduler(max_connections=max_connections, max_requests_per_second=max_requests_per_second or None,
+                        max_bytes_per_second=max_bytes_per_second or None)
+    start_time = time.time()
+    # Enough threads for every running query's downloads; the scheduler caps the transfers actually in flight.
+    with profile(profile_dir), show_progress(dashboard, status_file, status_port, unit='queries'):
+        results = run_async(download_batch_async(jobs),
+                            max_workers=batch_concurrent_queries * (concurrent_downloads + prefetch_pages))
+
+    total_target = sum(images_to_download for _, images_to_download, _ in jobs)
+    print(f"Batch finished: {sum(results)}/{total_target} images for {len(jobs)} queries "
+          f"in {time.time() - start_time:.0f} s")
+    for (user_query, images_to_download, _), image_count in zip(jobs, results):
+        if image_count < images_to_download:
+            print(f"Incomplete: {user_query} ({image_count}/{images_to_download})")
 
 
 def main():
-    base_url = "https://www.bing.com"
+    if batch_file:
+        run_batch()
+        return
 
     image_count = 0
-    images_per_page = 35
-    socket.setdefaulttimeout(180)
+    index_offset = 0
+    configure_client(timeout=socket_timeout, pool_size=pool_size, http2=http2, min_image_width=min_image_width,
+                     min_image_height=min_image_height, max_image_bytes=max_image_bytes, record_dir=warc_record_dir,
+                     record_max_bytes=warc_max_bytes, replay_dir=warc_replay_dir)
+    if async_mode:
+        configure_scheduler(max_connections=concurrent_downloads + prefetch_pages)
     keyword_list = []
     next_turn = True
     while next_turn:
-        search_url = "https://www.bing.com/images/search?q={}&form=AWIR&first={}&count={}"
-        images_to_download = int(input("Please enter the number of images you want to search: "))
-        page_number = int(input("\nPlease enter the page from which you want to download(from 0): "))
+        images_to_download = int(ask(args.count, "Please enter the number of images you want to search: ",
+                                     interactive))
+        page_number = int(ask(args.page, "\nPlease enter the page from which you want to download(from 0): ",
+                              interactive))
+
+        user_query = ask(args.query, "\nPlease enter the search keywords: ", interactive)
 
-        user_query = input("\nPlease enter the search keywords: ")
+        query_directory = os.path.join(image_folder, get_query_slug(user_query))
+        create_folder(query_directory)
         if user_query not in keyword_list:
             image_count = 0
+            # Continue after the images kept from earlier sessions instead of overwriting them.
+            index_offset = next_image_index(query_directory)
             keyword_list.append(user_query)
-        user_query = user_query.replace(" ", "+")
-        url_encoded_query = urllib.parse.quote(user_query, safe='')
-        search_url = search_url.format(url_encoded_query, "{}", images_per_page, "{}", "{}", "{}")
-        print(search_url)
-
-        query_directory = os.path.join("images1", user_query)
-        if not os.path.exists(query_directory):
-            os.makedirs(query_directory)
 
         downloaded_urls = set()
+        url_index = open_url_index(user_query)
 
-        while image_count < images_to_download:
-            new_images_downloaded = 0
-            start_index = images_per_page * page_number
-            url = search_url.format(start_index, "{}")
-            soup = get_soup(url)
-
-            image_data = get_image_data(soup)
-            high_res_image_urls = [urllib.parse.quote(data["murl"], safe=":/") for data in image_data]
-
-            for high_res_image_url in high_res_image_urls:
-                if image_count >= images_to_download:
-                    break
-
-                if high_res_image_url in downloaded_urls:
-                    print(f"Image downloaded, skipped: {high_res_image_url}")
-                    continue
-
-                save_path = os.path.join(query_directory, f"image_{image_count}.jpg")
-                download_success = download_image(high_res_image_url, save_path)
-                if download_success:
-                    downloaded_urls.add(high_res_image_url)
-                    image_count += 1
-                    new_images_downloaded += 1
-                    print(f"Downloaded images: {image_count}")
-
-            page_number += 1
-            time.sleep(1)
-
-            if new_images_downloaded == 0:
-                print("No new images found. Stopping the download.")
-                break
+        try:
+            # Only the download runs under the dashboard and the profiler, so neither covers the prompts.
+            with profile(profile_dir), show_progress(dashboard, status_file, status_port, unit='queries') as tracker:
+                tracker.add_total()
+                tracker.note(get_search_url(base_URL, user_query, images_per_page * page_number, images_per_page))
+                with log_fields(query=user_query), tracker.stage('query'):
+                    if async_mode:
+                        image_count = run_async(download_query_async(user_query, images_to_download, page_number,
+                                                                     image_count, downloaded_urls, query_directory,
+                                                                     url_index=url_index, index_offset=index_offset))
+                    else:
+                        image_count = download_query(user_query, images_to_download, page_number, image_count,
+                                                     downloaded_urls, query_directory, url_index, index_offset)
+                tracker.item_done('done' if image_count >= images_to_download else 'failed')
+        finally:
+            if url_index is not None:
+                url_index.close()
 
+        # A query given on the command line is run once.
+        if not interactive or args.query is not None:
+            break
         while True:
             answer = input("\nDo you want to download more?(y/n) ")
             if answer.lower() == 'y':
@@ -1,68 +1,71 @@
-import csv
-import os
 import concurrent.futures
 import time
-import urllib.request
-import urllib.parse
-from urllib.parse import urljoin
-import urllib.error
-from bs4 import BeautifulSoup
-import ssl
-import requests
 import logging
 import json
 import asyncio
-import aiofiles
-from logging.handlers import RotatingFileHandler
-
-try:
-    _create_unverified_https_context = ssl._create_unverified_context
-except AttributeError:
-    pass
-else:
-    ssl._create_default_https_context = _create_unverified_https_context
-
-with open('config_his.json', 'r') as config_file:
-    config = json.load(config_file)
+from collections import deque
+from bridge_downloader.client import configure_client, download_image, fetch_soup
+from bridge_downloader.deadletter import ITEM, configure_dead_letters, record_failure, record_success
+from bridge_downloader.logs import log_fields, setup_logging
+from bridge_downloader.metadata import append_to_summary
+from bridge_downloader.profiling import profile, stage
+from bridge_downloader.progress import get_progress, show_progress
+from bridge_downloader.scheduler import configure_scheduler
+from bridge_downloader.scripts import ask, load_script_config, script_parser
+from bridge_downloader.sites.historicbridges import get_full_bridge_url, get_bridge_links, get_bridge_images, \
+    get_bridge_name, get_bridge_info
+from bridge_downloader.spatial import SpatialIndex
+from bridge_downloader.storage import clean_folder_name, create_folder, create_item_folder, get_existing_items, \
+    image_path
+
+
+def parse_arguments():
+    parser = script_parser('Downloads bridge images and information from historicbridges.org.', 'config_his.json',
+                           'HISTORICBRIDGES_CONFIG')
+    parser.add_argument('--country', help='country code, e.g. FRANCE (prompted for if missing)')
+    parser.add_argument('--count', type=int, help='number of bridges to download (prompted for if missing)')
+    return parser.parse_args()
+
+
+args = parse_arguments()
+interactive = not args.non_interactive
+config = load_script_config(args)
 
 BASE_URL = config['BASE_URL']
 USER_AGENT = config['USER_AGENT']
 IMAGE_FOLDER = config['IMAGE_FOLDER']
 summary_csv_path = config['summary_csv_path']
-time_lag = config['time_lag']
+spatial_index_path = config['spatial_index_path']
+crawl_state_db = config['crawl_state_db']
 total_workers = config['total_workers']
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        RotatingFileHandler('bridge_downloader_his.log', maxBytes=10000, backupCount=5)
-    ]
-)
-
-
-def get_full_bridge_url(country_code, base_url):
-    if country_code == "ZHEJIANG":
-        final_address = f"{base_url}/b_a_list.php?ct=China&c=&ptype=state&pname={country_code}"
-    elif country_code == "Scotland" or country_code == "England" or country_code == "Wales":
-        final_address = f"{base_url}/b_a_list.php?ct=United+Kingdom&c=&ptype=state&pname={country_code}"
-    else:
-        final_address = f"{base_url}/b_a_list.php?ct=&c=&ptype=country&pname={country_code}"
-    return final_address
-
-
-def get_bridge_images(soup):
-    images = []
-    seen_urls = set()
-
-    for img in soup.find_all('img', class_='blackborders'):
-        img_url = img.get('src')
-        full_url = urljoin(BASE_URL, img_url)
-        if img_url and full_url not in seen_urls:
-            seen_urls.add(full_url)
-            images.append(full_url)
-
-    return images
+autotune_workers = config['autotune_workers']
+min_workers = config['min_workers']
+max_workers = config['max_workers']
+concurrent_bridges = config['concurrent_bridges']
+max_requests_per_second = config['max_requests_per_second']
+pool_size = config['pool_size']
+http2 = config['http2']
+min_image_width = config['min_image_width']
+min_image_height = config['min_image_height']
+max_image_bytes = config['max_image_bytes']
+dashboard = config['dashboard']
+status_file = config['status_file']
+status_port = config['status_port']
+profile_dir = config['profile_dir']
+log_max_bytes = config['log_max_bytes']
+warc_record_dir = config['warc_record_dir']
+warc_max_bytes = config['warc_max_bytes']
+warc_replay_dir = config['warc_replay_dir']
+
+setup_logging('bridge_downloader_his.log', max_bytes=log_max_bytes)
+
+configure_scheduler(max_connections=total_workers, max_requests_per_second=max_requests_per_second or None,
+                    autotune_max=max_workers if autotune_workers else None, autotune_min=min_workers)
+configure_client(pool_size=pool_size, http2=http2, min_image_width=min_image_width,
+                 min_image_height=min_image_height, max_image_bytes=max_image_bytes, record_dir=warc_record_dir,
+                 record_max_bytes=warc_max_bytes, replay_dir=warc_replay_dir)
+spatial_index = SpatialIndex(spatial_index_path) if spatial_index_path else None
+configure_dead_letters(crawl_state_db)
 
 
 def list_supported_countries():
@@ -81,204 +84,136 @@ def list_supported_countries():
         print(f"Error reading country codes file: {e}")
 
 
-def create_folder(folder_name):
-    if not os.path.exists(folder_name):
-        os.makedirs(folder_name)
-
-
-def create_bridge_folder(bridge_name):
-    bridge_folder = os.path.join(IMAGE_FOLDER, bridge_name)
-    create_folder(bridge_folder)
-
-    return bridge_folder
-
+def get_new_bridge_urls(country_code, existing_bridges):
+    bridge_type_url = get_full_bridge_url(country_code, BASE_URL)
+    soup = fetch_soup(bridge_type_url, USER_AGENT)
 
-def get_bridge_name(soup):
-    bridge_name = soup.find('h1', class_='center').text.strip()
-    return bridge_name
+    return [bridge_url for bridge_url in dict.fromkeys(get_bridge_links(soup, BASE_URL))
+            if bridge_url not in existing_bridges]
 
 
-def download_images_by_bridge_type(num_bridges, country_code):
+async def write_summaries(summary_queue):
+    # The only task writing to the summary CSV, so rows are appended in completion order without contention.
+    while True:
+        bridge_info = await summary_queue.get()
+        try:
+            if bridge_info is None:
+                return
+            with stage('write'):
+                await append_to_summary(bridge_info, summary_csv_path)
+            if spatial_index is not None:
+                spatial_index.add_bridge('historicbridges', bridge_info['Bridge Name'], bridge_info)
+        except Exception as e:
+            logging.error(f"An error occurred while writing the summary: {e}")
+        finally:
+            summary_queue.task_done()
+
+
+async def process_bridge(bridge_url, existing_bridges, summary_queue):
+    progress = get_progress()
+    with progress.stage('detail'):
+        bridge_info_soup = await asyncio.to_thread(fetch_soup, bridge_url, USER_AGENT)
+    bridge_name = clean_folder_name(get_bridge_name(bridge_info_soup))
+
+    if bridge_name in existing_bridges:
+        logging.info(f"Folder for bridge {bridge_name} already exists. Skipping...")
+        # Skipped bridges do not count towards num_bridges, another one takes their place.
+        progress.add_total()
+        progress.item_done('skipped')
+        return False
+    existing_bridges.add(bridge_name)
+
+    with stage('parse'):
+        bridge_info = get_bridge_info(bridge_info_soup)
+    logging.info(bridge_info)
+    bridge_folder = create_item_folder(IMAGE_FOLDER, bridge_name)
+    await summary_queue.put(bridge_info)
+
+    image_data = get_bridge_images(bridge_info_soup, BASE_URL)
+    if image_data:
+        with progress.stage('media'):
+            await download_images(image_data, bridge_folder)
+
+    progress.item_done()
+    progress.note(f"Downloaded bridge: {bridge_name}")
+    record_success(ITEM, bridge_url)
+    return True
+
+
+async def download_images_by_bridge_type(num_bridges, country_code):
     try:
-        bridge_type_url = get_full_bridge_url(country_code, BASE_URL)
+        existing_bridges = get_existing_items(IMAGE_FOLDER)
     except Exception as e:
-        logging.error(f"Error constructing bridge type URL: {e}")
+        logging.error(f"Error reading bridge folders: {e}")
         return
 
-    all_bridge_urls = []
-    existing_bridges = set()
-
     try:
-        for bridge_name in os.listdir(IMAGE_FOLDER):
-            existing_bridges.add(bridge_name)
+        bridge_urls = deque(await asyncio.to_thread(get_new_bridge_urls, country_code, existing_bridges))
     except Exception as e:
-        logging.error(f"Error reading bridge folders: {e}")
-        return
-
-    while len(all_bridge_urls) < num_bridges:
-        try:
-            response = requests.get(bridge_type_url)
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            divs = soup.find_all('div', class_='col-md-2')
-            for div in divs:
-                if div.find('a'):
-                    bridge_url = urljoin(BASE_URL, div.find('a')['href'])
-
-                    if bridge_url not in all_bridge_urls and bridge_url not in existing_bridges:
-                        all_bridge_urls.append(bridge_url)
-
-            if not all_bridge_urls:
-                break
-        except Exception as e:
-            logging.error(f"An error occurred while fetching bridge links: {e}")
-            break
-
-    downloaded_count = 0
-    for bridge_url in all_bridge_urls:
-        if downloaded_count >= num_bridges:
-            break
-
-        try:
-            response = requests.get(bridge_url)
-            bridge_info_soup = BeautifulSoup(response.content, 'html.parser')
-            bridge_name = get_bridge_name(bridge_info_soup)
-
-            if bridge_name in existing_bridges:
-                logging.info(f"Folder for bridge {bridge_name} already exists. Skipping...")
-                continue
-
-            bridge_info = get_bridge_info(bridge_info_soup)
-            logging.info(bridge_info)
-            bridge_folder = create_bridge_folder(bridge_name)
-            asyncio.run(append_bridge_info_to_csv(bridge_info, summary_csv_path))
-
-            image_data = get_bridge_images(bridge_info_soup)
-            if image_data:
-                download_images(image_data, bridge_folder)
-
-            downloaded_count += 1
-        except Exception as e:
-            logging.error(f"An error occurred while processing bridge: {e}")
-
-        time.sleep(time_lag)
-
-    logging.info("All bridges processed!")
-
-
-def download_images(image_links, bridge_folder):
-    if not os.path.exists(bridge_folder):
-        os.makedirs(bridge_folder)
-
-    download_images_multithreaded(image_links, bridge_folder)
-
-
-def download_images_multithreaded(image_links, bridge_folder):
-    with concurrent.futures.ThreadPoolExecutor(max_workers=total_workers) as executor:
-        futures = []
-        for idx, image_link in enumerate(image_links):
-            save_path = os.path.join(bridge_folder, f"image_{idx}.jpg")
-            futures.append(executor.submit(download_image, image_link, save_path))
-
-        for future in concurrent.futures.as_completed(futures):
-            future.result()
-
-
-def download_image(url, save_path):
-    if os.path.exists(save_path):
-        logging.error(f"File already exists, skip download: {save_path}")
+        logging.error(f"An error occurred while fetching bridge links: {e}")
         return
 
+    # Up to concurrent_bridges bridges are in flight at once. A bridge holds its slot from the detail fetch until its
+    # images are downloaded, and skipped or failed bridges give it back, so exactly num_bridges new bridges are saved.
+    state = {'done': 0, 'in_flight': 0}
+    slots = asyncio.Condition()
+    summary_queue = asyncio.Queue()
+    get_progress().add_total(min(num_bridges, len(bridge_urls)))
+
+    async def worker():
+        while True:
+            async with slots:
+                await slots.wait_for(lambda: state['done'] + state['in_flight'] < num_bridges
+                                     or state['done'] >= num_bridges)
+                if state['done'] >= num_bridges or not bridge_urls:
+                    return
+                bridge_url = bridge_urls.popleft()
+                state['in_flight'] += 1
+
+            try:
+                with log_fields(site='historicbridges', bridge=bridge_url):
+                    processed = await process_bridge(bridge_url, existing_bridges, summary_queue)
+            except Exception as e:
+                logging.error(f"An error occurred while processing bridge: {e}", extra={'bridge': bridge_url})
+                record_failure(ITEM, bridge_url, e, 'historicbridges')
+                get_progress().add_total()
+                get_progress().item_done('failed')
+                processed = False
+
+            async with slots:
+                state['in_flight'] -= 1
+                if processed:
+                    state['done'] += 1
+                slots.notify_all()
+
+    writer = asyncio.create_task(write_summaries(summary_queue))
     try:
-        req = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
-        with urllib.request.urlopen(req) as response, open(save_path, 'wb') as out_file:
-            data = response.read()
-            out_file.write(data)
-            logging.info(f"Downloaded {url} to {save_path}")
-    except urllib.error.URLError as e:
-        logging.error(f"Failed to download image: {url} -> {save_path}, reason: {e}")
-
-
-def extract_div_data(div):
-    div_data = {}
-    key = div.find('strong').text.strip() if div.find('strong') else "Unknown"
-
-    texts = [text for text in div.stripped_strings if text != key]
-    combined_text = ' '.join(texts).strip()
-
-    div_data[key] = combined_text
-    return div_data
+        await asyncio.gather(*(worker() for _ in range(concurrent_bridges)))
+    finally:
+        await summary_queue.put(None)
+        await writer
 
+    logging.info(f"All bridges processed! {state['done']} new bridges downloaded")
 
-def get_bridge_info(soup):
-    bridge_info = {}
 
-    bridge_name = soup.find('h1', class_='center').text.strip()
-    bridge_info['Bridge Name'] = bridge_name
-
-    info_divs = soup.find_all('div', class_='col-md-3')
-    for div in info_divs:
-        bridge_info.update(extract_div_data(div))
-
-    info_divs = soup.find_all('div', class_='col-md-2')
-    for div in info_divs:
-        bridge_info.update(extract_div_data(div))
-
-    return bridge_info
-
-
-def clean_value(value):
-    if isinstance(value, str):
-        return value.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ').strip()
-    return value
-
-
-def get_existing_columns(file_path):
-    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
-        return []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f, delimiter=';')
-        headers = next(reader, None)
-        if headers:
-            headers = [header for header in headers if header != 'Bridge Number']
-        return headers if headers else []
-
-
-async def append_bridge_info_to_csv(bridge_info, file_path):
-    folder_path = os.path.dirname(file_path)
-    create_folder(folder_path)
-
-    existing_columns = get_existing_columns(file_path)
-    all_columns = ['Bridge Number'] + list(existing_columns) + [col for col in bridge_info.keys() if
-                                                                col not in existing_columns]
-
-    bridge_number = sum(1 for row in open(file_path, 'r', encoding='utf-8')) if os.path.exists(file_path) else 1
-
-    if not existing_columns:
-        async with aiofiles.open(file_path, 'w', newline='', encoding='utf-8') as f:
-            await f.write(';'.join(all_columns) + '\n')
-
-    elif len(all_columns) > len(existing_columns) + 1:
-        temp_data = []
-        async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader((await f.read()).splitlines(), delimiter=';')
-            next(reader, None)
-            for row in reader:
-                while len(row) < len(existing_columns) + 1:
-                    row.append("N/A")
-                temp_data.append(row)
+async def download_images(image_links, bridge_folder):
+    create_folder(bridge_folder)
 
-        async with aiofiles.open(file_path, 'w', newline='', encoding='utf-8') as f:
-            await f.write(';'.join(all_columns) + '\n')
-            for row in temp_data:
-                row.extend("N/A" for _ in range(len(all_columns) - len(row)))
-                await f.write(';'.join(row) + '\n')
+    await asyncio.gather(*(asyncio.to_thread(download_image, image_link, image_path(bridge_folder, idx), USER_AGENT)
+                           for idx, image_link in enumerate(image_links)))
 
-    cleaned_bridge_info = {key: clean_value(value) for key, value in bridge_info.items()}
-    bridge_data = [bridge_number] + [cleaned_bridge_info.get(column, "N/A") for column in all_columns[1:]]
 
-    async with aiofiles.open(file_path, 'a', newline='', encoding='utf-8') as f:
-        await f.write(';'.join(map(str, bridge_data)) + '\n')
+def run_async(coroutine):
+    # Blocking fetches and downloads run in the loop's default executor; the scheduler still caps open connections.
+    loop = asyncio.new_event_loop()
+    # The scheduler caps the transfers in flight; the pool only needs enough threads for its highest level.
+    download_threads = max(total_workers, max_workers) if autotune_workers else total_workers
+    loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=download_threads + concurrent_bridges))
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.run_until_complete(loop.shutdown_default_executor())
+        loop.close()
 
 
 def log_runtime(func):
@@ -298,18 +233,19 @@ def main():
     create_folder(path)
 
     try:
-        list_supported_countries()
-        country_code = input(
-            "What country are you looking for a bridge to?: ").strip().upper()
+        if args.country is None and interactive:
+            list_supported_countries()
+        country_code = ask(args.country, "What country are you looking for a bridge to?: ", interactive).strip().upper()
 
         try:
-            num_bridges = int(input("How many bridges do you want to download? "))
+            num_bridges = int(ask(args.count, "How many bridges do you want to download? ", interactive))
         except ValueError:
             print("Invalid number. Exiting.")
             logging.error("Invalid number. Exiting.")
             return
 
-        download_images_by_bridge_type(num_bridges, country_code)
+        with profile(profile_dir), show_progress(dashboard, status_file, status_port):
+            run_async(download_images_by_bridge_type(num_bridges, country_code))
     except Exception as e:
         print(f"An error occurred: {e}")
         logging.error(f"An error occurred: {e}")
@@ -317,4 +253,5 @@ def main():
 
 if __name__ == "__main__":
     main()
-    input("Press the Enter key to exit the program...")
+    if interactive:
+        input("Press the Enter key to exit the program...")
@@ -1,43 +1,50 @@
-import csv
 import os
-import re
-import shutil
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as ec
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+import argparse
 import concurrent.futures
 import time
-import urllib.request
-import urllib.parse
-import urllib.error
-from bs4 import BeautifulSoup
-import ssl
-import requests
 import logging
 import json
 import asyncio
-import aiofiles
-from logging.handlers import RotatingFileHandler
-from requests.exceptions import RequestException
-from requests import Session
-
-# Bypass SSL certificate verification for HTTPS requests
-try:
-    _create_unverified_https_context = ssl._create_unverified_context
-except AttributeError:
-    pass
-else:
-    ssl._create_default_https_context = _create_unverified_https_context
-
-# Load configuration from 'config.json'
-try:
-    with open('config.json', 'r') as config_file:
-        config = json.load(config_file)
-except FileNotFoundError:
-    logging.error("Config file not found.")
+from contextlib import contextmanager
+from bridge_downloader.browser import create_driver, navigate, reuse_tab
+from bridge_downloader.client import NETWORK_ERRORS, configure_client, download_image, fetch, fetch_soup
+from bridge_downloader.deadletter import ITEM, RESOLVE, configure_dead_letters, record_failure, record_success
+from bridge_downloader.deadlines import Deadline
+from bridge_downloader.linkcache import LanguageLinkCache
+from bridge_downloader.logs import log_fields, setup_logging
+from bridge_downloader.metadata import append_to_summary
+from bridge_downloader.names import NameIndex, resolve_names
+from bridge_downloader.profiling import profile, stage
+from bridge_downloader.progress import get_progress, show_progress
+from bridge_downloader.scheduler import configure_scheduler
+from bridge_downloader.scripts import ask, load_script_config, script_parser
+from bridge_downloader.sitemap import SitemapStore, iter_matching
+from bridge_downloader.sites import structurae
+from bridge_downloader.sites.structurae import KEY_MAPPINGS, LOCATION_COUNTRIES, get_full_bridge_url, \
+    get_unique_bridge_name_from_url, get_image_data, get_download_link, get_en_link, format_text, get_bridge_info, \
+    deal_with_value, clean_value, get_typology_text
+from bridge_downloader.spatial import SpatialIndex
+from bridge_downloader.storage import create_folder, create_item_folder, get_existing_items, image_path
+from bridge_downloader.waits import CONTENT, SETTLED, TIMEOUT, WaitStats, wait_for_any
+from bridge_downloader.warc import get_recorder, record_page
+
+
+def parse_arguments():
+    parser = script_parser('Downloads bridge images and information from structurae.net.', 'config.json',
+                           'STRUCTURAE_CONFIG')
+    parser.add_argument('--mode', choices=['name', 'type'], help='search by name or by type (prompted for if missing)')
+    parser.add_argument('--bridges-file', default='bridges.txt', help='bridge names to search for, one per line')
+    parser.add_argument('--bridge-type', help='name of the bridge type (prompted for if missing)')
+    parser.add_argument('--count', type=int, help='number of bridges to download (prompted for if missing)')
+    parser.add_argument('--country', help='only bridges of this country code; requires logging in')
+    parser.add_argument('--login', action=argparse.BooleanOptionalAction,
+                        help='log in by hand in the browser before crawling (prompted for if missing)')
+    return parser.parse_args()
+
+
+args = parse_arguments()
+interactive = not args.non_interactive
+config = load_script_config(args)
 
 # Configuration variables
 base_URL = config['base_URL']
@@ -49,22 +56,65 @@ output_folder = config['output_folder']
 summary_csv_path = config['summary_csv_path']
 time_lag = config['time_lag']
 download_timeout = config['download_timeout']
-threat_timeout = config['threat_timeout']
+bridge_time_budget = config['bridge_time_budget']
+stall_timeout = config['stall_timeout']
+min_throughput = config['min_throughput']
 multithreading = config['multithreading']
 total_workers = config['total_workers']
+# Autotuning only applies to parallel downloads, so it stays off while multithreading is disabled.
+autotune_workers = config['autotune_workers'] and multithreading == "True"
+min_workers = config['min_workers']
+max_workers = config['max_workers']
 chrome_driver_path = config['chrome_driver_path']
 template_folder_en = config['template_folder_en']
 template_folder_de = config['template_folder_de']
 language = config['language']
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        RotatingFileHandler('bridge_downloader.log', maxBytes=2000, backupCount=5, encoding='utf-8')
-    ]
-)
+language_link_cache = config['language_link_cache']
+spatial_index_path = config['spatial_index_path']
+crawl_state_db = config['crawl_state_db']
+pool_size = config['pool_size']
+http2 = config['http2']
+browser_light = config['browser_light']
+browser_headless = config['browser_headless']
+browser_cache_dir = config['browser_cache_dir']
+media_wait_timeout = config['media_wait_timeout']
+listing_wait_timeout = config['listing_wait_timeout']
+wait_settle_time = config['wait_settle_time']
+media_empty_selectors = config['media_empty_selectors']
+listing_empty_selectors = config['listing_empty_selectors']
+adaptive_wait_timeouts = config['adaptive_wait_timeouts']
+wait_stats_path = config['wait_stats_path']
+min_image_width = config['min_image_width']
+min_image_height = config['min_image_height']
+max_image_bytes = config['max_image_bytes']
+dashboard = config['dashboard']
+status_file = config['status_file']
+status_port = config['status_port']
+profile_dir = config['profile_dir']
+log_max_bytes = config['log_max_bytes']
+warc_record_dir = config['warc_record_dir']
+warc_max_bytes = config['warc_max_bytes']
+warc_replay_dir = config['warc_replay_dir']
+
+# Records are written as JSON lines by a background thread
+setup_logging('bridge_downloader.log', max_bytes=log_max_bytes)
+
+# Shared connection budget and keep-alive connection pools for page fetches and image downloads
+# With autotuning the number of connections starts at total_workers and follows the measured throughput.
+scheduler = configure_scheduler(max_connections=total_workers, item_workers=total_workers,
+                                autotune_max=max_workers if autotune_workers else None, autotune_min=min_workers)
+wait_stats = WaitStats(wait_stats_path)
+language_links = LanguageLinkCache(language_link_cache) if language == "English" else None
+spatial_index = SpatialIndex(spatial_index_path) if spatial_index_path else None
+configure_dead_letters(crawl_state_db)
+name_index = NameIndex(crawl_state_db) if crawl_state_db else None
+sitemap_store = SitemapStore(crawl_state_db) if crawl_state_db else None
+configure_client(pool_size=pool_size, http2=http2, min_image_width=min_image_width,
+                 min_image_height=min_image_height, max_image_bytes=max_image_bytes, stall_timeout=stall_timeout,
+                 min_throughput=min_throughput, record_dir=warc_record_dir, record_max_bytes=warc_max_bytes)
+if warc_replay_dir:
+    raise SystemExit("The structurae script drives a browser and cannot replay an archive; replay it with "
+                     "python -m bridge_downloader --replay DIR structurae=...")
 
 
 def navigate_and_wait(driver, url):
@@ -76,27 +126,86 @@ def navigate_and_wait(driver, url):
         Returns:
             BeautifulSoup object of the page source after loading.
         """
-    driver.set_window_size(window_size_width, window_size_height)
-    driver.get(url)
-    return BeautifulSoup(driver.page_source, 'html.parser')
+    return navigate(driver, url)
 
 
-def get_full_bridge_url(country_code, bridge_type, base_usl):
+def resolve_en_link(bridge_url_de):
     """
-        Constructs the full URL for a specific bridge type and country.
+        Looks up the English link of a bridge page, reading it from the German page over plain HTTP if it is not
+        cached yet.
         Args:
-            country_code: Code of the country.
-            bridge_type: Type of the bridge.
-            base_usl: Base URL for the website.
+            bridge_url_de: URL of the German bridge page.
         Returns:
-            The constructed URL as a string.
+            Link of the English page, or None if there is none.
         """
-    if country_code:
-        final_address = f"{base_usl}/bauwerke/bruecken/{bridge_type}/liste?filtercountry={country_code}"
-        return final_address
-    else:
-        final_address = f"{base_usl}/bauwerke/bruecken/{bridge_type}/liste"
-        return final_address
+    bridge_url_en = language_links.get(bridge_url_de)
+    if bridge_url_en is None:
+        bridge_url_en = get_en_link(fetch_soup(bridge_url_de, user_agent, download_timeout))
+        if bridge_url_en:
+            language_links.set(bridge_url_de, bridge_url_en)
+    return bridge_url_en
+
+
+def prefetch_en_links(bridge_urls_de):
+    """
+        Starts resolving the English links of upcoming bridges in the background while the browser is busy.
+        Args:
+            bridge_urls_de: URLs of the German bridge pages.
+        Returns:
+            Dictionary of German URL to future of its English link; empty unless the language is English.
+        """
+    if language != "English":
+        return {}
+    return {bridge_url_de: scheduler.submit_item(resolve_en_link, bridge_url_de) for bridge_url_de in bridge_urls_de}
+
+
+def get_bridge_info_soup(driver, bridge_url_de, base_url, en_links):
+    """
+        Loads a bridge page in the configured language. In English mode the English URL comes from the link cache or
+        the background lookup, so the German page is only loaded in the browser if neither found it.
+        Args:
+            driver: Selenium WebDriver instance.
+            bridge_url_de: URL of the German bridge page.
+            base_url: Base URL of the website.
+            en_links: Futures returned by prefetch_en_links().
+        Returns:
+            Tuple (URL of the loaded page, BeautifulSoup object of the page).
+        """
+    if language != "English":
+        return bridge_url_de, navigate_and_wait(driver, bridge_url_de)
+
+    bridge_url_en = None
+    if bridge_url_de in en_links:
+        try:
+            bridge_url_en = en_links[bridge_url_de].result()
+        except Exception as e:
+            logging.warning(f"Could not look up the English link of {bridge_url_de}: {e}")
+
+    if bridge_url_en is None:
+        bridge_info_soup_de = navigate_and_wait(driver, bridge_url_de)
+        bridge_url_en = get_en_link(bridge_info_soup_de)
+        if not bridge_url_en:
+            logging.warning(f"No English version of {bridge_url_de}, using the German page")
+            return bridge_url_de, bridge_info_soup_de
+        language_links.set(bridge_url_de, bridge_url_en)
+
+    bridge_url = base_url + bridge_url_en
+    return bridge_url, navigate_and_wait(driver, bridge_url)
+
+
+def get_wait_timeout(name, default):
+    """
+        Returns the timeout of a named wait: the configured one, or one derived from the recorded wait times if
+        adaptive timeouts are enabled.
+        Args:
+            name: Name of the wait.
+            default: Configured timeout in seconds.
+        Returns:
+            Timeout in seconds.
+        """
+    if adaptive_wait_timeouts:
+        return wait_stats.suggest_timeout(name, default)
+    return default
 
 
 def get_bridge_media_soup(driver, url):
@@ -106,22 +215,28 @@ def get_bridge_media_soup(driver, url):
             driver: Selenium WebDriver instance.
             url: URL of the bridge's main page.
         Returns:
-            BeautifulSoup object of the bridge's media page.
+            Tuple of the BeautifulSoup object of the bridge's media page and the outcome of the wait for its media.
         """
     media_url = f"{url}/medien"
-    driver.set_window_size(window_size_width, window_size_height)
-    driver.get(media_url)
-
-    try:
-        WebDriverWait(driver, 10).until(
-            ec.presence_of_element_located((By.CSS_SELECTOR, "a.imageThumbLink_2"))
-        )
-    except TimeoutException:
+    with stage('browser'):
+        reuse_tab(driver)
+        driver.get(media_url)
+
+    outcome = wait_for_any(driver, 'media', "a.imageThumbLink_2", media_empty_selectors,
+                           get_wait_timeout('media', media_wait_timeout), wait_settle_time, wait_stats)
+    if outcome == SETTLED:
+        logging.warning(f"No media on {media_url} after the page settled; it may not have finished rendering")
+    if outcome != CONTENT:
         logging.info("No image found for the bridge. Continuing to extract other information...")
-        print("No image found for the bridge. Continuing to extract other information...")
+        get_progress().note("No image found for the bridge. Continuing to extract other information...")
+
+    page_source = driver.page_source
+    record_page(media_url, page_source)
+    with stage('parse'):
+        from bs4 import BeautifulSoup
 
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
-    return soup
+        soup = BeautifulSoup(page_source, 'html.parser')
+    return soup, outcome
 
 
 def choose_bridge_type():
@@ -146,7 +261,7 @@ def choose_bridge_type():
         print(f"Error reading country codes file: {e}")
         return
 
-    text = input("Please enter the name of the bridge type: ")
+    text = ask(args.bridge_type, "Please enter the name of the bridge type: ", interactive)
     typename = format_text(text)
 
     return typename
@@ -181,35 +296,16 @@ def choose_search_type():
         "Name": "name",
         "Type": "type",
     }
+    if args.mode is not None:
+        return args.mode
     print("Please choose a search type:")
     for idx, (name, _) in enumerate(bridge_search_types.items(), 1):
         print(f"{idx}. {name}")
-    choice = int(input("Enter the number of your choice: "))
+    choice = int(ask(None, "Enter the number of your choice: ", interactive))
     chosen_type = list(bridge_search_types.values())[choice - 1]
     return chosen_type
 
 
-def clean_folder_name(folder_name):
-    """
-        Cleans and formats the folder name by removing invalid characters.
-        Args:
-            folder_name: The original folder name.
-        Returns:
-            Cleaned folder name as a string.
-        """
-    return re.sub(r'[<>:"/\\|?*]', '_', folder_name)
-
-
-def create_folder(folder_name):
-    """
-        Creates a new folder if it does not already exist.
-        Args:
-            folder_name: Name of the folder to create.
-        """
-    if not os.path.exists(folder_name):
-        os.makedirs(folder_name)
-
-
 def create_unique_bridge_folder_from_url(bridge_url):
     """
         Creates a unique folder for a bridge based on its URL.
@@ -218,22 +314,7 @@ def create_unique_bridge_folder_from_url(bridge_url):
         Returns:
             Path of the created folder.
         """
-    bridge_folder = os.path.join(image_folder, get_unique_bridge_name_from_url(bridge_url))
-    create_folder(bridge_folder)
-
-    return bridge_folder
-
-
-def get_unique_bridge_name_from_url(bridge_url):
-    """
-        Extracts a unique bridge name from its URL.
-        Args:
-            bridge_url: URL of the bridge.
-        Returns:
-            Unique bridge name as a string.
-        """
-    unique_identifier = bridge_url.rstrip('/').split('/')[-1]
-    return unique_identifier
+    return create_item_folder(image_folder, get_unique_bridge_name_from_url(bridge_url))
 
 
 def download_images_by_bridge_name(driver, bridge_names, base_url, key_mapping):
@@ -247,56 +328,58 @@ def download_images_by_bridge_name(driver, bridge_names, base_url, key_mapping):
         """
     problematic_bridges = []
     more_address_bridges = []
-    session = Session()
+    # Names are resolved from the local name index when one was built; names it cannot resolve get a guessed slug.
+    bridge_urls = resolve_names(name_index, 'structurae', bridge_names, base_url, guess=True)
+    en_links = prefetch_en_links(list(bridge_urls.values()))
+    progress = get_progress()
+    progress.add_total(len(bridge_names))
 
     for bridge_name_to_download in bridge_names:
-        print(f"Processing bridge: {bridge_name_to_download}")
+        progress.note(f"Processing bridge: {bridge_name_to_download}")
         logging.info(f"Processing bridge: {bridge_name_to_download}")
-        formatted_bridge_name = format_text(bridge_name_to_download)
 
-        bridge_url_de = f"{base_url}/bauwerke/{formatted_bridge_name}"
-        bridge_info_soup_de = navigate_and_wait(driver, bridge_url_de)
-        bridge_url_en = get_en_link(bridge_info_soup_de)
-        if language == "English":
-            bridge_url = base_url + bridge_url_en
-            bridge_info_soup = navigate_and_wait(driver, bridge_url)
-        else:
-            bridge_url = bridge_url_de
-            bridge_info_soup = bridge_info_soup_de
+        bridge_url_de = bridge_urls[bridge_name_to_download]
+        with progress.stage('detail'):
+            bridge_url, bridge_info_soup = get_bridge_info_soup(driver, bridge_url_de, base_url, en_links)
 
         try:
             try:
-                response = requests.get(bridge_url)
-
-                if response.status_code != 200:
-                    raise RequestException(f"Failed to fetch bridge data: {response.status_code}")
-
-            except RequestException as e:
+                fetch(bridge_url, user_agent, download_timeout)
+            except NETWORK_ERRORS as e:
                 logging.warning(f"Bridge not found or network error: {e}")
                 problematic_bridges.append(bridge_name_to_download)
+                progress.item_done('failed')
+                record_failure(ITEM, bridge_url_de, e, 'structurae')
                 continue
 
             try:
-                bridge_info = get_bridge_info(bridge_info_soup)
+                with stage('parse'):
+                    bridge_info = get_bridge_info(bridge_info_soup, language)
             except Exception as e:
                 logging.error(f"Error processing bridge info: {e}")
+                progress.item_done('failed')
+                record_failure(ITEM, bridge_url_de, e, 'structurae')
                 continue
 
-            replaced_bridge_info, more_address_bridge = deal_with_value(bridge_info, key_mapping)
+            replaced_bridge_info, more_address_bridge = deal_with_value(bridge_info, key_mapping, language)
 
             if more_address_bridge:
                 more_address_bridges.append(bridge_name_to_download)
 
             bridge_folder = create_unique_bridge_folder_from_url(bridge_url_de)
 
-            bridge_media_soup = get_bridge_media_soup(driver, bridge_url_de)
-            image_data = get_image_data(bridge_media_soup)
-            if not image_data:
-                image_count = 0
-                problematic_bridges.append(bridge_name_to_download)
-            else:
-                image_count = len(image_data)
-                download_images(image_data, bridge_folder)
+            with progress.stage('media'):
+                bridge_media_soup, media_outcome = get_bridge_media_soup(driver, bridge_url_de)
+                image_data = get_image_data(bridge_media_soup)
+                if not image_data:
+                    image_count = 0
+                    problematic_bridges.append(bridge_name_to_download)
+                    # Many bridges have no media; only a settled page may just not have rendered its gallery yet.
+                    if media_outcome == SETTLED:
+                        record_failure(ITEM, bridge_url_de, 'MediaSettled', 'structurae')
+                else:
+                    image_count = len(image_data)
+                    download_images(image_data, bridge_folder)
 
             if language == "English":
                 replaced_bridge_info['Image Count'] = image_count
@@ -308,60 +391,85 @@ def download_images_by_bridge_name(driver, bridge_names, base_url, key_mapping):
             else:
                 replaced_bridge_info['eindeutiger Name'] = get_unique_bridge_name_from_url(bridge_url_de)
 
-            asyncio.run(process_all_templates(replaced_bridge_info))
-            asyncio.run(append_bridge_info_to_summary(replaced_bridge_info, summary_csv_path))
+            with progress.stage('metadata'), stage('write'):
+                asyncio.run(process_all_templates(replaced_bridge_info))
+                asyncio.run(append_bridge_info_to_summary(replaced_bridge_info, summary_csv_path))
+            progress.item_done()
+            if media_outcome != SETTLED:
+                record_success(ITEM, bridge_url_de)
 
             time.sleep(1)
 
         except Exception as e:
             logging.error(f"An error occurred while processing {bridge_name_to_download}: {e}")
             problematic_bridges.append(bridge_name_to_download)
+            progress.item_done('failed')
+            record_failure(ITEM, bridge_url_de, e, 'structurae')
 
     if len(more_address_bridges) > 0:
         logging.info(f"More address bridges: {more_address_bridges}")
-        print(f"More address bridges: {more_address_bridges}")
+        progress.note(f"More address bridges: {more_address_bridges}")
 
     if len(problematic_bridges) > 0:
-        print(f"Problematic bridges : {problematic_bridges}")
+        progress.note(f"Problematic bridges : {problematic_bridges}")
         logging.info(f"Problematic bridges : {problematic_bridges}")
 
     logging.info("All bridges processed!")
-    print("All bridges processed!")
+    progress.note("All bridges processed!")
 
-    session.close()
 
+def sitemap_synced():
+    return sitemap_store is not None and sitemap_store.counts('structurae')['urls'] > 0
 
-def download_images_by_bridge_type(driver, bridge_type, num_bridges, base_url, key_mapping, country_code=None):
+
+def list_bridges_from_sitemap(bridge_type, num_bridges, existing_bridges, country_code=None):
     """
-        Downloads images for bridges of a specific type.
+        Collects the URLs of bridges of a type, and optionally a country, from the sitemap URLs in the crawl-state
+        database (see python -m bridge_downloader.sitemap), without a browser or login. Pages not classified yet are
+        classified over plain HTTP as far as needed.
         Args:
-            driver: Selenium WebDriver instance.
-            bridge_type: Type of the bridge.
-            num_bridges: Number of bridges to download.
-            base_url: Base URL of the website.
-            key_mapping: Mapping of keys for data extraction.
+            bridge_type: Slug of the bridge type listing.
+            num_bridges: Number of bridges to collect.
+            existing_bridges: Folder names of bridges that were already downloaded.
             country_code: Optional country code.
+        Returns:
+            List of bridge URLs without a folder, or None if the sitemap was not synced or the country is unknown.
+        """
+    if not sitemap_synced():
+        return None
+    country = LOCATION_COUNTRIES.get(country_code) if country_code else None
+    if country_code and country is None:
+        return None
+
+    bridge_urls = []
+    for url in iter_matching(sitemap_store, 'structurae', get_typology_text(bridge_type), country, user_agent,
+                             scheduler):
+        bridge_unique_name = get_unique_bridge_name_from_url(url)
+        if bridge_unique_name in existing_bridges:
+            logging.info(f"Folder for bridge {bridge_unique_name} already exists. Skipping...")
+            continue
+        bridge_urls.append(url)
+        if len(bridge_urls) >= num_bridges:
+            break
+    return bridge_urls
+
+
+def list_bridges_in_browser(driver, bridge_type_url, num_bridges, existing_bridges):
+    """
+        Collects the URLs of bridges from the pages of a type listing rendered in the browser.
+        Args:
+            driver: Selenium WebDriver instance.
+            bridge_type_url: URL of the first listing page.
+            num_bridges: Number of bridges to collect.
+            existing_bridges: Folder names of bridges that were already downloaded.
+        Returns:
+            List of bridge URLs without a folder.
         """
-    try:
-        bridge_type_url = get_full_bridge_url(country_code, bridge_type, base_url)
-    except Exception as e:
-        print(f"Error constructing bridge type URL: {e}")
-        logging.error(f"Error constructing bridge type URL: {e}")
-        return
+    from selenium.common.exceptions import NoSuchElementException
+    from selenium.webdriver.common.by import By
 
     all_bridge_urls = []
-    more_address_bridges = []
     page = 0
-    existing_bridges = set()
-
-    try:
-        for bridge_name in os.listdir(image_folder):
-            existing_bridges.add(bridge_name)
-    except Exception as e:
-        print(f"Error constructing bridge type URL: {e}")
-        logging.error(f"Error reading bridge folders: {e}")
-        return
-
     while len(all_bridge_urls) < num_bridges:
         unprocessed_urls = []
 
@@ -369,13 +477,19 @@ def download_images_by_bridge_type(driver, bridge_type, num_bridges, base_url, k
             current_page_url = bridge_type_url if page == 0 else f"{bridge_type_url}?min={page * 100}"
             navigate_and_wait(driver, current_page_url)
 
-            WebDriverWait(driver, 60).until(
-                ec.presence_of_element_located((By.CSS_SELECTOR, "td > a.listableleft"))
-            )
+            outcome = wait_for_any(driver, 'listing', "td > a.listableleft", listing_empty_selectors,
+                                   get_wait_timeout('listing', listing_wait_timeout), wait_settle_time, wait_stats)
+            if outcome == TIMEOUT:
+                logging.info("Timed out waiting for page to load")
+                break
+            if outcome == SETTLED:
+                # Recorded without a site, so a redrive lists it instead of crawling it as a bridge.
+                logging.warning(f"No bridges on {current_page_url} after the page settled; ending the listing there")
+                record_failure(ITEM, current_page_url, 'ListingSettled')
+                break
+            if get_recorder() is not None:
+                record_page(current_page_url, driver.page_source)
             bridge_links = driver.find_elements(By.CSS_SELECTOR, "td > a.listableleft")
-        except TimeoutException:
-            logging.info("Timed out waiting for page to load")
-            break
         except NoSuchElementException:
             logging.info("No bridge links found on the page")
             break
@@ -398,37 +512,74 @@ def download_images_by_bridge_type(driver, bridge_type, num_bridges, base_url, k
         all_bridge_urls.extend(unprocessed_urls)
 
         page += 1
+    return all_bridge_urls
+
+
+def download_images_by_bridge_type(driver, bridge_type, num_bridges, base_url, key_mapping, country_code=None):
+    """
+        Downloads images for bridges of a specific type.
+        The bridges are taken from the synced sitemap when it has matches; the listing pages are only loaded in the
+        browser otherwise.
+        Args:
+            driver: Selenium WebDriver instance.
+            bridge_type: Type of the bridge.
+            num_bridges: Number of bridges to download.
+            base_url: Base URL of the website.
+            key_mapping: Mapping of keys for data extraction.
+            country_code: Optional country code.
+        """
+    more_address_bridges = []
+    try:
+        existing_bridges = get_existing_items(image_folder)
+    except Exception as e:
+        print(f"Error constructing bridge type URL: {e}")
+        logging.error(f"Error reading bridge folders: {e}")
+        return
+
+    all_bridge_urls = list_bridges_from_sitemap(bridge_type, num_bridges, existing_bridges, country_code)
+    if all_bridge_urls:
+        logging.info(f"Found {len(all_bridge_urls)} bridges in the sitemap")
+    else:
+        try:
+            bridge_type_url = get_full_bridge_url(country_code, bridge_type, base_url)
+        except Exception as e:
+            print(f"Error constructing bridge type URL: {e}")
+            logging.error(f"Error constructing bridge type URL: {e}")
+            return
+        all_bridge_urls = list_bridges_in_browser(driver, bridge_type_url, num_bridges, existing_bridges)
 
     downloaded_count = 0
+    en_links = prefetch_en_links(all_bridge_urls[:num_bridges])
+    progress = get_progress()
+    progress.add_total(min(num_bridges, len(all_bridge_urls)))
     for idx, bridge_url_de in enumerate(all_bridge_urls, 1):
-        bridge_info_soup_de = navigate_and_wait(driver, bridge_url_de)
-
-        bridge_url_en = get_en_link(bridge_info_soup_de)
-        if language == "English":
-            bridge_url = base_url + bridge_url_en
-            bridge_info_soup = navigate_and_wait(driver, bridge_url)
-        else:
-            bridge_info_soup = bridge_info_soup_de
         try:
-            bridge_info = get_bridge_info(bridge_info_soup)
-            replaced_bridge_info, more_address_bridge = deal_with_value(bridge_info, key_mapping)
+            with progress.stage('detail'):
+                _, bridge_info_soup = get_bridge_info_soup(driver, bridge_url_de, base_url, en_links)
+            with stage('parse'):
+                bridge_info = get_bridge_info(bridge_info_soup, language)
+            replaced_bridge_info, more_address_bridge = deal_with_value(bridge_info, key_mapping, language)
 
             if more_address_bridge:
                 more_address_bridges.append(get_unique_bridge_name_from_url(bridge_url_de))
 
             logging.info(f"Processing bridge {downloaded_count + 1} of {num_bridges}...")
-            print(f"Processing bridge {downloaded_count + 1} of {num_bridges}...")
+            progress.note(f"Processing bridge {downloaded_count + 1} of {num_bridges}...")
 
             bridge_folder = create_unique_bridge_folder_from_url(bridge_url_de)
 
-            bridge_media_soup = get_bridge_media_soup(driver, bridge_url_de)
-            image_data = get_image_data(bridge_media_soup)
+            with progress.stage('media'):
+                bridge_media_soup, media_outcome = get_bridge_media_soup(driver, bridge_url_de)
+                image_data = get_image_data(bridge_media_soup)
 
-            if image_data:
-                image_count = len(image_data)
-                download_images(image_data, bridge_folder)
-            else:
-                image_count = 0
+                if image_data:
+                    image_count = len(image_data)
+                    download_images(image_data, bridge_folder)
+                else:
+                    image_count = 0
+                    # Many bridges have no media; only a settled page may just not have rendered its gallery yet.
+                    if media_outcome == SETTLED:
+                        record_failure(ITEM, bridge_url_de, 'MediaSettled', 'structurae')
 
             if language == "English":
                 replaced_bridge_info['Image Count'] = image_count
@@ -440,13 +591,21 @@ def download_images_by_bridge_type(driver, bridge_type, num_bridges, base_url, k
             else:
                 replaced_bridge_info['eindeutiger Name'] = get_unique_bridge_name_from_url(bridge_url_de)
 
-            asyncio.run(process_all_templates(replaced_bridge_info))
-            asyncio.run(append_bridge_info_to_summary(replaced_bridge_info, summary_csv_path))
+            with progress.stage('metadata'), stage('write'):
+                asyncio.run(process_all_templates(replaced_bridge_info))
+                asyncio.run(append_bridge_info_to_summary(replaced_bridge_info, summary_csv_path))
+            progress.item_done()
+            if media_outcome != SETTLED:
+                record_success(ITEM, bridge_url_de)
 
-        except RequestException as e:
+        except NETWORK_ERRORS as e:
             logging.error(f"Network error while processing bridge: {e}")
+            progress.item_done('failed')
+            record_failure(ITEM, bridge_url_de, e, 'structurae')
         except Exception as e:
             logging.error(f"An error occurred while processing bridge: {e}")
+            progress.item_done('failed')
+            record_failure(ITEM, bridge_url_de, e, 'structurae')
 
         time.sleep(time_lag)
 
@@ -456,524 +615,96 @@ def download_images_by_bridge_type(driver, bridge_type, num_bridges, base_url, k
 
     if len(more_address_bridges) > 0:
         logging.info(f"More address bridges: {more_address_bridges}")
-        print(f"More address bridges: {more_address_bridges}")
+        progress.note(f"More address bridges: {more_address_bridges}")
 
     logging.info("All bridges processed!")
-    print("All bridges processed!")
-
-
-def get_image_data(soup):
-    """
-        Extracts image data from the BeautifulSoup object of a bridge's media page.
-        Args:
-            soup: BeautifulSoup object of the bridge's media page.
-        Returns:
-            A list of image URLs.
-        """
-    image_entries = soup.find_all('div', class_='jg-entry')
-
-    image_data = []
-    for entry in image_entries:
-        link = entry.find('a', class_='imageThumbLink_2')
-        if link:
-            href = link['href']
-            image_data.append(href)
-
-    return image_data
-
-
-def get_download_link(soup):
-    """
-        Extracts the download link for an image from its BeautifulSoup object.
-        Args:
-            soup: BeautifulSoup object of the image page.
-        Returns:
-            The download link for the image.
-        """
-    img_tag = soup.find('img', {'class': 'flexible bordered mediaObject'})
-    if img_tag:
-        return img_tag['src']
-
-    return None
-
-
-def get_en_link(soup):
-    """
-        Extracts the English version link of a bridge page from its BeautifulSoup object.
-        Args:
-            soup: BeautifulSoup object of the bridge's page.
-        Returns:
-            The URL of the English version of the page.
-        """
-    li_tag = soup.select_one('li.short-language:not(.language-active-li)')
-    if li_tag:
-        a_tag = li_tag.find('a')
-        if a_tag:
-            return a_tag['href']
-
-    return None
+    progress.note("All bridges processed!")
 
 
 def download_images(image_data, bridge_folder):
     """
-        Downloads images from the provided list of image URLs into the specified folder.
+        Downloads images from the provided list of image URLs into the specified folder, within the time budget of
+        one bridge.
         Args:
             image_data: List of image URLs.
             bridge_folder: Folder path where images will be saved.
         """
-    high_res_image_links = []
-    for high_res_image_url in image_data:
-        response = requests.get(base_URL + high_res_image_url)
-        new_soup = BeautifulSoup(response.content, 'html.parser')
-        download_link = get_download_link(new_soup)
-        if download_link:
-            high_res_image_links.append(download_link)
-
-    if multithreading == "True":
-        download_images_multithreaded(high_res_image_links, bridge_folder)
-    else:
-        for idx, image_link in enumerate(high_res_image_links):
-            save_path = os.path.join(bridge_folder, f"image_{idx}.jpg")
-            download_image(image_link, save_path)
-
-
-def download_image(url, save_path):
-    """
-        Downloads a single image from the given URL and saves it to the specified path.
-        Args:
-            url: URL of the image to download.
-            save_path: Path where the image will be saved.
-        """
-    if os.path.exists(save_path):
-        logging.error(f"File already exists, skip download: {save_path}")
-        return
+    with log_fields(site='structurae', bridge=os.path.basename(bridge_folder)):
+        budget = Deadline(bridge_time_budget or None)
+        high_res_image_links = []
+        for high_res_image_url in image_data:
+            if budget.expired():
+                logging.warning(f"Time budget of {bridge_folder} spent after {len(high_res_image_links)} of "
+                                f"{len(image_data)} image pages")
+                break
+            try:
+                with stage('resolve'):
+                    new_soup = fetch_soup(base_URL + high_res_image_url, user_agent)
+                    download_link = get_download_link(new_soup)
+            except Exception as e:
+                logging.error(f"Error resolving media page {high_res_image_url}: {e}")
+                record_failure(RESOLVE, base_URL + high_res_image_url, e, folder=bridge_folder, base_url=base_URL,
+                               user_agent=user_agent)
+                continue
+            if download_link:
+                high_res_image_links.append(download_link)
 
-    try:
-        req = urllib.request.Request(url, headers={'User-Agent': user_agent})
-        with urllib.request.urlopen(req, timeout=download_timeout) as response, open(save_path, 'wb') as out_file:
-            data = response.read()
-            out_file.write(data)
-            logging.info(f"Downloaded {url} to {save_path}")
-    except urllib.error.URLError as e:
-        logging.error(f"Failed to download image: {url} -> {save_path}, reason: {e}")
-    except Exception as e:
-        logging.error(f"Error downloading image: {url} -> {save_path}, reason: {e}")
+        if multithreading == "True":
+            download_images_multithreaded(high_res_image_links, bridge_folder, budget)
+        else:
+            for idx, image_link in enumerate(high_res_image_links):
+                save_path = image_path(bridge_folder, idx)
+                download_image(image_link, save_path, user_agent, download_timeout, budget)
 
 
-def download_images_multithreaded(image_links, bridge_folder):
+def download_images_multithreaded(image_links, bridge_folder, budget):
     """
         Downloads multiple images in parallel using multithreading.
+        When the budget runs out, queued downloads are cancelled and running ones stop at their next chunk; the
+        function returns once every download has finished or stopped, so no thread outlives the bridge.
         Args:
             image_links: List of image URLs to download.
             bridge_folder: Folder path where images will be saved.
+            budget: Deadline of the bridge.
         """
-    global total_workers
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=total_workers) as executor:
-        futures = []
-        for idx, image_link in enumerate(image_links):
-            save_path = os.path.join(bridge_folder, f"image_{idx}.jpg")
-            futures.append(executor.submit(download_image, image_link, save_path))
-
-        for future in concurrent.futures.as_completed(futures, timeout=threat_timeout):
-            try:
-                future.result()
-            except concurrent.futures.TimeoutError:
-                logging.error("A download thread has timed out and been skipped.")
-
-
-def format_text(text):
-    """
-       Formats the given text by replacing special characters and converting to lowercase.
-       Args:
-           text: The text to format.
-       Returns:
-           Formatted text as a string.
-       """
-    name = text.replace("ä", "ae").replace("ö", "oe").replace("ü", "ue").replace("ß", "ss").replace("Ä", "AE").replace(
-        "Ö", "Oe").replace("Ü", "Ue")
-    name = name.replace(" ", "-").lower()
-    return name
-
-
-def extract_table_data(table):
-    """
-        Extracts data from a table element in the BeautifulSoup object.
-        Args:
-            table: Table element from BeautifulSoup object.
-        Returns:
-            Dictionary of extracted data with headers as keys and corresponding values.
-        """
-    data = {}
-    rows = table.find_all('tr')
-    for row in rows:
-        header = row.find('th')
-        value = row.find('td')
-        if header and value:
-            data[header.text.strip()] = value.text.strip()
-    return data
-
-
-def extract_technical_data(technical_div, bridge_info):
-    """
-        Extracts technical data about a bridge from its BeautifulSoup object.
-        Args:
-            technical_div: Div element containing technical data from BeautifulSoup object.
-            bridge_info: Dictionary to store extracted data.
-        """
-    tab_bodies = technical_div.find_all('div', class_='tabbody')
-
-    for tab_body in tab_bodies:
-        table = tab_body.find('table')
-        if table:
-            rows = table.find_all('tr')
-            current_header = ""
-
-            for row in rows:
-                cells = row.find_all(['th', 'td'])
-
-                if len(cells) == 3:
-                    current_header = cells[0].text.strip()
-                    key = cells[1].text.strip()
-                    value = cells[2].text.strip()
-                    full_key = f"{current_header} {key}" if current_header else key
-                elif len(cells) == 2:
-                    if 'rowspan' in cells[0].attrs:
-                        current_header = cells[0].text.strip()
-                        key = cells[1].text.strip()
-                        full_key = current_header
-                    else:
-                        key = cells[0].text.strip()
-                        value = cells[1].text.strip()
-                        full_key = f"{current_header} {key}" if current_header else key
-                elif len(cells) == 1:
-                    value = cells[0].text.strip()
-                    full_key = current_header
-
-                bridge_info[full_key] = value
-
-
-def get_bridge_info(soup):
-    """
-        Extracts comprehensive information about a bridge from its BeautifulSoup object.
-        Args:
-            soup: BeautifulSoup object of the bridge's page.
-        Returns:
-            Dictionary containing various details about the bridge.
-        """
-    bridge_info = {}
-
-    table_ids = ['general', 'typology', 'geographic']
-    for table_id in table_ids:
-        table = soup.find('div', {'class': 'js-acordion-body', 'id': table_id}).find('table',
-                                                                                     {'class': 'aligned-tables'})
-        bridge_info.update(extract_table_data(table))
-
-    technical_info_div = soup.find('div', {'class': 'js-acordion-body', 'id': 'technical'})
-    if technical_info_div:
-        extract_technical_data(technical_info_div, bridge_info)
-    else:
-        logging.error("Technical information is not available.")
-
-    bridge_name_tag = soup.find("h1", {"itemprop": "name"})
-    if language == "English":
-        bridge_info["Bridge Name"] = bridge_name_tag.get_text(strip=True) if bridge_name_tag else "Unknown_bridge"
-    else:
-        bridge_info["Brücke Name"] = bridge_name_tag.get_text(strip=True) if bridge_name_tag else "Unbekannte_Brücke"
-
-    return bridge_info
-
-
-def deal_with_value(bridge_info, key_mapping):
-    """
-        Data cleansing for specific parts of the source data.
-        Args:
-            bridge_info: The original dictionary with keys to be cleaned.
-            key_mapping: Dictionary mapping old keys to new keys.
-        Returns:
-            New dictionary with cleaned data as per the mapping.
-        """
-    more_address = False
-
-    cleaned_bridge_info = {clean_value(key): clean_value(value) for key, value in bridge_info.items()}
-    replaced_bridge_info = replace_keys_in_dict(cleaned_bridge_info, key_mapping)
-
-    if "Baubeginn" in replaced_bridge_info:
-        construction_start = replaced_bridge_info["Baubeginn"]
-        year_start, month_start, day_start = parse_date(construction_start)
-        if year_start is not None:
-            replaced_bridge_info['Jahr_beginn'] = year_start
-        if month_start is not None:
-            replaced_bridge_info['Monat_beginn'] = month_start
-        if day_start is not None:
-            replaced_bridge_info['Tag_beginn'] = day_start
-
-    if "Fertigstellung" in replaced_bridge_info:
-        completion = replaced_bridge_info["Fertigstellung"]
-        year_end, month_end, day_end = parse_date(completion)
-        if year_end is not None:
-            replaced_bridge_info['Jahr_fertig'] = year_end
-        if month_end is not None:
-            replaced_bridge_info['Monat_fertig'] = month_end
-        if day_end is not None:
-            replaced_bridge_info['Tag_fertig'] = day_end
-
-    if "Lage" in replaced_bridge_info:
-        lage = replaced_bridge_info["Lage"]
-
-        city, region3, region2, region1, country, more_address = parse_location(lage)
-        replaced_bridge_info['Stadt'] = city
-        replaced_bridge_info['Region3'] = region3
-        replaced_bridge_info['Region2'] = region2
-        replaced_bridge_info['Region1'] = region1
-        replaced_bridge_info['Land'] = country
-
-    return replaced_bridge_info, more_address
-
-
-def replace_keys_in_dict(original_dict, key_mapping):
-    """
-        Replaces keys in a dictionary based on a provided mapping.
-        Args:
-            original_dict: The original dictionary with keys to be replaced.
-            key_mapping: Dictionary mapping old keys to new keys.
-        Returns:
-            New dictionary with keys replaced as per the mapping.
-        """
-    new_dict = {}
-    for key, value in original_dict.items():
-        new_key = key_mapping.get(key, key)
-        new_dict[new_key] = value
-    return new_dict
-
-
-def clean_value(value):
-    """
-        Cleans a given value by removing unwanted characters and whitespace.
-        Args:
-            value: The value to be cleaned.
-        Returns:
-            Cleaned value as a string.
-        """
-    if isinstance(value, str):
-        return value.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ').replace(':', '').replace('Ä', 'Ae') \
-            .replace('Ö', 'Oe').replace('Ü', 'Ue').replace('ä', 'ae').replace('ü', 'ue').replace('ö', 'oe').replace('ß',
-                                                                                                                    'ss').strip()
-    return value
-
-
-def parse_date(date):
-    """
-        Data cleansing and segmentation for date segments.
-        Args:
-            date: The value to be cleaned.
-        Returns:
-            Cleaned value as strings.
-        """
-    parts = re.split(r'\.|\s', date)
-    parts = [part for part in parts if part.strip()]
-    parts = parts[::-1]
-    year = parts[0] if len(parts) > 0 else None
-    month = parts[1] if len(parts) > 1 else None
-    day = parts[2] if len(parts) > 2 else None
-    if year == "Jahrhundert":
-        year = date
-        month = None
-        day = None
-
-    return year, month, day
-
-
-def parse_location(location):
-    """
-    Data cleansing and segmentation for location segments.
-    Args:
-        location: The value to be cleaned.
-    Returns:
-        Cleaned value as strings.
-        """
-
-    city = ""
-    region3 = ""
-    region2 = ""
-    region1 = ""
-    country = ""
-    more_address = False
-
-    parts = location.split(', ')
-    if parts:
-        if len(parts) > 5:
-            more_address = True
-        if len(parts) == 5:
-            city = parts[0]
-            region3 = parts[1]
-            region2 = parts[2]
-            region1 = parts[3]
-            country = parts[4]
-        if len(parts) == 4:
-            city = parts[0]
-            region3 = parts[1]
-            region2 = parts[2]
-            country = parts[3]
-        elif len(parts) == 3:
-            city = parts[0]
-            region3 = parts[1]
-            country = parts[2]
-        else:
-            city = parts[0]
-            country = parts[1]
-
-    return city, region3, region2, region1, country, more_address
-
+    futures = []
+    for idx, image_link in enumerate(image_links):
+        save_path = image_path(bridge_folder, idx)
+        futures.append(scheduler.submit_download(download_image, image_link, save_path, user_agent, download_timeout,
+                                                 budget))
 
-def get_existing_columns(file_path):
-    """
-        Retrieves existing column headers from a CSV file.
-        Args:
-            file_path: Path to the CSV file.
-        Returns:
-            A list of existing column headers, excluding 'Bridge Number' and 'Brückennummer'.
-        """
-    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
-        return []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f, delimiter=';')
-        headers = next(reader, None)
-        if headers:
-            # Filter out specific headers
-            headers = [header for header in headers if header not in ['Bridge Number', 'Brückennummer']]
-        return headers if headers else []
+    try:
+        for future in concurrent.futures.as_completed(futures, timeout=budget.remaining()):
+            future.result()
+    except concurrent.futures.TimeoutError:
+        budget.cancel()
+        cancelled = sum(1 for future in futures if future.cancel())
+        logging.error(f"Time budget of {bridge_folder} spent, {cancelled} queued downloads cancelled")
+        concurrent.futures.wait(futures)
 
 
 async def append_bridge_info_to_summary(bridge_info, file_path):
     """
-        Asynchronously appends bridge information to a summary CSV file.
+        Asynchronously appends bridge information to a summary CSV file and stores its location in the spatial index.
         Args:
             bridge_info: Dictionary containing bridge information.
             file_path: Path to the summary CSV file.
         """
-    # Create the folder for the file if it doesn't exist
-    folder_path = os.path.dirname(file_path)
-    create_folder(folder_path)
-
-    # Get existing columns and determine all columns to be included
-    existing_columns = get_existing_columns(file_path)
-    if language == "English":
-        all_columns = ['Bridge Number'] + list(existing_columns) + [col for col in bridge_info.keys() if
-                                                                    col not in existing_columns]
-    else:
-        all_columns = ['Brückennummer'] + list(existing_columns) + [col for col in bridge_info.keys() if
-                                                                    col not in existing_columns]
-
-    # Calculate the bridge number
-    bridge_number = sum(1 for row in open(file_path, 'r', encoding='utf-8')) if os.path.exists(file_path) else 1
-
-    # Write headers if the file is new or update the file if new columns are added
-    if not existing_columns:
-        async with aiofiles.open(file_path, 'w', newline='', encoding='utf-8') as f:
-            await f.write(';'.join(all_columns) + '\n')
-
-    elif len(all_columns) > len(existing_columns) + 1:
-        temp_data = []
-        async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader((await f.read()).splitlines(), delimiter=';')
-            next(reader, None)
-            for row in reader:
-                while len(row) < len(existing_columns) + 1:
-                    row.append("N/A")
-                temp_data.append(row)
-
-        async with aiofiles.open(file_path, 'w', newline='', encoding='utf-8') as f:
-            await f.write(';'.join(all_columns) + '\n')
-            for row in temp_data:
-                row.extend("N/A" for _ in range(len(all_columns) - len(row)))
-                await f.write(';'.join(row) + '\n')
-
-    # Clean the bridge information and prepare the data for writing
-    cleaned_bridge_info = {key: clean_value(value) for key, value in bridge_info.items()}
-    bridge_data = [bridge_number] + [cleaned_bridge_info.get(column, "N/A") for column in all_columns[1:]]
-
-    # Append the bridge data to the file
-    async with aiofiles.open(file_path, 'a', newline='', encoding='utf-8') as f:
-        await f.write(';'.join(map(str, bridge_data)) + '\n')
-
-
-def get_template_columns(file_path):
-    """
-        Retrieves column headers from a CSV template file.
-        Args:
-            file_path: Path to the CSV template file.
-        Returns:
-            A list of column headers from the CSV file.
-        """
-    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
-        return []
-    with open(file_path, 'r', encoding='utf-8-sig') as f:
-        reader = csv.reader(f, delimiter=';')
-        headers = next(reader, None)
-        if headers:
-            headers = [header for header in headers if header != 'bridge_id' and header != 'Brücke_id']
-        return headers if headers else []
-
-
-async def append_bridge_info_to_csv(bridge_info, template_path, output_path):
-    """
-        Asynchronously appends bridge information to a CSV file based on a template.
-        Args:
-            bridge_info: Dictionary containing bridge information.
-            template_path: Path to the CSV template file.
-            output_path: Path to the output CSV file where data will be appended.
-        """
-    folder_path = os.path.dirname(output_path)
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
-
-    template_columns = [col.lower() for col in get_template_columns(template_path)]
-
-    bridge_info_lower = {key.lower(): value for key, value in bridge_info.items()}
-    bridge_number = await get_next_bridge_number(output_path)
+    number_column = 'Bridge Number' if language == "English" else 'Brückennummer'
+    await append_to_summary(bridge_info, file_path, number_column, clean_value)
+    if spatial_index is not None:
+        key_column = 'Unique Name' if language == "English" else 'eindeutiger Name'
+        spatial_index.add_bridge('structurae', bridge_info.get(key_column), bridge_info)
 
-    bridge_data = [bridge_number] + [bridge_info_lower.get(column, "N/A") for column in template_columns]
 
-    async with aiofiles.open(output_path, 'a', encoding='utf-8') as f:
-        await f.write('\n' + ';'.join(map(str, bridge_data)))
-
-
-async def get_next_bridge_number(output_path):
-    """
-        Asynchronously retrieves the next bridge number to be used in the output CSV file.
-        Args:
-            output_path: Path to the output CSV file.
-        Returns:
-            The next bridge number as an integer.
-        """
-    bridge_number = 0
-    if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-        async with aiofiles.open(output_path, 'r', encoding='utf-8') as f:
-            last_line = await get_last_line(f)
-            if last_line:
-                last_number = last_line.split(';')[0]
-                if last_number.isdigit():
-                    bridge_number = int(last_number)
-    bridge_number += 1
-    return bridge_number
-
-
-async def get_last_line(f):
+def get_template_folder():
     """
-        Asynchronously reads the last line of a file.
-        Args:
-            f: File object opened for reading.
-        Returns:
-            The last line of the file as a string.
+        Returns the template folder of the configured language.
         """
-    last_line = ''
-    while True:
-        line = await f.readline()
-        if not line:
-            break
-        last_line = line
-    return last_line.strip()
+    if language == "English":
+        return template_folder_en
+    else:
+        return template_folder_de
 
 
 async def process_all_templates(bridge_info):
@@ -982,34 +713,14 @@ async def process_all_templates(bridge_info):
         Args:
             bridge_info: Dictionary containing bridge information.
         """
-    if language == "English":
-        template_folder = template_folder_en
-    else:
-        template_folder = template_folder_de
-
-    template_files = [f for f in os.listdir(template_folder) if f.endswith('.csv')]
-
-    for template_file in template_files:
-        template_path = os.path.join(template_folder, template_file)
-        output_path = os.path.join(output_folder, template_file)
-        await append_bridge_info_to_csv(bridge_info, template_path, output_path)
+    await structurae.process_all_templates(bridge_info, get_template_folder(), output_folder)
 
 
 def copy_all_templates():
     """
         Copies all CSV template files from the template folder to the output folder.
         """
-    if language == "English":
-        template_folder = template_folder_en
-    else:
-        template_folder = template_folder_de
-
-    template_files = [f for f in os.listdir(template_folder) if f.endswith('.csv')]
-
-    for template_file in template_files:
-        template_path = os.path.join(template_folder, template_file)
-        output_path = os.path.join(output_folder, template_file)
-        shutil.copyfile(template_path, output_path)
+    structurae.copy_all_templates(get_template_folder(), output_folder)
 
 
 def log_runtime(func):
@@ -1031,6 +742,15 @@ def log_runtime(func):
     return wrapper
 
 
+@contextmanager
+def tracked_run():
+    """
+        Context manager around one crawl: shows its progress and, if profile_dir is set, profiles its stages.
+        """
+    with profile(profile_dir), show_progress(dashboard, status_file, status_port):
+        yield
+
+
 @log_runtime
 def main():
     """
@@ -1038,19 +758,23 @@ def main():
         """
     base_url_suffix = '/de'
     base_url = base_URL + base_url_suffix
-    if language == "English":
-        key_mapping = {"Structure": "Structure type", "Material": "Bridge type"}
+    key_mapping = KEY_MAPPINGS[language]
+
+    if args.login is not None:
+        login_choice = 'y' if args.login else 'n'
+    elif args.country is not None:
+        # The country filter of the listings needs a login; a synced sitemap filters known countries without one.
+        login_choice = 'n' if sitemap_synced() and args.country.strip().upper() in LOCATION_COUNTRIES else 'y'
     else:
-        key_mapping = {"Baustoff": "Brücke typ"}
+        login_choice = ask(None, "Would you like to log in? (y/n): ", interactive).lower()
+    if login_choice == 'y' and not interactive:
+        raise SystemExit("Logging in is done by hand in the browser and needs the interactive mode")
 
     driver = None
     try:
-        options = webdriver.ChromeOptions()
-        options.add_experimental_option('excludeSwitches', ['enable-logging'])
-        driver = webdriver.Chrome(
-            service=Service(executable_path=chrome_driver_path),
-            options=options
-        )
+        # Logging in happens by hand, so the browser needs a window in that case.
+        driver = create_driver(chrome_driver_path, (window_size_width, window_size_height), light=browser_light,
+                               headless=browser_headless and login_choice != 'y', cache_dir=browser_cache_dir)
     except Exception as e:
         print(f"Error initializing the WebDriver: {e}")
         logging.error(f"Error initializing the WebDriver: {e}")
@@ -1061,11 +785,10 @@ def main():
     if not os.listdir(output_folder):
         copy_all_templates()
 
-    login_choice = input("Would you like to log in? (y/n): ").lower()
-
     if login_choice == 'y':
-        driver.set_window_size(window_size_width, window_size_height)
         driver.get(base_url)
+        from selenium.webdriver.common.by import By
+
         try:
             login_button = driver.find_element(By.ID, "myStructuraeLoginBtn")
             if login_button:
@@ -1078,30 +801,36 @@ def main():
 
     try:
         if chosen_type == 'name':
-            with open("bridges.txt", "r", encoding="utf-8") as file:
+            with open(args.bridges_file, "r", encoding="utf-8") as file:
                 bridge_names = [line.strip() for line in file]
-            download_images_by_bridge_name(driver, bridge_names, base_url, key_mapping)
+            with tracked_run():
+                download_images_by_bridge_name(driver, bridge_names, base_url, key_mapping)
         elif chosen_type == 'type':
             bridge_type = choose_bridge_type()
             try:
-                num_bridges = int(input("How many bridges do you want to download? "))
+                num_bridges = int(ask(args.count, "How many bridges do you want to download? ", interactive))
             except ValueError:
                 print("Invalid number. Exiting.")
                 logging.error("Invalid number. Exiting.")
                 return
 
-            if login_choice == 'y':
+            if args.country is not None:
+                country_mode = "y"
+            elif login_choice == 'y' or (interactive and sitemap_synced()):
                 country_mode = input("Do you want to search by country?(y/n): ").lower()
             else:
                 country_mode = "n"
 
             if country_mode == "y":
-                list_supported_countries()
-                country_code = input(
-                    "Please enter the country code: ").strip().upper()
-                download_images_by_bridge_type(driver, bridge_type, num_bridges, base_url, key_mapping, country_code)
+                if args.country is None:
+                    list_supported_countries()
+                country_code = ask(args.country, "Please enter the country code: ", interactive).strip().upper()
+                with tracked_run():
+                    download_images_by_bridge_type(driver, bridge_type, num_bridges, base_url, key_mapping,
+                                                   country_code)
             else:
-                download_images_by_bridge_type(driver, bridge_type, num_bridges, base_url, key_mapping)
+                with tracked_run():
+                    download_images_by_bridge_type(driver, bridge_type, num_bridges, base_url, key_mapping)
         else:
             print("Invalid mode selected. Exiting.")
             logging.error("Invalid mode selected. Exiting.")
@@ -1115,6 +844,7 @@ def main():
     finally:
         if driver:
             driver.quit()
+        wait_stats.save()
 
 
 if __name__ == "__main__":
@@ -1124,4 +854,7 @@ if __name__ == "__main__":
     again = "y"
     while again == "y":
         main()
+        # Choices given on the command line describe a single run.
+        if not interactive or args.mode is not None:
+            break
         again = input("Do you want to do it again?(y/n)")